@@ -25,9 +25,24 @@
 
 #include "exiv2wrapper.hpp"
 
+#include "exiv2/version.hpp"
+
 #include "boost/python/stl_iterator.hpp"
 
-#include <fstream>
+#include <algorithm>
+#include <cerrno>
+#include <cstdio>
+#include <cstring>
+#include <map>
+#include <vector>
+
+#include <unistd.h>
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <pthread.h>
+#endif
 
 // Custom error codes for Exiv2 exceptions
 #define METADATA_NOT_READ 101
@@ -42,9 +57,193 @@
 #define CHECK_METADATA_READ \
     if (!_dataRead) throw Exiv2::Error(METADATA_NOT_READ);
 
+// Portable locks. Older versions of Windows have no reader-writer locks, an
+// exclusive lock is used instead.
+#ifdef _WIN32
+typedef CRITICAL_SECTION Mutex;
+typedef CRITICAL_SECTION RWLock;
+#define INIT_MUTEX(mutex) InitializeCriticalSection(&mutex)
+#define LOCK_MUTEX(mutex) EnterCriticalSection(&mutex)
+#define UNLOCK_MUTEX(mutex) LeaveCriticalSection(&mutex)
+#define INIT_RWLOCK(lock) InitializeCriticalSection(&lock)
+#define READ_LOCK(lock) EnterCriticalSection(&lock)
+#define WRITE_LOCK(lock) EnterCriticalSection(&lock)
+#define UNLOCK_RWLOCK(lock) LeaveCriticalSection(&lock)
+#else
+typedef pthread_mutex_t Mutex;
+typedef pthread_rwlock_t RWLock;
+#define INIT_MUTEX(mutex) pthread_mutex_init(&mutex, 0)
+#define LOCK_MUTEX(mutex) pthread_mutex_lock(&mutex)
+#define UNLOCK_MUTEX(mutex) pthread_mutex_unlock(&mutex)
+#define INIT_RWLOCK(lock) pthread_rwlock_init(&lock, 0)
+#define READ_LOCK(lock) pthread_rwlock_rdlock(&lock)
+#define WRITE_LOCK(lock) pthread_rwlock_wrlock(&lock)
+#define UNLOCK_RWLOCK(lock) pthread_rwlock_unlock(&lock)
+#endif
+
 namespace exiv2wrapper
 {
 
+// Return a python string holding a copy of a binary data buffer.
+static boost::python::object copyToString(const Exiv2::byte* data, long size)
+{
+    return boost::python::object(boost::python::handle<>(
+        PyString_FromStringAndSize((const char*) data, size)));
+}
+
+// Write a binary data buffer to a file descriptor (an int or a long), a python
+// file object, or any python object with a write() method. The GIL is released
+// while writing to a file descriptor or a python file object.
+static void writeData(const Exiv2::byte* data, long size,
+                      boost::python::object file)
+{
+    PyObject* object = file.ptr();
+    if (PyInt_Check(object) || PyLong_Check(object))
+    {
+        const long fd = PyInt_AsLong(object);
+        if (fd == -1 && PyErr_Occurred())
+        {
+            // A long that does not fit
+            boost::python::throw_error_already_set();
+        }
+        long written = 0;
+        int error = 0;
+        Py_BEGIN_ALLOW_THREADS
+        while (written < size)
+        {
+            ssize_t result = ::write(fd, data + written, size - written);
+            if (result < 0)
+            {
+                if (errno == EINTR)
+                {
+                    continue;
+                }
+                error = errno;
+                break;
+            }
+            written += result;
+        }
+        Py_END_ALLOW_THREADS
+        if (error != 0)
+        {
+            errno = error;
+            PyErr_SetFromErrno(PyExc_OSError);
+            boost::python::throw_error_already_set();
+        }
+    }
+    else if (PyFile_Check(object))
+    {
+        FILE* fd = PyFile_AsFile(object);
+        if (fd == 0)
+        {
+            PyErr_SetString(PyExc_ValueError, "I/O operation on closed file");
+            boost::python::throw_error_already_set();
+        }
+        size_t written;
+        // Prevent the file from being closed while the GIL is released.
+        PyFile_IncUseCount((PyFileObject*) object);
+        Py_BEGIN_ALLOW_THREADS
+        written = fwrite(data, 1, size, fd);
+        Py_END_ALLOW_THREADS
+        PyFile_DecUseCount((PyFileObject*) object);
+        if (written != (size_t) size)
+        {
+            PyErr_SetFromErrno(PyExc_IOError);
+            clearerr(fd);
+            boost::python::throw_error_already_set();
+        }
+    }
+    else
+    {
+        file.attr("write")(copyToString(data, size));
+    }
+}
+
+KeyFilter::KeyFilter(const boost::python::object& keys)
+{
+    _all = keys.is_none();
+    if (_all)
+    {
+        return;
+    }
+    boost::python::stl_input_iterator<std::string> end;
+    for (boost::python::stl_input_iterator<std::string> i(keys); i != end; ++i)
+    {
+        const std::string& key = *i;
+        if (!key.empty() && (key[key.size() - 1] == '*'))
+        {
+            _prefixes.push_back(key.substr(0, key.size() - 1));
+        }
+        else
+        {
+            _keys.insert(key);
+        }
+    }
+}
+
+bool KeyFilter::matches(const std::string& key) const
+{
+    if (_all || (_keys.find(key) != _keys.end()))
+    {
+        return true;
+    }
+    for (std::vector<std::string>::const_iterator prefix = _prefixes.begin();
+         prefix != _prefixes.end();
+         ++prefix)
+    {
+        if (key.compare(0, prefix->size(), *prefix) == 0)
+        {
+            return true;
+        }
+    }
+    return false;
+}
+
+// The XMP namespace registry (Exiv2::XmpProperties) is shared by the whole
+// process. It is read when parsing and serializing XMP packets, which is done
+// without holding the GIL, and modified when registering or unregistering
+// custom namespaces. A reader-writer lock protects it from concurrent
+// modifications. Instantiating XMP tags also reads the registry, but that is
+// done with the GIL held, which already serializes it with the modifications.
+// To avoid deadlocks, the lock is never waited for with the GIL held.
+// It is initialized by initializeThreadSafety().
+static RWLock xmpNsLock;
+
+// Lock the XMP namespace registry for reading.
+// Only to be instantiated with the GIL released.
+class XmpNsReadLock
+{
+public:
+    XmpNsReadLock()
+    {
+        READ_LOCK(xmpNsLock);
+    }
+
+    ~XmpNsReadLock()
+    {
+        UNLOCK_RWLOCK(xmpNsLock);
+    }
+};
+
+// Lock the XMP namespace registry for writing.
+// Only to be instantiated with the GIL held, it is released while waiting for
+// the readers to complete.
+class XmpNsWriteLock
+{
+public:
+    XmpNsWriteLock()
+    {
+        Py_BEGIN_ALLOW_THREADS
+        WRITE_LOCK(xmpNsLock);
+        Py_END_ALLOW_THREADS
+    }
+
+    ~XmpNsWriteLock()
+    {
+        UNLOCK_RWLOCK(xmpNsLock);
+    }
+};
+
 void Image::_instantiate_image()
 {
     _exifThumbnail = 0;
@@ -59,9 +258,9 @@ void Image::_instantiate_image()
 
     try
     {
-        if (_data != 0)
+        if (_buffer != 0)
         {
-            _image = Exiv2::ImageFactory::open(_data, _size);
+            _image = Exiv2::ImageFactory::open(_buffer, _size);
         }
         else
         {
@@ -80,6 +279,7 @@ void Image::_instantiate_image()
     {
         assert(_image.get() != 0);
         _dataRead = false;
+        _invalidateIndexes();
     }
     else
     {
@@ -91,18 +291,65 @@ void Image::_instantiate_image()
 Image::Image(const std::string& filename)
 {
     _filename = filename;
+    _buffer = 0;
     _data = 0;
+    _holdsView = false;
     _instantiate_image();
 }
 
 // From buffer constructor
-Image::Image(const std::string& buffer, unsigned long size)
+Image::Image(boost::python::object buffer, unsigned long size)
 {
-    // Deep copy of the data buffer
-    _data = new Exiv2::byte[size];
-    for (unsigned long i = 0; i < size; ++i)
+    _buffer = 0;
+    _data = 0;
+    _holdsView = false;
+
+    PyObject* object = buffer.ptr();
+    if (PyObject_CheckBuffer(object))
+    {
+        // New-style buffer interface (str, bytearray, memoryview, …)
+        if (PyObject_GetBuffer(object, &_view, PyBUF_SIMPLE) == -1)
+        {
+            boost::python::throw_error_already_set();
+        }
+        if (size > (unsigned long) _view.len)
+        {
+            size = _view.len;
+        }
+        if (_view.readonly)
+        {
+            // The memory cannot be modified nor released as long as the view
+            // is held, it is safe to use it in place.
+            _holdsView = true;
+            _buffer = (const Exiv2::byte*) _view.buf;
+        }
+        else
+        {
+            // The contents of a mutable buffer may change under our feet,
+            // it has to be copied.
+            _data = new Exiv2::byte[size];
+            std::memcpy(_data, _view.buf, size);
+            _buffer = _data;
+            PyBuffer_Release(&_view);
+        }
+    }
+    else
     {
-        _data[i] = buffer[i];
+        // Old-style buffer interface (mmap, buffer, array, …). There is no
+        // guarantee on the lifetime of the memory, it has to be copied.
+        const void* data = 0;
+        Py_ssize_t length = 0;
+        if (PyObject_AsReadBuffer(object, &data, &length) == -1)
+        {
+            boost::python::throw_error_already_set();
+        }
+        if (size > (unsigned long) length)
+        {
+            size = length;
+        }
+        _data = new Exiv2::byte[size];
+        std::memcpy(_data, data, size);
+        _buffer = _data;
     }
 
     _size = size;
@@ -113,6 +360,9 @@ Image::Image(const std::string& buffer, unsigned long size)
 Image::Image(const Image& image)
 {
     _filename = image._filename;
+    _buffer = 0;
+    _data = 0;
+    _holdsView = false;
     _instantiate_image();
 }
 
@@ -122,6 +372,10 @@ Image::~Image()
     {
         delete[] _data;
     }
+    if (_holdsView)
+    {
+        PyBuffer_Release(&_view);
+    }
     if (_exifThumbnail != 0)
     {
         delete _exifThumbnail;
@@ -140,6 +394,7 @@ void Image::readMetadata()
 
     try
     {
+        XmpNsReadLock lock;
         _image->readMetadata();
         _exifData = &_image->exifData();
         _iptcData = &_image->iptcData();
@@ -158,12 +413,224 @@ void Image::readMetadata()
     {
         throw error;
     }
+
+    _invalidateIndexes();
+}
+
+void Image::_invalidateIndexes()
+{
+    _exifIndexed = false;
+    _iptcIndexed = false;
+    _xmpIndexed = false;
+}
+
+Exiv2::ExifMetadata::iterator Image::_findExifDatum(const std::string& key)
+{
+    if (!_exifIndexed)
+    {
+        _exifIndex.clear();
+        _exifDuplicates = false;
+        for (Exiv2::ExifMetadata::iterator i = _exifData->begin();
+             i != _exifData->end();
+             ++i)
+        {
+            if (!_exifIndex.insert(std::make_pair(i->key(), i)).second)
+            {
+                _exifDuplicates = true;
+            }
+        }
+        _exifIndexed = true;
+    }
+    ExifIndex::const_iterator entry = _exifIndex.find(key);
+    if (entry == _exifIndex.end())
+    {
+        return _exifData->end();
+    }
+    return entry->second;
+}
+
+// Build an index of the positions of the datums of a vector by key.
+// Return whether several datums have the same key.
+template <typename Iterator>
+static bool indexPositions(Iterator begin, Iterator end,
+                           boost::unordered_map<std::string, long>& index)
+{
+    index.clear();
+    bool duplicates = false;
+    long position = 0;
+    for (Iterator i = begin; i != end; ++i, ++position)
+    {
+        // The first datum of each key is kept.
+        if (!index.insert(std::make_pair(i->key(), position)).second)
+        {
+            duplicates = true;
+        }
+    }
+    return duplicates;
+}
+
+// Update an index of positions after the datum at the given position was
+// erased: the positions of the following datums are shifted by one.
+static void shiftPositions(boost::unordered_map<std::string, long>& index,
+                           long erased)
+{
+    for (boost::unordered_map<std::string, long>::iterator i = index.begin();
+         i != index.end();
+         ++i)
+    {
+        if (i->second > erased)
+        {
+            --(i->second);
+        }
+    }
+}
+
+void Image::_groupIptcData()
+{
+    if (_iptcIndexed)
+    {
+        return;
+    }
+    _iptcIndex.clear();
+    _iptcKeys.clear();
+    long position = 0;
+    for (Exiv2::IptcMetadata::const_iterator i = _iptcData->begin();
+         i != _iptcData->end();
+         ++i, ++position)
+    {
+        const std::string key = i->key();
+        std::vector<long>& positions = _iptcIndex[key];
+        if (positions.empty())
+        {
+            _iptcKeys.push_back(key);
+        }
+        positions.push_back(position);
+    }
+    _iptcIndexed = true;
+}
+
+const std::vector<long>* Image::iptcPositions(const std::string& key)
+{
+    _groupIptcData();
+    GroupIndex::const_iterator entry = _iptcIndex.find(key);
+    return (entry == _iptcIndex.end()) ? 0 : &entry->second;
+}
+
+void Image::iptcDatumAppended(const std::string& key)
+{
+    if (!_iptcIndexed)
+    {
+        return;
+    }
+    std::vector<long>& positions = _iptcIndex[key];
+    if (positions.empty())
+    {
+        _iptcKeys.push_back(key);
+    }
+    positions.push_back(_iptcData->count() - 1);
+}
+
+// Erase the IPTC datums at the given positions, in increasing order, shifting
+// the remaining datums in a single pass.
+static void erasePositions(Exiv2::IptcData* data,
+                           const std::vector<long>& positions)
+{
+    if (positions.empty())
+    {
+        return;
+    }
+    Exiv2::IptcMetadata::iterator begin = data->begin();
+    Exiv2::IptcMetadata::iterator output = begin + positions.front();
+    std::vector<long>::const_iterator erased = positions.begin();
+    for (Exiv2::IptcMetadata::iterator i = output; i != data->end(); ++i)
+    {
+        if ((erased != positions.end()) && (i - begin == *erased))
+        {
+            ++erased;
+        }
+        else
+        {
+            *output++ = *i;
+        }
+    }
+    const long count = output - begin;
+    while (data->count() > count)
+    {
+        data->erase(data->end() - 1);
+    }
+}
+
+long Image::_findXmpDatum(const std::string& key)
+{
+    if (!_xmpIndexed)
+    {
+        _xmpDuplicates = indexPositions(_xmpData->begin(), _xmpData->end(),
+                                        _xmpIndex);
+        _xmpIndexed = true;
+    }
+    PositionIndex::const_iterator entry = _xmpIndex.find(key);
+    return (entry == _xmpIndex.end()) ? -1 : entry->second;
+}
+
+Exiv2::Exifdatum* Image::exifDatum(const std::string& key)
+{
+    CHECK_METADATA_READ
+
+    Exiv2::ExifMetadata::iterator datum = _findExifDatum(key);
+    if (datum == _exifData->end())
+    {
+        // ExifData::add() appends the datum to the list.
+        _exifData->add(Exiv2::Exifdatum(Exiv2::ExifKey(key)));
+        datum = --_exifData->end();
+        _exifIndex[key] = datum;
+    }
+    return &(*datum);
+}
+
+Exiv2::Xmpdatum* Image::xmpDatum(const std::string& key)
+{
+    CHECK_METADATA_READ
+
+    long position = _findXmpDatum(key);
+    if (position == -1)
+    {
+        // XmpData::add() appends the datum to the vector.
+        _xmpData->add(Exiv2::Xmpdatum(Exiv2::XmpKey(key)));
+        position = _xmpData->count() - 1;
+        _xmpIndex[key] = position;
+    }
+    return &(*(_xmpData->begin() + position));
+}
+
+void Image::_detachBuffer()
+{
+    // Writing an image instantiated from a read-only python buffer must not
+    // modify the buffer in place (libexiv2 does so for TIFF-based images).
+    // Overwriting the first byte of the data with itself forces the memory
+    // I/O to take a private copy of the data before any actual write.
+    Exiv2::BasicIo& io = _image->io();
+    io.open();
+    Exiv2::byte first;
+    if (io.read(&first, 1) == 1)
+    {
+        io.seek(0, Exiv2::BasicIo::beg);
+        io.write(&first, 1);
+    }
+    io.close();
+    PyBuffer_Release(&_view);
+    _holdsView = false;
+    _buffer = 0;
 }
 
 void Image::writeMetadata()
 {
     CHECK_METADATA_READ
 
+    if (_holdsView)
+    {
+        _detachBuffer();
+    }
+
     // If an exception is thrown, it has to be done outside of the
     // Py_{BEGIN,END}_ALLOW_THREADS block.
     Exiv2::Error error(0);
@@ -174,6 +641,7 @@ void Image::writeMetadata()
 
     try
     {
+        XmpNsReadLock lock;
         _image->writeMetadata();
     }
     catch (Exiv2::Error& err)
@@ -184,6 +652,10 @@ void Image::writeMetadata()
     // Re-acquire the GIL
     Py_END_ALLOW_THREADS
 
+    // Depending on the format of the image, libexiv2 may rearrange the
+    // metadata while writing it.
+    _invalidateIndexes();
+
     if (error.code() != 0)
     {
         throw error;
@@ -208,16 +680,37 @@ std::string Image::mimeType() const
     return _image->mimeType();
 }
 
-boost::python::list Image::exifKeys()
+boost::python::list Image::exifKeys(const boost::python::object& filter)
 {
     CHECK_METADATA_READ
 
-    boost::python::list keys;
+    const KeyFilter keyFilter(filter);
+    std::vector<std::string> matching;
+
+    // Release the GIL to allow other python threads to run
+    // while listing the keys, the python list is built afterwards.
+    Py_BEGIN_ALLOW_THREADS
+
     for(Exiv2::ExifMetadata::iterator i = _exifData->begin();
         i != _exifData->end();
         ++i)
     {
-        keys.append(i->key());
+        const std::string key = i->key();
+        if (keyFilter.matches(key))
+        {
+            matching.push_back(key);
+        }
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    boost::python::list keys;
+    for (std::vector<std::string>::const_iterator key = matching.begin();
+         key != matching.end();
+         ++key)
+    {
+        keys.append(*key);
     }
     return keys;
 }
@@ -227,13 +720,14 @@ const ExifTag Image::getExifTag(std::string key)
     CHECK_METADATA_READ
 
     Exiv2::ExifKey exifKey = Exiv2::ExifKey(key);
+    Exiv2::ExifMetadata::iterator datum = _findExifDatum(exifKey.key());
 
-    if(_exifData->findKey(exifKey) == _exifData->end())
+    if(datum == _exifData->end())
     {
         throw Exiv2::Error(KEY_NOT_FOUND, key);
     }
 
-    return ExifTag(key, &(*_exifData)[key], _exifData, _image->byteOrder());
+    return ExifTag(key, &(*datum), _exifData, _image->byteOrder());
 }
 
 void Image::deleteExifTag(std::string key)
@@ -241,29 +735,85 @@ void Image::deleteExifTag(std::string key)
     CHECK_METADATA_READ
 
     Exiv2::ExifKey exifKey = Exiv2::ExifKey(key);
-    Exiv2::ExifMetadata::iterator datum = _exifData->findKey(exifKey);
+    Exiv2::ExifMetadata::iterator datum = _findExifDatum(exifKey.key());
     if(datum == _exifData->end())
     {
         throw Exiv2::Error(KEY_NOT_FOUND, key);
     }
 
     _exifData->erase(datum);
+    if (_exifDuplicates)
+    {
+        // Another datum with the same key has to be indexed instead.
+        _exifIndexed = false;
+    }
+    else
+    {
+        _exifIndex.erase(exifKey.key());
+    }
+}
+
+// Return the name of the type of an EXIF datum.
+// As in the ExifTag constructor, user comments are reported with the 'Comment'
+// type rather than 'Undefined'. The static type information is looked up only
+// for undefined values, the common case being served by the datum itself.
+static std::string exifTypeName(const Exiv2::Exifdatum& datum)
+{
+    if (datum.typeId() == Exiv2::undefined)
+    {
+#if EXIV2_TEST_VERSION(0,21,0)
+        Exiv2::ExifKey exifKey(datum.key());
+        const Exiv2::TypeId typeId = exifKey.defaultTypeId();
+#else
+        const Exiv2::TypeId typeId =
+            Exiv2::ExifTags::tagType(datum.tag(), datum.ifdId());
+#endif
+        const char* name = Exiv2::TypeInfo::typeName(typeId);
+        if ((name != 0) && (std::string(name) == "Comment"))
+        {
+            return name;
+        }
+    }
+    const char* name = datum.typeName();
+    return (name != 0) ? std::string(name) : std::string();
 }
 
-boost::python::list Image::iptcKeys()
+boost::python::list Image::exifItems(const boost::python::object& filter)
 {
     CHECK_METADATA_READ
 
-    boost::python::list keys;
-    for(Exiv2::IptcMetadata::iterator i = _iptcData->begin();
-        i != _iptcData->end();
+    const KeyFilter keyFilter(filter);
+
+    boost::python::list items;
+    for(Exiv2::ExifMetadata::const_iterator i = _exifData->begin();
+        i != _exifData->end();
         ++i)
     {
-        // The key is appended to the list if and only if it is not already
-        // present.
-        if (keys.count(i->key()) == 0)
+        const std::string key = i->key();
+        if (keyFilter.matches(key))
+        {
+            items.append(boost::python::make_tuple(key, exifTypeName(*i),
+                                                   i->toString()));
+        }
+    }
+    return items;
+}
+
+boost::python::list Image::iptcKeys(const boost::python::object& filter)
+{
+    CHECK_METADATA_READ
+
+    const KeyFilter keyFilter(filter);
+    _groupIptcData();
+
+    boost::python::list keys;
+    for(std::vector<std::string>::const_iterator key = _iptcKeys.begin();
+        key != _iptcKeys.end();
+        ++key)
+    {
+        if (keyFilter.matches(*key))
         {
-            keys.append(i->key());
+            keys.append(*key);
         }
     }
     return keys;
@@ -275,12 +825,12 @@ const IptcTag Image::getIptcTag(std::string key)
 
     Exiv2::IptcKey iptcKey = Exiv2::IptcKey(key);
 
-    if(_iptcData->findKey(iptcKey) == _iptcData->end())
+    if(iptcPositions(iptcKey.key()) == 0)
     {
         throw Exiv2::Error(KEY_NOT_FOUND, key);
     }
 
-    return IptcTag(key, _iptcData);
+    return IptcTag(key, this);
 }
 
 void Image::deleteIptcTag(std::string key)
@@ -288,36 +838,85 @@ void Image::deleteIptcTag(std::string key)
     CHECK_METADATA_READ
 
     Exiv2::IptcKey iptcKey = Exiv2::IptcKey(key);
-    Exiv2::IptcMetadata::iterator dataIterator = _iptcData->findKey(iptcKey);
+    const std::vector<long>* positions = iptcPositions(iptcKey.key());
 
-    if (dataIterator == _iptcData->end())
+    if (positions == 0)
     {
         throw Exiv2::Error(KEY_NOT_FOUND, key);
     }
 
-    while (dataIterator != _iptcData->end())
+    // Erase all the repetitions.
+    erasePositions(_iptcData, *positions);
+    _iptcIndexed = false;
+}
+
+boost::python::list Image::iptcItems(const boost::python::object& filter)
+{
+    CHECK_METADATA_READ
+
+    const KeyFilter keyFilter(filter);
+    _groupIptcData();
+
+    // The repetitions of each tag are grouped in a single list of raw values,
+    // in the order of the first occurence of each key.
+    boost::python::list items;
+    for(std::vector<std::string>::const_iterator key = _iptcKeys.begin();
+        key != _iptcKeys.end();
+        ++key)
     {
-        if (dataIterator->key() == key)
+        if (!keyFilter.matches(*key))
         {
-            dataIterator = _iptcData->erase(dataIterator);
+            continue;
         }
-        else
+        const std::vector<long>& positions = _iptcIndex[*key];
+        const Exiv2::Iptcdatum& first =
+            *(_iptcData->begin() + positions.front());
+        const char* name = Exiv2::TypeInfo::typeName(
+            Exiv2::IptcDataSets::dataSetType(first.tag(), first.record()));
+        boost::python::list values;
+        for (std::vector<long>::const_iterator position = positions.begin();
+             position != positions.end();
+             ++position)
         {
-            ++dataIterator;
+            values.append((_iptcData->begin() + *position)->toString());
         }
+        items.append(boost::python::make_tuple(*key,
+            (name != 0) ? std::string(name) : std::string(), values));
     }
+    return items;
 }
 
-boost::python::list Image::xmpKeys()
+boost::python::list Image::xmpKeys(const boost::python::object& filter)
 {
     CHECK_METADATA_READ
 
-    boost::python::list keys;
+    const KeyFilter keyFilter(filter);
+    std::vector<std::string> matching;
+
+    // Release the GIL to allow other python threads to run
+    // while listing the keys, the python list is built afterwards.
+    Py_BEGIN_ALLOW_THREADS
+
     for(Exiv2::XmpMetadata::iterator i = _xmpData->begin();
         i != _xmpData->end();
         ++i)
     {
-        keys.append(i->key());
+        const std::string key = i->key();
+        if (keyFilter.matches(key))
+        {
+            matching.push_back(key);
+        }
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    boost::python::list keys;
+    for (std::vector<std::string>::const_iterator key = matching.begin();
+         key != matching.end();
+         ++key)
+    {
+        keys.append(*key);
     }
     return keys;
 }
@@ -327,13 +926,14 @@ const XmpTag Image::getXmpTag(std::string key)
     CHECK_METADATA_READ
 
     Exiv2::XmpKey xmpKey = Exiv2::XmpKey(key);
+    long position = _findXmpDatum(xmpKey.key());
 
-    if(_xmpData->findKey(xmpKey) == _xmpData->end())
+    if(position == -1)
     {
         throw Exiv2::Error(KEY_NOT_FOUND, key);
     }
 
-    return XmpTag(key, &(*_xmpData)[key]);
+    return XmpTag(key, &(*(_xmpData->begin() + position)));
 }
 
 void Image::deleteXmpTag(std::string key)
@@ -341,15 +941,92 @@ void Image::deleteXmpTag(std::string key)
     CHECK_METADATA_READ
 
     Exiv2::XmpKey xmpKey = Exiv2::XmpKey(key);
-    Exiv2::XmpMetadata::iterator i = _xmpData->findKey(xmpKey);
-    if(i != _xmpData->end())
+    long position = _findXmpDatum(xmpKey.key());
+    if(position != -1)
     {
-        _xmpData->erase(i);
-    }
-    else
+        _xmpData->erase(_xmpData->begin() + position);
+        if (_xmpDuplicates)
+        {
+            // Another datum with the same key may follow, index again.
+            _xmpIndexed = false;
+        }
+        else
+        {
+            // Shift the positions of the following datums in place, so that
+            // deleting several tags does not rebuild the index every time.
+            _xmpIndex.erase(xmpKey.key());
+            shiftPositions(_xmpIndex, position);
+        }
+    }
+    else
         throw Exiv2::Error(KEY_NOT_FOUND, key);
 }
 
+// Return the raw value of an XMP datum as a python object, depending on its
+// type: a string for XmpText, a list of strings for XmpAlt, XmpBag and XmpSeq,
+// a dictionary for LangAlt. Any other type of value is returned as a string.
+static boost::python::object xmpRawValue(const Exiv2::Xmpdatum& datum)
+{
+    const Exiv2::Value& value = datum.value();
+    switch (datum.typeId())
+    {
+        case Exiv2::xmpText:
+            return boost::python::str(
+                dynamic_cast<const Exiv2::XmpTextValue&>(value).value_);
+        case Exiv2::xmpAlt:
+        case Exiv2::xmpBag:
+        case Exiv2::xmpSeq:
+        {
+            const std::vector<std::string>& array =
+                dynamic_cast<const Exiv2::XmpArrayValue&>(value).value_;
+            boost::python::list rvalue;
+            for(std::vector<std::string>::const_iterator i = array.begin();
+                i != array.end(); ++i)
+            {
+                rvalue.append(*i);
+            }
+            return rvalue;
+        }
+        case Exiv2::langAlt:
+        {
+            const Exiv2::LangAltValue::ValueType& langAlt =
+                dynamic_cast<const Exiv2::LangAltValue&>(value).value_;
+            boost::python::dict rvalue;
+            for (Exiv2::LangAltValue::ValueType::const_iterator i = langAlt.begin();
+                 i != langAlt.end(); ++i)
+            {
+                rvalue[i->first] = i->second;
+            }
+            return rvalue;
+        }
+        default:
+            return boost::python::str(datum.toString());
+    }
+}
+
+boost::python::list Image::xmpItems(const boost::python::object& filter)
+{
+    CHECK_METADATA_READ
+
+    const KeyFilter keyFilter(filter);
+
+    boost::python::list items;
+    for(Exiv2::XmpMetadata::const_iterator i = _xmpData->begin();
+        i != _xmpData->end();
+        ++i)
+    {
+        const std::string key = i->key();
+        if (!keyFilter.matches(key))
+        {
+            continue;
+        }
+        const char* name = i->typeName();
+        items.append(boost::python::make_tuple(key,
+            (name != 0) ? std::string(name) : std::string(), xmpRawValue(*i)));
+    }
+    return items;
+}
+
 const std::string Image::getComment() const
 {
     CHECK_METADATA_READ
@@ -373,163 +1050,516 @@ boost::python::list Image::previews()
 {
     CHECK_METADATA_READ
 
+    Exiv2::PreviewPropertiesList props;
+
+    // If an exception is thrown, it has to be done outside of the
+    // Py_{BEGIN,END}_ALLOW_THREADS block.
+    Exiv2::Error error(0);
+
+    // Release the GIL to allow other python threads to run
+    // while looking for the previews, which may decode parts of the image.
+    Py_BEGIN_ALLOW_THREADS
+
+    try
+    {
+        Exiv2::PreviewManager pm(*_image);
+        props = pm.getPreviewProperties();
+    }
+    catch (Exiv2::Error& err)
+    {
+        error = err;
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    if (error.code() != 0)
+    {
+        throw error;
+    }
+
     boost::python::list previews;
-    Exiv2::PreviewManager pm(*_image);
-    Exiv2::PreviewPropertiesList props = pm.getPreviewProperties();
     for (Exiv2::PreviewPropertiesList::const_iterator i = props.begin();
          i != props.end();
          ++i)
     {
-        previews.append(Preview(pm.getPreviewImage(*i)));
+        previews.append(Preview(*i));
     }
 
     return previews;
 }
 
+std::auto_ptr<Exiv2::PreviewImage> Image::_getPreviewImage(const Preview& preview)
+{
+    CHECK_METADATA_READ
+
+    std::auto_ptr<Exiv2::PreviewImage> image;
+
+    // If an exception is thrown, it has to be done outside of the
+    // Py_{BEGIN,END}_ALLOW_THREADS block.
+    Exiv2::Error error(0);
+
+    // Release the GIL to allow other python threads to run
+    // while extracting the preview.
+    Py_BEGIN_ALLOW_THREADS
+
+    try
+    {
+        Exiv2::PreviewManager pm(*_image);
+        image.reset(new Exiv2::PreviewImage(
+            pm.getPreviewImage(preview._properties)));
+    }
+    catch (Exiv2::Error& err)
+    {
+        error = err;
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    if (error.code() != 0)
+    {
+        throw error;
+    }
+
+    return image;
+}
+
+boost::python::object Image::getPreviewData(const Preview& preview)
+{
+    std::auto_ptr<Exiv2::PreviewImage> image = _getPreviewImage(preview);
+    return copyToString(image->pData(), image->size());
+}
+
+void Image::writePreviewToFile(const Preview& preview, const std::string& path)
+{
+    std::auto_ptr<Exiv2::PreviewImage> image = _getPreviewImage(preview);
+
+    Exiv2::Error error(0);
+
+    // Release the GIL to allow other python threads to run
+    // while writing the file.
+    Py_BEGIN_ALLOW_THREADS
+
+    try
+    {
+        // The extension is appended to the path.
+        image->writeFile(path);
+    }
+    catch (Exiv2::Error& err)
+    {
+        error = err;
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    if (error.code() != 0)
+    {
+        throw error;
+    }
+}
+
+void Image::writePreviewToFileObject(const Preview& preview,
+                                     boost::python::object file)
+{
+    std::auto_ptr<Exiv2::PreviewImage> image = _getPreviewImage(preview);
+    writeData(image->pData(), image->size(), file);
+}
+
 void Image::copyMetadata(Image& other, bool exif, bool iptc, bool xmp) const
 {
     CHECK_METADATA_READ
     if (!other._dataRead) throw Exiv2::Error(METADATA_NOT_READ);
 
-    if (exif)
-        other._image->setExifData(*_exifData);
-    if (iptc)
-        other._image->setIptcData(*_iptcData);
-    if (xmp)
-        other._image->setXmpData(*_xmpData);
+    // If an exception is thrown, it has to be done outside of the
+    // Py_{BEGIN,END}_ALLOW_THREADS block.
+    Exiv2::Error error(0);
+
+    // Release the GIL to allow other python threads to run
+    // while copying the metadata, which can be large.
+    Py_BEGIN_ALLOW_THREADS
+
+    try
+    {
+        if (exif)
+            other._image->setExifData(*_exifData);
+        if (iptc)
+            other._image->setIptcData(*_iptcData);
+        if (xmp)
+            other._image->setXmpData(*_xmpData);
+    }
+    catch (Exiv2::Error& err)
+    {
+        error = err;
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    other._invalidateIndexes();
+
+    if (error.code() != 0)
+    {
+        throw error;
+    }
+}
+
+boost::python::object Image::getDataBuffer() const
+{
+    Exiv2::BasicIo& io = _image->io();
+    long size = io.size();
+    long pos = -1;
+    long read = 0;
+
+    // Allocate the python string beforehand and read the data directly into
+    // it. The string is not shared with anyone yet, so it is safe to fill it
+    // without holding the GIL.
+    PyObject* buffer = PyString_FromStringAndSize(0, size);
+    if (buffer == 0)
+    {
+        boost::python::throw_error_already_set();
+    }
+    Exiv2::byte* data = (Exiv2::byte*) PyString_AS_STRING(buffer);
+
+    // Release the GIL to allow other python threads to run
+    // while reading the image data.
+    Py_BEGIN_ALLOW_THREADS
+
+    if (io.isopen())
+    {
+        // Remember the current position in the stream
+        pos = io.tell();
+        // Go to the beginning of the stream
+        io.seek(0, Exiv2::BasicIo::beg);
+    }
+    else
+    {
+        io.open();
+    }
+
+    // Read the whole data in one go.
+    read = io.read(data, size);
+
+    if (pos == -1)
+    {
+        // The stream was initially closed
+        io.close();
+    }
+    else
+    {
+        // Reset to the initial position in the stream
+        io.seek(pos, Exiv2::BasicIo::beg);
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    if ((read < size) && (_PyString_Resize(&buffer, read) == -1))
+    {
+        // buffer has been released and set to NULL
+        boost::python::throw_error_already_set();
+    }
+    return boost::python::object(boost::python::handle<>(buffer));
+}
+
+Exiv2::ByteOrder Image::getByteOrder() const
+{
+    CHECK_METADATA_READ
+    return _image->byteOrder();
+}
+
+Exiv2::ExifThumb* Image::_getExifThumbnail()
+{
+    CHECK_METADATA_READ
+    if (_exifThumbnail == 0)
+    {
+        _exifThumbnail = new Exiv2::ExifThumb(*_exifData);
+    }
+    return _exifThumbnail;
+}
+
+const std::string Image::getExifThumbnailMimeType()
+{
+    return std::string(_getExifThumbnail()->mimeType());
+}
+
+const std::string Image::getExifThumbnailExtension()
+{
+    return std::string(_getExifThumbnail()->extension());
+}
+
+void Image::writeExifThumbnailToFile(const std::string& path)
+{
+    Exiv2::ExifThumb* thumbnail = _getExifThumbnail();
+
+    // If an exception is thrown, it has to be done outside of the
+    // Py_{BEGIN,END}_ALLOW_THREADS block.
+    Exiv2::Error error(0);
+
+    // Release the GIL to allow other python threads to run
+    // while writing the file.
+    Py_BEGIN_ALLOW_THREADS
+
+    try
+    {
+        // The extension is appended to the path.
+        thumbnail->writeFile(path);
+    }
+    catch (Exiv2::Error& err)
+    {
+        error = err;
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    if (error.code() != 0)
+    {
+        throw error;
+    }
+}
+
+Exiv2::DataBuf Image::_copyExifThumbnail()
+{
+    Exiv2::ExifThumb* thumbnail = _getExifThumbnail();
+    Exiv2::DataBuf buffer;
+
+    // If an exception is thrown, it has to be done outside of the
+    // Py_{BEGIN,END}_ALLOW_THREADS block.
+    Exiv2::Error error(0);
+
+    // Release the GIL to allow other python threads to run
+    // while extracting the thumbnail.
+    Py_BEGIN_ALLOW_THREADS
+
+    try
+    {
+        buffer = thumbnail->copy();
+    }
+    catch (Exiv2::Error& err)
+    {
+        error = err;
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    if (error.code() != 0)
+    {
+        throw error;
+    }
+
+    return buffer;
+}
+
+void Image::writeExifThumbnailToFileObject(boost::python::object file)
+{
+    Exiv2::DataBuf buffer = _copyExifThumbnail();
+    writeData(buffer.pData_, buffer.size_, file);
+}
+
+const boost::python::object Image::getExifThumbnailData()
+{
+    Exiv2::DataBuf buffer = _copyExifThumbnail();
+    return copyToString(buffer.pData_, buffer.size_);
+}
+
+void Image::eraseExifThumbnail()
+{
+    _getExifThumbnail()->erase();
+    _exifIndexed = false;
+}
+
+void Image::setExifThumbnailFromFile(const std::string& path)
+{
+    Exiv2::ExifThumb* thumbnail = _getExifThumbnail();
+
+    // If an exception is thrown, it has to be done outside of the
+    // Py_{BEGIN,END}_ALLOW_THREADS block.
+    Exiv2::Error error(0);
+
+    // Release the GIL to allow other python threads to run
+    // while reading the file.
+    Py_BEGIN_ALLOW_THREADS
+
+    try
+    {
+        thumbnail->setJpegThumbnail(path);
+    }
+    catch (Exiv2::Error& err)
+    {
+        error = err;
+    }
+
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    _exifIndexed = false;
+
+    if (error.code() != 0)
+    {
+        throw error;
+    }
 }
 
-std::string Image::getDataBuffer() const
+void Image::setExifThumbnailFromData(const std::string& data)
 {
-    std::string buffer;
+    Exiv2::ExifThumb* thumbnail = _getExifThumbnail();
+    const Exiv2::byte* buffer = (const Exiv2::byte*) data.c_str();
+
+    // If an exception is thrown, it has to be done outside of the
+    // Py_{BEGIN,END}_ALLOW_THREADS block.
+    Exiv2::Error error(0);
 
     // Release the GIL to allow other python threads to run
-    // while reading the image data.
+    // while copying the data into the EXIF metadata.
     Py_BEGIN_ALLOW_THREADS
 
-    Exiv2::BasicIo& io = _image->io();
-    unsigned long size = io.size();
-    long pos = -1;
-
-    if (io.isopen())
+    try
     {
-        // Remember the current position in the stream
-        pos = io.tell();
-        // Go to the beginning of the stream
-        io.seek(0, Exiv2::BasicIo::beg);
+        thumbnail->setJpegThumbnail(buffer, data.size());
     }
-    else
+    catch (Exiv2::Error& err)
     {
-        io.open();
+        error = err;
     }
 
-    // Copy the data buffer in a string. Since the data buffer can contain null
-    // characters ('\x00'), the string cannot be simply constructed like that:
-    //     _data = std::string((char*) previewImage.pData());
-    // because it would be truncated after the first occurence of a null
-    // character. Therefore, it has to be copied character by character.
-    // First allocate the memory for the whole string...
-    buffer.resize(size, ' ');
-    // ... then fill it with the raw data.
-    for (unsigned long i = 0; i < size; ++i)
+    // Re-acquire the GIL
+    Py_END_ALLOW_THREADS
+
+    _exifIndexed = false;
+
+    if (error.code() != 0)
     {
-        io.read((Exiv2::byte*) &buffer[i], 1);
+        throw error;
     }
+}
 
-    if (pos == -1)
+const std::string Image::getIptcCharset() const
+{
+    CHECK_METADATA_READ
+    const char* charset = _iptcData->detectCharset();
+    if (charset != 0)
     {
-        // The stream was initially closed
-        io.close();
+        return std::string(charset);
     }
     else
     {
-        // Reset to the initial position in the stream
-        io.seek(pos, Exiv2::BasicIo::beg);
+        return std::string();
     }
-
-    // Re-acquire the GIL
-    Py_END_ALLOW_THREADS
-
-    return buffer;
 }
 
-Exiv2::ByteOrder Image::getByteOrder() const
-{
-    CHECK_METADATA_READ
-    return _image->byteOrder();
-}
 
-Exiv2::ExifThumb* Image::_getExifThumbnail()
+// Process-wide caches of the static information about the tags, indexed by
+// key. They are only ever accessed with the GIL held (tag objects are
+// instantiated from python), which protects them from concurrent accesses.
+typedef std::map<std::string, ExifTagInfoPtr> ExifTagInfoCache;
+typedef std::map<std::string, IptcTagInfoPtr> IptcTagInfoCache;
+typedef std::map<std::string, XmpTagInfoPtr> XmpTagInfoCache;
+static ExifTagInfoCache exifTagInfoCache;
+static IptcTagInfoCache iptcTagInfoCache;
+static XmpTagInfoCache xmpTagInfoCache;
+
+static ExifTagInfoPtr getExifTagInfo(const Exiv2::ExifKey& exifKey)
 {
-    CHECK_METADATA_READ
-    if (_exifThumbnail == 0)
+    const std::string key = exifKey.key();
+    ExifTagInfoCache::const_iterator cached = exifTagInfoCache.find(key);
+    if (cached != exifTagInfoCache.end())
     {
-        _exifThumbnail = new Exiv2::ExifThumb(*_exifData);
+        return cached->second;
     }
-    return _exifThumbnail;
-}
 
-const std::string Image::getExifThumbnailMimeType()
-{
-    return std::string(_getExifThumbnail()->mimeType());
+    boost::shared_ptr<ExifTagInfo> info(new ExifTagInfo);
+// Conditional code, exiv2 0.21 changed APIs we need
+// (see https://bugs.launchpad.net/pyexiv2/+bug/684177).
+#if EXIV2_TEST_VERSION(0,21,0)
+    info->_type = Exiv2::TypeInfo::typeName(exifKey.defaultTypeId());
+    info->_name = exifKey.tagName();
+    info->_label = exifKey.tagLabel();
+    info->_description = exifKey.tagDesc();
+    info->_sectionName = Exiv2::ExifTags::sectionName(exifKey);
+    // The section description is not exposed in the API any longer
+    // (see http://dev.exiv2.org/issues/744). For want of anything better,
+    // fall back on the section’s name.
+    info->_sectionDescription = info->_sectionName;
+#else
+    const uint16_t tag = exifKey.tag();
+    const Exiv2::IfdId ifd = exifKey.ifdId();
+    info->_type = Exiv2::TypeInfo::typeName(Exiv2::ExifTags::tagType(tag, ifd));
+    info->_name = Exiv2::ExifTags::tagName(tag, ifd);
+    info->_label = Exiv2::ExifTags::tagLabel(tag, ifd);
+    info->_description = Exiv2::ExifTags::tagDesc(tag, ifd);
+    info->_sectionName = Exiv2::ExifTags::sectionName(tag, ifd);
+    info->_sectionDescription = Exiv2::ExifTags::sectionDesc(tag, ifd);
+#endif
+    exifTagInfoCache[key] = info;
+    return info;
 }
 
-const std::string Image::getExifThumbnailExtension()
+static IptcTagInfoPtr getIptcTagInfo(const Exiv2::IptcKey& iptcKey)
 {
-    return std::string(_getExifThumbnail()->extension());
-}
+    const std::string key = iptcKey.key();
+    IptcTagInfoCache::const_iterator cached = iptcTagInfoCache.find(key);
+    if (cached != iptcTagInfoCache.end())
+    {
+        return cached->second;
+    }
 
-void Image::writeExifThumbnailToFile(const std::string& path)
-{
-    _getExifThumbnail()->writeFile(path);
+    boost::shared_ptr<IptcTagInfo> info(new IptcTagInfo);
+    const uint16_t tag = iptcKey.tag();
+    const uint16_t record = iptcKey.record();
+    info->_type = Exiv2::TypeInfo::typeName(Exiv2::IptcDataSets::dataSetType(tag, record));
+    info->_name = Exiv2::IptcDataSets::dataSetName(tag, record);
+    info->_title = Exiv2::IptcDataSets::dataSetTitle(tag, record);
+    info->_description = Exiv2::IptcDataSets::dataSetDesc(tag, record);
+    // What is the photoshop name anyway? Where is it used?
+    info->_photoshopName = Exiv2::IptcDataSets::dataSetPsName(tag, record);
+    info->_repeatable = Exiv2::IptcDataSets::dataSetRepeatable(tag, record);
+    info->_recordName = Exiv2::IptcDataSets::recordName(record);
+    info->_recordDescription = Exiv2::IptcDataSets::recordDesc(record);
+    iptcTagInfoCache[key] = info;
+    return info;
 }
 
-const std::string Image::getExifThumbnailData()
+static XmpTagInfoPtr getXmpTagInfo(const Exiv2::XmpKey& xmpKey)
 {
-    Exiv2::DataBuf buffer = _getExifThumbnail()->copy();
-    // Copy the data buffer in a string. Since the data buffer can contain null
-    // characters ('\x00'), the string cannot be simply constructed like that:
-    //     data = std::string((char*) buffer.pData_);
-    // because it would be truncated after the first occurence of a null
-    // character. Therefore, it has to be copied character by character.
-    // First allocate the memory for the whole string...
-    std::string data = std::string(buffer.size_, ' ');
-    // ... then fill it with the raw data.
-    for(unsigned int i = 0; i < buffer.size_; ++i)
+    const std::string key = xmpKey.key();
+    XmpTagInfoCache::const_iterator cached = xmpTagInfoCache.find(key);
+    if (cached != xmpTagInfoCache.end())
     {
-        data[i] = buffer.pData_[i];
+        return cached->second;
     }
-    return data;
-}
-
-void Image::eraseExifThumbnail()
-{
-    _getExifThumbnail()->erase();
-}
 
-void Image::setExifThumbnailFromFile(const std::string& path)
-{
-    _getExifThumbnail()->setJpegThumbnail(path);
-}
+    boost::shared_ptr<XmpTagInfo> info(new XmpTagInfo);
+    info->_exiv2_type = Exiv2::TypeInfo::typeName(Exiv2::XmpProperties::propertyType(xmpKey));
 
-void Image::setExifThumbnailFromData(const std::string& data)
-{
-    const Exiv2::byte* buffer = (const Exiv2::byte*) data.c_str();
-    _getExifThumbnail()->setJpegThumbnail(buffer, data.size());
-}
+    const char* title = Exiv2::XmpProperties::propertyTitle(xmpKey);
+    if (title != 0)
+    {
+        info->_title = title;
+    }
 
-const std::string Image::getIptcCharset() const
-{
-    CHECK_METADATA_READ
-    const char* charset = _iptcData->detectCharset();
-    if (charset != 0)
+    const char* description = Exiv2::XmpProperties::propertyDesc(xmpKey);
+    if (description != 0)
     {
-        return std::string(charset);
+        info->_description = description;
     }
-    else
+
+    const Exiv2::XmpPropertyInfo* propertyInfo = Exiv2::XmpProperties::propertyInfo(xmpKey);
+    if (propertyInfo != 0)
     {
-        return std::string();
+        info->_name = propertyInfo->name_;
+        info->_type = propertyInfo->xmpValueType_;
     }
+    xmpTagInfoCache[key] = info;
+    return info;
+}
+
+// The static information about XMP tags depends on the registered namespaces.
+static void clearXmpTagInfoCache()
+{
+    xmpTagInfoCache.clear();
 }
 
 
@@ -549,30 +1579,8 @@ ExifTag::ExifTag(const std::string& key,
         _data = 0;
     }
 
-// Conditional code, exiv2 0.21 changed APIs we need
-// (see https://bugs.launchpad.net/pyexiv2/+bug/684177).
-#if EXIV2_TEST_VERSION(0,21,0)
-    Exiv2::ExifKey exifKey(key);
-    _type = Exiv2::TypeInfo::typeName(exifKey.defaultTypeId());
-    // Where available, extract the type from the metadata, it is more reliable
-    // than static type information. The exception is for user comments, for
-    // which we’d rather keep the 'Comment' type instead of 'Undefined'.
-    if ((_data != 0) && (_type != "Comment"))
-    {
-        _type = _datum->typeName();
-    }
-    _name = exifKey.tagName();
-    _label = exifKey.tagLabel();
-    _description = exifKey.tagDesc();
-    _sectionName = Exiv2::ExifTags::sectionName(exifKey);
-    // The section description is not exposed in the API any longer
-    // (see http://dev.exiv2.org/issues/744). For want of anything better,
-    // fall back on the section’s name.
-    _sectionDescription = _sectionName;
-#else
-    const uint16_t tag = _datum->tag();
-    const Exiv2::IfdId ifd = _datum->ifdId();
-    _type = Exiv2::TypeInfo::typeName(Exiv2::ExifTags::tagType(tag, ifd));
+    _info = getExifTagInfo(_key);
+    _type = _info->_type;
     // Where available, extract the type from the metadata, it is more reliable
     // than static type information. The exception is for user comments, for
     // which we’d rather keep the 'Comment' type instead of 'Undefined'.
@@ -580,12 +1588,6 @@ ExifTag::ExifTag(const std::string& key,
     {
         _type = _datum->typeName();
     }
-    _name = Exiv2::ExifTags::tagName(tag, ifd);
-    _label = Exiv2::ExifTags::tagLabel(tag, ifd);
-    _description = Exiv2::ExifTags::tagDesc(tag, ifd);
-    _sectionName = Exiv2::ExifTags::sectionName(tag, ifd);
-    _sectionDescription = Exiv2::ExifTags::sectionDesc(tag, ifd);
-#endif
 }
 
 ExifTag::~ExifTag()
@@ -605,6 +1607,130 @@ void ExifTag::setRawValue(const std::string& value)
     }
 }
 
+// Conversions of single numbers between python objects and the types of the
+// elements of the values of EXIF datums.
+template <typename T>
+static T fromPython(const boost::python::object& number)
+{
+    return boost::python::extract<T>(number);
+}
+
+template <>
+Exiv2::URational fromPython<Exiv2::URational>(
+    const boost::python::object& number)
+{
+    const uint32_t numerator = boost::python::extract<uint32_t>(number[0]);
+    const uint32_t denominator = boost::python::extract<uint32_t>(number[1]);
+    return Exiv2::URational(numerator, denominator);
+}
+
+template <>
+Exiv2::Rational fromPython<Exiv2::Rational>(
+    const boost::python::object& number)
+{
+    const int32_t numerator = boost::python::extract<int32_t>(number[0]);
+    const int32_t denominator = boost::python::extract<int32_t>(number[1]);
+    return Exiv2::Rational(numerator, denominator);
+}
+
+template <typename T>
+static boost::python::object toPython(const T& number)
+{
+    return boost::python::object(number);
+}
+
+template <typename T>
+static boost::python::object toPython(const std::pair<T, T>& number)
+{
+    return boost::python::make_tuple(number.first, number.second);
+}
+
+// Set the value of a datum from a list of numbers of the given type.
+template <typename T>
+static void setNumbers(Exiv2::Exifdatum* datum, Exiv2::TypeId typeId,
+                       const boost::python::list& numbers)
+{
+    Exiv2::ValueType<T> value(typeId);
+    const long count = boost::python::len(numbers);
+    for (long i = 0; i < count; ++i)
+    {
+        value.value_.push_back(fromPython<T>(numbers[i]));
+    }
+    datum->setValue(&value);
+}
+
+// Append the numbers of a value to a list, if it holds numbers of the given
+// type. Return whether it does.
+template <typename T>
+static bool getNumbers(const Exiv2::Value& value, boost::python::list& numbers)
+{
+    const Exiv2::ValueType<T>* typed =
+        dynamic_cast<const Exiv2::ValueType<T>*>(&value);
+    if (typed == 0)
+    {
+        return false;
+    }
+    for (typename Exiv2::ValueType<T>::ValueList::const_iterator i =
+            typed->value_.begin();
+         i != typed->value_.end();
+         ++i)
+    {
+        numbers.append(toPython(*i));
+    }
+    return true;
+}
+
+void ExifTag::setValues(const boost::python::list& values)
+{
+    // As with a raw value, an existing value keeps its type, a new one takes
+    // the type of the tag.
+    Exiv2::TypeId typeId = _datum->typeId();
+    if (typeId == Exiv2::invalidTypeId)
+    {
+        typeId = Exiv2::TypeInfo::typeId(_type);
+    }
+    switch (typeId)
+    {
+        case Exiv2::unsignedShort:
+            setNumbers<uint16_t>(_datum, typeId, values);
+            break;
+        case Exiv2::signedShort:
+            setNumbers<int16_t>(_datum, typeId, values);
+            break;
+        case Exiv2::unsignedLong:
+            setNumbers<uint32_t>(_datum, typeId, values);
+            break;
+        case Exiv2::signedLong:
+            setNumbers<int32_t>(_datum, typeId, values);
+            break;
+        case Exiv2::unsignedRational:
+            setNumbers<Exiv2::URational>(_datum, typeId, values);
+            break;
+        case Exiv2::signedRational:
+            setNumbers<Exiv2::Rational>(_datum, typeId, values);
+            break;
+        default:
+            throw Exiv2::Error(INVALID_VALUE);
+    }
+}
+
+void ExifTag::setData(const std::string& data)
+{
+    Exiv2::TypeId typeId = _datum->typeId();
+    if (typeId == Exiv2::invalidTypeId)
+    {
+        typeId = Exiv2::TypeInfo::typeId(_type);
+    }
+    if ((typeId != Exiv2::undefined) && (typeId != Exiv2::unsignedByte) &&
+        (typeId != Exiv2::signedByte))
+    {
+        throw Exiv2::Error(INVALID_VALUE);
+    }
+    Exiv2::DataValue value(typeId);
+    value.read((const Exiv2::byte*) data.data(), data.size());
+    _datum->setValue(&value);
+}
+
 void ExifTag::setParentImage(Image& image)
 {
     Exiv2::ExifData* data = image.getExifData();
@@ -618,7 +1744,7 @@ void ExifTag::setParentImage(Image& image)
     _data = data;
     Exiv2::Value::AutoPtr value = _datum->getValue();
     delete _datum;
-    _datum = &(*_data)[_key.key()];
+    _datum = image.exifDatum(_key.key());
     _datum->setValue(value.get());
 
     _byteOrder = image.getByteOrder();
@@ -636,27 +1762,27 @@ const std::string ExifTag::getType()
 
 const std::string ExifTag::getName()
 {
-    return _name;
+    return _info->_name;
 }
 
 const std::string ExifTag::getLabel()
 {
-    return _label;
+    return _info->_label;
 }
 
 const std::string ExifTag::getDescription()
 {
-    return _description;
+    return _info->_description;
 }
 
 const std::string ExifTag::getSectionName()
 {
-    return _sectionName;
+    return _info->_sectionName;
 }
 
 const std::string ExifTag::getSectionDescription()
 {
-    return _sectionDescription;
+    return _info->_sectionDescription;
 }
 
 const std::string ExifTag::getRawValue()
@@ -664,6 +1790,51 @@ const std::string ExifTag::getRawValue()
     return _datum->toString();
 }
 
+boost::python::object ExifTag::getValues()
+{
+    if (_datum->typeId() == Exiv2::invalidTypeId)
+    {
+        // No value
+        return boost::python::object();
+    }
+    const Exiv2::Value& value = _datum->value();
+    boost::python::list numbers;
+    if (getNumbers<uint16_t>(value, numbers) ||
+        getNumbers<int16_t>(value, numbers) ||
+        getNumbers<uint32_t>(value, numbers) ||
+        getNumbers<int32_t>(value, numbers) ||
+        getNumbers<Exiv2::URational>(value, numbers) ||
+        getNumbers<Exiv2::Rational>(value, numbers))
+    {
+        return numbers;
+    }
+    return boost::python::object();
+}
+
+boost::python::object ExifTag::getData()
+{
+    if (_datum->typeId() == Exiv2::invalidTypeId)
+    {
+        // No value
+        return boost::python::object();
+    }
+    const Exiv2::DataValue* value =
+        dynamic_cast<const Exiv2::DataValue*>(&_datum->value());
+    if (value == 0)
+    {
+        return boost::python::object();
+    }
+    // Copy the bytes directly into a new python string.
+    const long size = value->size();
+    PyObject* data = PyString_FromStringAndSize(0, size);
+    if (data == 0)
+    {
+        boost::python::throw_error_already_set();
+    }
+    value->copy((Exiv2::byte*) PyString_AS_STRING(data));
+    return boost::python::object(boost::python::handle<>(data));
+}
+
 const std::string ExifTag::getHumanValue()
 {
     return _datum->print(_data);
@@ -674,14 +1845,20 @@ int ExifTag::getByteOrder()
     return _byteOrder;
 }
 
+int ExifTag::getTag()
+{
+    return _key.tag();
+}
+
 
-IptcTag::IptcTag(const std::string& key, Exiv2::IptcData* data): _key(key)
+IptcTag::IptcTag(const std::string& key, Image* image):
+    _key(key), _image(image)
 {
-    _from_data = (data != 0);
+    _from_data = (image != 0);
 
     if (_from_data)
     {
-        _data = data;
+        _data = image->getIptcData();
     }
     else
     {
@@ -689,35 +1866,16 @@ IptcTag::IptcTag(const std::string& key, Exiv2::IptcData* data): _key(key)
         _data->add(Exiv2::Iptcdatum(_key));
     }
 
-    Exiv2::IptcMetadata::iterator iterator = _data->findKey(_key);
-    const uint16_t tag = iterator->tag();
-    const uint16_t record = iterator->record();
-    _type = Exiv2::TypeInfo::typeName(Exiv2::IptcDataSets::dataSetType(tag, record));
-    _name = Exiv2::IptcDataSets::dataSetName(tag, record);
-    _title = Exiv2::IptcDataSets::dataSetTitle(tag, record);
-    _description = Exiv2::IptcDataSets::dataSetDesc(tag, record);
-    // What is the photoshop name anyway? Where is it used?
-    _photoshopName = Exiv2::IptcDataSets::dataSetPsName(tag, record);
-    _repeatable = Exiv2::IptcDataSets::dataSetRepeatable(tag, record);
-    _recordName = Exiv2::IptcDataSets::recordName(record);
-    _recordDescription = Exiv2::IptcDataSets::recordDesc(record);
+    _info = getIptcTagInfo(_key);
 
     if (_from_data)
     {
         // Check that we are not trying to assign multiple values to a tag that
         // is not repeatable.
-        unsigned int nb_values = 0;
-        for(Exiv2::IptcMetadata::iterator iterator = _data->begin();
-            iterator != _data->end(); ++iterator)
+        const std::vector<long>* positions = image->iptcPositions(_key.key());
+        if (!_info->_repeatable && (positions != 0) && (positions->size() > 1))
         {
-            if (iterator->key() == key)
-            {
-                ++nb_values;
-                if (!_repeatable && (nb_values > 1))
-                {
-                    throw Exiv2::Error(NON_REPEATABLE);
-                }
-            }
+            throw Exiv2::Error(NON_REPEATABLE);
         }
     }
 }
@@ -730,64 +1888,73 @@ IptcTag::~IptcTag()
     }
 }
 
+std::vector<long> IptcTag::_positions()
+{
+    if (_image != 0)
+    {
+        const std::vector<long>* positions = _image->iptcPositions(_key.key());
+        return (positions != 0) ? *positions : std::vector<long>();
+    }
+    // The data of a tag of its own holds only the datums of the tag.
+    std::vector<long> positions;
+    for (long position = 0; position < _data->count(); ++position)
+    {
+        positions.push_back(position);
+    }
+    return positions;
+}
+
 void IptcTag::setRawValues(const boost::python::list& values)
 {
-    if (!_repeatable && (boost::python::len(values) > 1))
+    if (!_info->_repeatable && (boost::python::len(values) > 1))
     {
         // The tag is not repeatable but we are trying to assign it more than
         // one value.
         throw Exiv2::Error(NON_REPEATABLE);
     }
 
+    const std::vector<long> positions = _positions();
+    const unsigned int max = boost::python::len(values);
     unsigned int index = 0;
-    unsigned int max = boost::python::len(values);
-    Exiv2::IptcMetadata::iterator iterator = _data->findKey(_key);
-    while (index < max)
+    // Override the existing values
+    for (; (index < max) && (index < positions.size()); ++index)
     {
-        std::string value = boost::python::extract<std::string>(values[index++]);
-        if (iterator != _data->end())
+        std::string value = boost::python::extract<std::string>(values[index]);
+        Exiv2::IptcMetadata::iterator datum = _data->begin() + positions[index];
+        int result = datum->setValue(value);
+        if (result != 0)
         {
-            // Override an existing value
-            int result = iterator->setValue(value);
-            if (result != 0)
-            {
-                throw Exiv2::Error(INVALID_VALUE);
-            }
-            // Jump to the next datum matching the key
-            ++iterator;
-            while ((iterator != _data->end()) && (iterator->key() != _key.key()))
-            {
-                ++iterator;
-            }
+            throw Exiv2::Error(INVALID_VALUE);
         }
-        else
+    }
+    // Append the new values
+    for (; index < max; ++index)
+    {
+        std::string value = boost::python::extract<std::string>(values[index]);
+        Exiv2::Iptcdatum datum(_key);
+        int result = datum.setValue(value);
+        if (result != 0)
         {
-            // Append a new value
-            Exiv2::Iptcdatum datum(_key);
-            int result = datum.setValue(value);
-            if (result != 0)
-            {
-                throw Exiv2::Error(INVALID_VALUE);
-            }
-            int state = _data->add(datum);
-            if (state == 6)
-            {
-                throw Exiv2::Error(NON_REPEATABLE);
-            }
-            // Reset iterator that has been invalidated by appending a datum
-            iterator = _data->end();
+            throw Exiv2::Error(INVALID_VALUE);
+        }
+        int state = _data->add(datum);
+        if (state == 6)
+        {
+            throw Exiv2::Error(NON_REPEATABLE);
+        }
+        if (_image != 0)
+        {
+            _image->iptcDatumAppended(_key.key());
         }
     }
     // Erase the remaining values if any
-    while (iterator != _data->end())
+    if (positions.size() > max)
     {
-        if (iterator->key() == _key.key())
+        erasePositions(_data,
+            std::vector<long>(positions.begin() + max, positions.end()));
+        if (_image != 0)
         {
-            iterator = _data->erase(iterator);
-        }
-        else
-        {
-            ++iterator;
+            _image->invalidateIptcIndex();
         }
     }
 }
@@ -806,6 +1973,7 @@ void IptcTag::setParentImage(Image& image)
     delete _data;
     _from_data = true;
     _data = data;
+    _image = &image;
     setRawValues(values);
 }
 
@@ -816,54 +1984,53 @@ const std::string IptcTag::getKey()
 
 const std::string IptcTag::getType()
 {
-    return _type;
+    return _info->_type;
 }
 
 const std::string IptcTag::getName()
 {
-    return _name;
+    return _info->_name;
 }
 
 const std::string IptcTag::getTitle()
 {
-    return _title;
+    return _info->_title;
 }
 
 const std::string IptcTag::getDescription()
 {
-    return _description;
+    return _info->_description;
 }
 
 const std::string IptcTag::getPhotoshopName()
 {
-    return _photoshopName;
+    return _info->_photoshopName;
 }
 
 const bool IptcTag::isRepeatable()
 {
-    return _repeatable;
+    return _info->_repeatable;
 }
 
 const std::string IptcTag::getRecordName()
 {
-    return _recordName;
+    return _info->_recordName;
 }
 
 const std::string IptcTag::getRecordDescription()
 {
-    return _recordDescription;
+    return _info->_recordDescription;
 }
 
 const boost::python::list IptcTag::getRawValues()
 {
+    const std::vector<long> positions = _positions();
     boost::python::list values;
-    for(Exiv2::IptcMetadata::iterator iterator = _data->begin();
-        iterator != _data->end(); ++iterator)
+    for (std::vector<long>::const_iterator position = positions.begin();
+         position != positions.end();
+         ++position)
     {
-        if (iterator->key() == _key.key())
-        {
-            values.append(iterator->toString());
-        }
+        values.append((_data->begin() + *position)->toString());
     }
     return values;
 }
@@ -872,6 +2039,7 @@ const boost::python::list IptcTag::getRawValues()
 XmpTag::XmpTag(const std::string& key, Exiv2::Xmpdatum* datum): _key(key)
 {
     _from_datum = (datum != 0);
+    _info = getXmpTagInfo(_key);
 
     if (_from_datum)
     {
@@ -881,26 +2049,7 @@ XmpTag::XmpTag(const std::string& key, Exiv2::Xmpdatum* datum): _key(key)
     else
     {
         _datum = new Exiv2::Xmpdatum(_key);
-        _exiv2_type = Exiv2::TypeInfo::typeName(Exiv2::XmpProperties::propertyType(_key));
-    }
-
-    const char* title = Exiv2::XmpProperties::propertyTitle(_key);
-    if (title != 0)
-    {
-        _title = title;
-    }
-
-    const char* description = Exiv2::XmpProperties::propertyDesc(_key);
-    if (description != 0)
-    {
-        _description = description;
-    }
-
-    const Exiv2::XmpPropertyInfo* info = Exiv2::XmpProperties::propertyInfo(_key);
-    if (info != 0)
-    {
-        _name = info->name_;
-        _type = info->xmpValueType_;
+        _exiv2_type = _info->_exiv2_type;
     }
 }
 
@@ -947,7 +2096,7 @@ void XmpTag::setLangAltValue(const boost::python::dict& values)
 
 void XmpTag::setParentImage(Image& image)
 {
-    Exiv2::Xmpdatum* datum = &(*image.getXmpData())[_key.key()];
+    Exiv2::Xmpdatum* datum = image.xmpDatum(_key.key());
     if (datum == _datum)
     {
         // The parent image is already the one passed as a parameter.
@@ -958,7 +2107,7 @@ void XmpTag::setParentImage(Image& image)
     Exiv2::Value::AutoPtr value = _datum->getValue();
     delete _datum;
     _from_datum = true;
-    _datum = &(*image.getXmpData())[_key.key()];
+    _datum = datum;
     _datum->setValue(value.get());
 }
 
@@ -974,22 +2123,22 @@ const std::string XmpTag::getExiv2Type()
 
 const std::string XmpTag::getType()
 {
-    return _type;
+    return _info->_type;
 }
 
 const std::string XmpTag::getName()
 {
-    return _name;
+    return _info->_name;
 }
 
 const std::string XmpTag::getTitle()
 {
-    return _title;
+    return _info->_title;
 }
 
 const std::string XmpTag::getDescription()
 {
-    return _description;
+    return _info->_description;
 }
 
 const std::string XmpTag::getTextValue()
@@ -1024,34 +2173,14 @@ const boost::python::dict XmpTag::getLangAltValue()
 }
 
 
-Preview::Preview(const Exiv2::PreviewImage& previewImage)
-{
-    _mimeType = previewImage.mimeType();
-    _extension = previewImage.extension();
-    _size = previewImage.size();
-    _dimensions = boost::python::make_tuple(previewImage.width(),
-                                            previewImage.height());
-    // Copy the data buffer in a string. Since the data buffer can contain null
-    // characters ('\x00'), the string cannot be simply constructed like that:
-    //     _data = std::string((char*) previewImage.pData());
-    // because it would be truncated after the first occurence of a null
-    // character. Therefore, it has to be copied character by character.
-    const Exiv2::byte* pData = previewImage.pData();
-    // First allocate the memory for the whole string...
-    _data = std::string(_size, ' ');
-    // ... then fill it with the raw data.
-    for(unsigned int i = 0; i < _size; ++i)
-    {
-        _data[i] = pData[i];
-    }
-}
-
-void Preview::writeToFile(const std::string& path) const
+Preview::Preview(const Exiv2::PreviewProperties& properties):
+    _properties(properties)
 {
-    std::string filename = path + _extension;
-    std::ofstream fd(filename.c_str(), std::ios::out | std::ios::binary);
-    fd << _data;
-    fd.close();
+    _mimeType = properties.mimeType_;
+    _extension = properties.extension_;
+    _size = properties.size_;
+    _dimensions = boost::python::make_tuple(properties.width_,
+                                            properties.height_);
 }
 
 
@@ -1327,8 +2456,35 @@ void translateExiv2Error(Exiv2::Error const& error)
 }
 
 
+// Serialize the accesses of the XMP toolkit to its global data, as allowed
+// by Exiv2::XmpParser::initialize().
+static Mutex xmpToolkitMutex;
+
+static void lockXmpToolkit(void* data, bool lock)
+{
+    if (lock)
+    {
+        LOCK_MUTEX(*(Mutex*) data);
+    }
+    else
+    {
+        UNLOCK_MUTEX(*(Mutex*) data);
+    }
+}
+
+void initializeThreadSafety()
+{
+    INIT_RWLOCK(xmpNsLock);
+    INIT_MUTEX(xmpToolkitMutex);
+#if EXIV2_TEST_VERSION(0,21,0)
+    Exiv2::XmpParser::initialize(lockXmpToolkit, &xmpToolkitMutex);
+#endif
+}
+
 void registerXmpNs(const std::string& name, const std::string& prefix)
 {
+    XmpNsWriteLock lock;
+
     try
     {
         const std::string& ns = Exiv2::XmpProperties::ns(prefix);
@@ -1338,6 +2494,7 @@ void registerXmpNs(const std::string& name, const std::string& prefix)
         // No namespace exists with the requested prefix, it is safe to
         // register a new one.
         Exiv2::XmpProperties::registerNs(name, prefix);
+        clearXmpTagInfoCache();
         return;
     }
     throw Exiv2::Error(EXISTING_PREFIX, prefix);
@@ -1345,10 +2502,13 @@ void registerXmpNs(const std::string& name, const std::string& prefix)
 
 void unregisterXmpNs(const std::string& name)
 {
+    XmpNsWriteLock lock;
+
     const std::string& prefix = Exiv2::XmpProperties::prefix(name);
     if (prefix != "")
     {
         Exiv2::XmpProperties::unregisterNs(name);
+        clearXmpTagInfoCache();
         try
         {
             const Exiv2::XmpNsInfo* info = Exiv2::XmpProperties::nsInfo(prefix);
@@ -1369,8 +2529,11 @@ void unregisterXmpNs(const std::string& name)
 
 void unregisterAllXmpNs()
 {
+    XmpNsWriteLock lock;
+
     // Unregister all custom namespaces.
     Exiv2::XmpProperties::unregisterNs();
+    clearXmpTagInfoCache();
 }
 
 } // End of namespace exiv2wrapper
@@ -26,18 +26,82 @@
 #ifndef __exiv2wrapper__
 #define __exiv2wrapper__
 
+#include <memory>
+#include <set>
 #include <string>
+#include <vector>
 
 #include "exiv2/image.hpp"
 #include "exiv2/preview.hpp"
 
 #include "boost/python.hpp"
+#include "boost/shared_ptr.hpp"
+#include "boost/unordered_map.hpp"
 
 namespace exiv2wrapper
 {
 
 class Image;
 
+// A filter on metadata keys, built from a python sequence of keys. A key may
+// end with a '*' wildcard to match all the keys that start with the preceding
+// characters (e.g. 'Exif.GPSInfo.*'). A filter built from None matches all the
+// keys.
+class KeyFilter
+{
+public:
+    KeyFilter(const boost::python::object& keys);
+
+    bool matches(const std::string& key) const;
+
+private:
+    bool _all;
+    std::set<std::string> _keys;
+    std::vector<std::string> _prefixes;
+};
+
+// Static information about the tags, that only depends on their key.
+// It is computed once per key and shared by all the tag objects with that key
+// (see the get*TagInfo() functions in exiv2wrapper.cpp).
+
+struct ExifTagInfo
+{
+    std::string _type;
+    std::string _name;
+    std::string _label;
+    std::string _description;
+    std::string _sectionName;
+    std::string _sectionDescription;
+};
+
+typedef boost::shared_ptr<const ExifTagInfo> ExifTagInfoPtr;
+
+struct IptcTagInfo
+{
+    std::string _type;
+    std::string _name;
+    std::string _title;
+    std::string _description;
+    std::string _photoshopName;
+    bool _repeatable;
+    std::string _recordName;
+    std::string _recordDescription;
+};
+
+typedef boost::shared_ptr<const IptcTagInfo> IptcTagInfoPtr;
+
+struct XmpTagInfo
+{
+    std::string _exiv2_type;
+    std::string _type;
+    std::string _name;
+    std::string _title;
+    std::string _description;
+};
+
+typedef boost::shared_ptr<const XmpTagInfo> XmpTagInfoPtr;
+
+
 class ExifTag
 {
 public:
@@ -49,6 +113,11 @@ public:
     ~ExifTag();
 
     void setRawValue(const std::string& value);
+    // Set the value from a list of numbers (ints, or (numerator, denominator)
+    // tuples for rationals), without going through its string representation.
+    void setValues(const boost::python::list& values);
+    // Set the value from its raw bytes, for the Undefined and Byte types.
+    void setData(const std::string& data);
     void setParentImage(Image& image);
 
     const std::string getKey();
@@ -59,19 +128,22 @@ public:
     const std::string getSectionName();
     const std::string getSectionDescription();
     const std::string getRawValue();
+    // Return the value as a list of numbers, or None if it is not a list of
+    // (short, long or rational) numbers.
+    boost::python::object getValues();
+    // Return the raw bytes of the value as a string, or None if it is not a
+    // value of the Undefined or Byte types.
+    boost::python::object getData();
     const std::string getHumanValue();
     int getByteOrder();
+    int getTag();
 
 private:
     Exiv2::ExifKey _key;
     Exiv2::Exifdatum* _datum;
     Exiv2::ExifData* _data;
+    ExifTagInfoPtr _info;
     std::string _type;
-    std::string _name;
-    std::string _label;
-    std::string _description;
-    std::string _sectionName;
-    std::string _sectionDescription;
     int _byteOrder;
 };
 
@@ -80,7 +152,9 @@ class IptcTag
 {
 public:
     // Constructor
-    IptcTag(const std::string& key, Exiv2::IptcData* data=0);
+    // A tag instantiated from an image reads and writes its values directly
+    // in the IPTC data of the image.
+    IptcTag(const std::string& key, Image* image=0);
 
     ~IptcTag();
 
@@ -102,14 +176,11 @@ private:
     Exiv2::IptcKey _key;
     bool _from_data; // whether the tag is built from an existing IptcData
     Exiv2::IptcData* _data;
-    std::string _type;
-    std::string _name;
-    std::string _title;
-    std::string _description;
-    std::string _photoshopName;
-    bool _repeatable;
-    std::string _recordName;
-    std::string _recordDescription;
+    Image* _image; // the image the data belongs to, if any
+    IptcTagInfoPtr _info;
+
+    // Return the positions of the datums of the tag in the data.
+    std::vector<long> _positions();
 };
 
 
@@ -140,26 +211,23 @@ private:
     Exiv2::XmpKey _key;
     bool _from_datum; // whether the tag is built from an existing Xmpdatum
     Exiv2::Xmpdatum* _datum;
+    XmpTagInfoPtr _info;
     std::string _exiv2_type;
-    std::string _type;
-    std::string _name;
-    std::string _title;
-    std::string _description;
 };
 
 
+// The properties of a preview image. The data of the preview is extracted from
+// the image only on demand (see Image::getPreviewData).
 class Preview
 {
 public:
-    Preview(const Exiv2::PreviewImage& previewImage);
-
-    void writeToFile(const std::string& path) const;
+    Preview(const Exiv2::PreviewProperties& properties);
 
     std::string _mimeType;
     std::string _extension;
     unsigned int _size;
     boost::python::tuple _dimensions;
-    std::string _data;
+    Exiv2::PreviewProperties _properties;
 };
 
 
@@ -168,7 +236,10 @@ class Image
 public:
     // Constructors
     Image(const std::string& filename);
-    Image(const std::string& buffer, unsigned long size);
+    // Instantiate an image from any python object that supports the buffer
+    // interface. A read-only buffer is used in place (no copy of the data),
+    // any other buffer is copied once.
+    Image(boost::python::object buffer, unsigned long size);
     Image(const Image& image);
 
     ~Image();
@@ -188,8 +259,11 @@ public:
     // libexiv2's documentation (http://exiv2.org/tags.html).
 
     // Return a list of all the keys of available EXIF tags set in the
-    // image.
-    boost::python::list exifKeys();
+    // image. The optional filter is a sequence of keys and wildcard patterns
+    // (see KeyFilter) that restricts the keys returned, here and in the other
+    // *Keys() and *Items() methods.
+    boost::python::list exifKeys(
+        const boost::python::object& filter=boost::python::object());
 
     // Return the required EXIF tag.
     // Throw an exception if the tag is not set.
@@ -199,6 +273,11 @@ public:
     // Throw an exception if the tag was not set.
     void deleteExifTag(std::string key);
 
+    // Return a list of (key, type, raw value) tuples for all the EXIF tags
+    // set in the image, without instantiating intermediate tag objects.
+    boost::python::list exifItems(
+        const boost::python::object& filter=boost::python::object());
+
     // Read and write access to the IPTC tags.
     // For a complete list of the available IPTC tags, see
     // libexiv2's documentation (http://exiv2.org/iptc.html).
@@ -206,7 +285,8 @@ public:
     // Returns a list of all the keys of available IPTC tags set in the
     // image. This list has no duplicates: each of its items is unique,
     // even if a tag is present more than once.
-    boost::python::list iptcKeys();
+    boost::python::list iptcKeys(
+        const boost::python::object& filter=boost::python::object());
 
     // Return the required IPTC tag.
     // Throw an exception if the tag is not set.
@@ -216,7 +296,15 @@ public:
     // Throw an exception if the tag was not set.
     void deleteIptcTag(std::string key);
 
-    boost::python::list xmpKeys();
+    // Return a list of (key, type, raw values) tuples for all the IPTC tags
+    // set in the image. The repetitions of a tag are grouped in a list of raw
+    // values, in the order in which they appear.
+    boost::python::list iptcItems(
+        const boost::python::object& filter=boost::python::object());
+
+    // Return a list of all the keys of available XMP tags set in the image.
+    boost::python::list xmpKeys(
+        const boost::python::object& filter=boost::python::object());
 
     // Return the required XMP tag.
     // Throw an exception if the tag is not set.
@@ -226,6 +314,13 @@ public:
     // Throw an exception if the tag was not set.
     void deleteXmpTag(std::string key);
 
+    // Return a list of (key, type, raw value) tuples for all the XMP tags set
+    // in the image. The type is the Exiv2 type of the value (XmpText, XmpAlt,
+    // XmpBag, XmpSeq or LangAlt) and the raw value is respectively a string, a
+    // list of strings or a dictionary.
+    boost::python::list xmpItems(
+        const boost::python::object& filter=boost::python::object());
+
     // Comment
     const std::string getComment() const;
     void setComment(const std::string& comment);
@@ -233,12 +328,20 @@ public:
 
     // Read access to the thumbnail embedded in the image.
     boost::python::list previews();
+    // Extract the data of a preview.
+    boost::python::object getPreviewData(const Preview& preview);
+    void writePreviewToFile(const Preview& preview, const std::string& path);
+    // Write the data of a preview to a file descriptor or a python file
+    // object.
+    void writePreviewToFileObject(const Preview& preview,
+                                  boost::python::object file);
 
     // Manipulate the JPEG/TIFF thumbnail embedded in the EXIF data.
     const std::string getExifThumbnailMimeType();
     const std::string getExifThumbnailExtension();
     void writeExifThumbnailToFile(const std::string& path);
-    const std::string getExifThumbnailData();
+    void writeExifThumbnailToFileObject(boost::python::object file);
+    const boost::python::object getExifThumbnailData();
     void eraseExifThumbnail();
     void setExifThumbnailFromFile(const std::string& path);
     void setExifThumbnailFromData(const std::string& data);
@@ -247,20 +350,41 @@ public:
     void copyMetadata(Image& other, bool exif=true, bool iptc=true, bool xmp=true) const;
 
     // Return the image data buffer.
-    std::string getDataBuffer() const;
+    boost::python::object getDataBuffer() const;
 
     // Accessors
     Exiv2::ExifData* getExifData() { return _exifData; };
     Exiv2::IptcData* getIptcData() { return _iptcData; };
     Exiv2::XmpData* getXmpData() { return _xmpData; };
 
+    // Return the EXIF or XMP datum with the given (canonical) key, adding it
+    // if it is not set yet. Tags attach themselves to an image through these
+    // methods, which keep the indexes of the datums up to date.
+    Exiv2::Exifdatum* exifDatum(const std::string& key);
+    Exiv2::Xmpdatum* xmpDatum(const std::string& key);
+
+    // Return the positions of the IPTC datums with the given (canonical) key,
+    // in order, or 0 if there is none. The positions remain valid until IPTC
+    // datums are erased.
+    const std::vector<long>* iptcPositions(const std::string& key);
+    // To be called by the tags that append an IPTC datum to the data, or
+    // erase IPTC datums from it.
+    void iptcDatumAppended(const std::string& key);
+    void invalidateIptcIndex() { _iptcIndexed = false; };
+
     Exiv2::ByteOrder getByteOrder() const;
 
     const std::string getIptcCharset() const;
 
 private:
     std::string _filename;
+    // The image data when the image is instantiated from a buffer, which is
+    // either a copy owned by the image (_data) or a view on the memory of a
+    // read-only python buffer (_view).
+    const Exiv2::byte* _buffer;
     Exiv2::byte* _data;
+    Py_buffer _view;
+    bool _holdsView;
     long _size;
     Exiv2::Image::AutoPtr _image;
     Exiv2::ExifData* _exifData;
@@ -268,12 +392,55 @@ private:
     Exiv2::XmpData* _xmpData;
     Exiv2::ExifThumb* _exifThumbnail;
     Exiv2::ExifThumb* _getExifThumbnail();
+    // Copy the data of the EXIF thumbnail, releasing the GIL.
+    Exiv2::DataBuf _copyExifThumbnail();
 
     // true if the image's internal metadata has already been read,
     // false otherwise
     bool _dataRead;
 
+    // Indexes of the datums by key, so that looking up a tag doesn't take a
+    // linear search through the metadata. They are built on the first lookup
+    // after the metadata was read, or after they were invalidated by a change
+    // that the image cannot keep track of.
+    // The EXIF datums are stored in a list, whose iterators remain valid as
+    // long as the datums are not erased. The IPTC and XMP datums are stored
+    // in vectors, they are indexed by position. The index of each EXIF and
+    // XMP key is its first datum. IPTC tags are repeatable, the datums of
+    // each IPTC key are grouped, and the keys are kept in the order of their
+    // first datum.
+    typedef boost::unordered_map<std::string, Exiv2::ExifMetadata::iterator>
+        ExifIndex;
+    typedef boost::unordered_map<std::string, long> PositionIndex;
+    typedef boost::unordered_map<std::string, std::vector<long> > GroupIndex;
+    ExifIndex _exifIndex;
+    GroupIndex _iptcIndex;
+    std::vector<std::string> _iptcKeys;
+    PositionIndex _xmpIndex;
+    bool _exifIndexed;
+    bool _iptcIndexed;
+    bool _xmpIndexed;
+    // Whether several EXIF datums have the same key
+    bool _exifDuplicates;
+    // Whether several XMP datums have the same key
+    bool _xmpDuplicates;
+
+    void _invalidateIndexes();
+    // Return the first EXIF datum with the given key, or the end of the data.
+    Exiv2::ExifMetadata::iterator _findExifDatum(const std::string& key);
+    // Group the IPTC datums by key, if not done already.
+    void _groupIptcData();
+    // Return the position of the first XMP datum with the given key, or -1.
+    long _findXmpDatum(const std::string& key);
+
     void _instantiate_image();
+
+    // Extract a preview image, releasing the GIL.
+    std::auto_ptr<Exiv2::PreviewImage> _getPreviewImage(const Preview& preview);
+
+    // Make the image data independent from the python buffer it was
+    // instantiated from, if any.
+    void _detachBuffer();
 };
 
 
@@ -281,7 +448,13 @@ private:
 void translateExiv2Error(Exiv2::Error const& error);
 
 
-// Functions to manipulate custom XMP namespaces
+// Initialize the locks of the wrapper, and the XMP toolkit so that it can be
+// used by several threads at a time. To be called once, before any other use
+// of libexiv2.
+void initializeThreadSafety();
+
+
+// Functions to manipulate custom XMP namespaces. They are thread-safe.
 void registerXmpNs(const std::string& name, const std::string& prefix);
 void unregisterXmpNs(const std::string& name);
 void unregisterAllXmpNs();
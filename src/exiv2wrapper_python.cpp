@@ -34,6 +34,13 @@ using namespace boost::python;
 
 using namespace exiv2wrapper;
 
+BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(exifKeys_overloads, Image::exifKeys, 0, 1)
+BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(exifItems_overloads, Image::exifItems, 0, 1)
+BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(iptcKeys_overloads, Image::iptcKeys, 0, 1)
+BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(iptcItems_overloads, Image::iptcItems, 0, 1)
+BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(xmpKeys_overloads, Image::xmpKeys, 0, 1)
+BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(xmpItems_overloads, Image::xmpItems, 0, 1)
+
 boost::python::tuple exiv2_version = \
     boost::python::make_tuple(EXIV2_MAJOR_VERSION,
                               EXIV2_MINOR_VERSION,
@@ -50,9 +57,13 @@ BOOST_PYTHON_MODULE(libexiv2python)
     // See https://bugs.launchpad.net/pyexiv2/+bug/507620.
     std::cerr.rdbuf(NULL);
 
+    initializeThreadSafety();
+
     class_<ExifTag>("_ExifTag", init<std::string>())
 
         .def("_setRawValue", &ExifTag::setRawValue)
+        .def("_setValues", &ExifTag::setValues)
+        .def("_setData", &ExifTag::setData)
         .def("_setParentImage", &ExifTag::setParentImage)
 
         .def("_getKey", &ExifTag::getKey)
@@ -63,8 +74,11 @@ BOOST_PYTHON_MODULE(libexiv2python)
         .def("_getSectionName", &ExifTag::getSectionName)
         .def("_getSectionDescription", &ExifTag::getSectionDescription)
         .def("_getRawValue", &ExifTag::getRawValue)
+        .def("_getValues", &ExifTag::getValues)
+        .def("_getData", &ExifTag::getData)
         .def("_getHumanValue", &ExifTag::getHumanValue)
         .def("_getByteOrder", &ExifTag::getByteOrder)
+        .def("_getTag", &ExifTag::getTag)
     ;
 
     class_<IptcTag>("_IptcTag", init<std::string>())
@@ -102,19 +116,16 @@ BOOST_PYTHON_MODULE(libexiv2python)
         .def("_getLangAltValue", &XmpTag::getLangAltValue)
     ;
 
-    class_<Preview>("_Preview", init<Exiv2::PreviewImage>())
+    class_<Preview>("_Preview", no_init)
 
         .def_readonly("mime_type", &Preview::_mimeType)
         .def_readonly("extension", &Preview::_extension)
         .def_readonly("size", &Preview::_size)
         .def_readonly("dimensions", &Preview::_dimensions)
-        .def_readonly("data", &Preview::_data)
-
-        .def("write_to_file", &Preview::writeToFile)
     ;
 
     class_<Image>("_Image", init<std::string>())
-        .def(init<std::string, long>())
+        .def(init<object, unsigned long>())
 
         .def("_readMetadata", &Image::readMetadata)
         .def("_writeMetadata", &Image::writeMetadata)
@@ -124,23 +135,29 @@ BOOST_PYTHON_MODULE(libexiv2python)
 
         .def("_getMimeType", &Image::mimeType)
 
-        .def("_exifKeys", &Image::exifKeys)
+        .def("_exifKeys", &Image::exifKeys, exifKeys_overloads())
         .def("_getExifTag", &Image::getExifTag)
         .def("_deleteExifTag", &Image::deleteExifTag)
+        .def("_exifItems", &Image::exifItems, exifItems_overloads())
 
-        .def("_iptcKeys", &Image::iptcKeys)
+        .def("_iptcKeys", &Image::iptcKeys, iptcKeys_overloads())
         .def("_getIptcTag", &Image::getIptcTag)
         .def("_deleteIptcTag", &Image::deleteIptcTag)
+        .def("_iptcItems", &Image::iptcItems, iptcItems_overloads())
 
-        .def("_xmpKeys", &Image::xmpKeys)
+        .def("_xmpKeys", &Image::xmpKeys, xmpKeys_overloads())
         .def("_getXmpTag", &Image::getXmpTag)
         .def("_deleteXmpTag", &Image::deleteXmpTag)
+        .def("_xmpItems", &Image::xmpItems, xmpItems_overloads())
 
         .def("_getComment", &Image::getComment)
         .def("_setComment", &Image::setComment)
         .def("_clearComment", &Image::clearComment)
 
         .def("_previews", &Image::previews)
+        .def("_getPreviewData", &Image::getPreviewData)
+        .def("_writePreviewToFile", &Image::writePreviewToFile)
+        .def("_writePreviewToFileObject", &Image::writePreviewToFileObject)
 
         .def("_copyMetadata", &Image::copyMetadata)
 
@@ -149,6 +166,8 @@ BOOST_PYTHON_MODULE(libexiv2python)
         .def("_getExifThumbnailMimeType", &Image::getExifThumbnailMimeType)
         .def("_getExifThumbnailExtension", &Image::getExifThumbnailExtension)
         .def("_writeExifThumbnailToFile", &Image::writeExifThumbnailToFile)
+        .def("_writeExifThumbnailToFileObject",
+             &Image::writeExifThumbnailToFileObject)
         .def("_getExifThumbnailData", &Image::getExifThumbnailData)
         .def("_eraseExifThumbnail", &Image::eraseExifThumbnail)
         .def("_setExifThumbnailFromFile", &Image::setExifThumbnailFromFile)
@@ -70,6 +70,18 @@ from pyexiv2.utils import FixedOffset, Rational, NotifyingList, \
                           GPSCoordinate
 
 
+def open_cached(path, maxsize=128, max_bytes=None):
+    """
+    Return the metadata of an image from a process-wide cache, see
+    :func:`pyexiv2.cache.open_cached`.
+
+    The cache module (and sqlite3) is only imported when this function is
+    first called.
+    """
+    from pyexiv2.cache import open_cached
+    return open_cached(path, maxsize, max_bytes)
+
+
 def _make_version(version_info):
     return '.'.join([str(i) for i in version_info])
 
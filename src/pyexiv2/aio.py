@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+"""
+An asynchronous front-end to pyexiv2, for asyncio event loops.
+
+The blocking operations (opening and reading images, writing their metadata,
+extracting their previews) are run in a bounded pool of threads, and return
+asyncio futures that can be awaited (or yielded from in a coroutine) without
+blocking the event loop. libexiv2python releases the GIL during those
+operations, so that they actually run concurrently.
+
+This module requires asyncio and concurrent.futures (on python 2, their
+trollius and futures backports).
+"""
+
+import os
+import functools
+import collections
+import threading
+import multiprocessing
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from pyexiv2.metadata import ImageMetadata
+
+
+try:
+    _StopAsyncIteration = StopAsyncIteration
+except NameError:
+    _StopAsyncIteration = StopIteration
+
+
+_executor = None
+
+
+def _default_executor():
+    # The pool of threads shared by all the operations that are not given an
+    # explicit executor, created on first use.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(multiprocessing.cpu_count())
+    return _executor
+
+
+def _open(cls, path, metadata_only, executor, loop):
+    # Read the metadata of an image, in a worker thread.
+    metadata = ImageMetadata(path, metadata_only=metadata_only)
+    metadata.read()
+    return cls(metadata, executor, loop)
+
+
+def _read_previews(metadata):
+    return metadata.previews
+
+
+class AsyncImageMetadata(object):
+
+    """
+    An asynchronous wrapper around :class:`pyexiv2.metadata.ImageMetadata`.
+
+    Instances are obtained with :meth:`open`. The tags are accessed as with
+    an ImageMetadata, as this doesn't block. The blocking operations return
+    futures instead of results.
+    """
+
+    def __init__(self, metadata, executor=None, loop=None):
+        """
+        :param metadata: the metadata to wrap, already read
+        :type metadata: :class:`pyexiv2.metadata.ImageMetadata`
+        :param executor: the executor to run the blocking operations in,
+                         defaults to a shared pool of as many threads as there
+                         are CPUs
+        :type executor: :class:`concurrent.futures.Executor`
+        :param loop: the event loop, defaults to the current event loop
+        :type loop: :class:`asyncio.AbstractEventLoop`
+        """
+        self.metadata = metadata
+        self._executor = executor
+        self._loop = loop
+
+    @classmethod
+    def open(cls, path, metadata_only=False, executor=None, loop=None):
+        """
+        Open an image and read its metadata.
+
+        :param path: path to an image file
+        :type path: string
+        :param metadata_only: whether to read only the metadata of the image
+                              (see :class:`pyexiv2.metadata.ImageMetadata`)
+        :type metadata_only: boolean
+        :param executor: the executor to run the blocking operations in
+        :type executor: :class:`concurrent.futures.Executor`
+        :param loop: the event loop, defaults to the current event loop
+        :type loop: :class:`asyncio.AbstractEventLoop`
+
+        :return: a future whose result is an :class:`AsyncImageMetadata`
+        :rtype: :class:`asyncio.Future`
+        """
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        return loop.run_in_executor(executor or _default_executor(),
+                                    _open, cls, path, metadata_only, executor,
+                                    loop)
+
+    def _run(self, function, *args):
+        # Run a blocking function in the executor.
+        loop = self._loop or asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor or _default_executor(),
+                                    function, *args)
+
+    def write(self, preserve_timestamps=False, in_place=False):
+        """
+        Write the metadata back to the image
+        (see :meth:`pyexiv2.metadata.ImageMetadata.write`).
+
+        :return: a future whose result is None
+        :rtype: :class:`asyncio.Future`
+        """
+        return self._run(functools.partial(self.metadata.write,
+                                           preserve_timestamps, in_place))
+
+    def previews(self):
+        """
+        List the previews available in the image. Their data is extracted
+        when accessed, use :meth:`preview_data` to do that asynchronously.
+
+        :return: a future whose result is a list of
+                 :class:`pyexiv2.preview.Preview`
+        :rtype: :class:`asyncio.Future`
+        """
+        return self._run(_read_previews, self.metadata)
+
+    def preview_data(self, preview):
+        """
+        Extract the data of a preview.
+
+        :param preview: one of the previews of the image
+        :type preview: :class:`pyexiv2.preview.Preview`
+
+        :return: a future whose result is the data of the preview
+        :rtype: :class:`asyncio.Future`
+        """
+        return self._run(getattr, preview, 'data')
+
+    def __getattr__(self, name):
+        # Everything else is delegated to the wrapped metadata.
+        return getattr(self.metadata, name)
+
+    def __getitem__(self, key):
+        return self.metadata[key]
+
+    def __setitem__(self, key, tag_or_value):
+        self.metadata[key] = tag_or_value
+
+    def __delitem__(self, key):
+        del self.metadata[key]
+
+    def __iter__(self):
+        return iter(self.metadata)
+
+    def __len__(self):
+        return len(self.metadata)
+
+
+class _Scan(object):
+
+    # An asynchronous iterator over the metadata of the images in a directory.
+    # Each step, run in the executor, takes the next path and reads its
+    # metadata. At most max_pending steps are in flight.
+
+    def __init__(self, directory, extensions, metadata_only, executor, loop,
+                 max_pending):
+        self._walk = os.walk(directory)
+        self._extensions = extensions
+        self._metadata_only = metadata_only
+        self._executor = executor
+        self._loop = loop
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._paths = collections.deque()
+        self._pending = collections.deque()
+        self._exhausted = False
+
+    def _next_path(self):
+        # Return the next path to read, or None when there is none left.
+        self._lock.acquire()
+        try:
+            while not self._paths:
+                try:
+                    directory, dirnames, filenames = next(self._walk)
+                except StopIteration:
+                    return None
+                for filename in sorted(filenames):
+                    extension = os.path.splitext(filename)[1].lower()
+                    if self._extensions is None or \
+                            extension in self._extensions:
+                        self._paths.append(os.path.join(directory, filename))
+            return self._paths.popleft()
+        finally:
+            self._lock.release()
+
+    def _step(self):
+        path = self._next_path()
+        if path is None:
+            return None
+        try:
+            return path, _open(AsyncImageMetadata, path, self._metadata_only,
+                               self._executor, self._loop)
+        except Exception as error:
+            return path, error
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        result = asyncio.Future(loop=self._loop)
+        self._next(result, True)
+        return result
+
+    def next(self):
+        # For the coroutines that cannot use async for (e.g. with trollius):
+        # return a future whose result is the next (path, result) tuple, or
+        # None when all the images were read.
+        result = asyncio.Future(loop=self._loop)
+        self._next(result, False)
+        return result
+
+    def _next(self, result, stop):
+        # Hand the result of the next step to a future. Once all the images
+        # were read, raise StopAsyncIteration in the future if stop is true,
+        # give it a None result otherwise.
+        while not self._exhausted and len(self._pending) < self._max_pending:
+            self._pending.append(self._loop.run_in_executor(
+                self._executor or _default_executor(), self._step))
+        if not self._pending:
+            if stop:
+                result.set_exception(_StopAsyncIteration())
+            else:
+                result.set_result(None)
+            return
+        step = self._pending.popleft()
+        step.add_done_callback(lambda step: self._done(step, result, stop))
+
+    def _done(self, step, result, stop):
+        if result.cancelled():
+            return
+        if step.cancelled():
+            result.cancel()
+        elif step.exception() is not None:
+            result.set_exception(step.exception())
+        elif step.result() is None:
+            # No paths left, but the steps still pending may have taken some.
+            self._exhausted = True
+            self._next(result, stop)
+        else:
+            result.set_result(step.result())
+
+
+def scan(directory, extensions=None, metadata_only=True, executor=None,
+         loop=None, max_pending=None):
+    """
+    Read the metadata of all the images in a directory and its
+    subdirectories, asynchronously.
+
+    The returned object is an asynchronous iterator (to be used with
+    ``async for``), which yields (path, result) tuples in no particular
+    order, where the result is either an :class:`AsyncImageMetadata` or the
+    exception raised when reading the image. At most ``max_pending`` images
+    are being read at any given time.
+
+    Where ``async for`` is not available (e.g. with trollius on python 2),
+    its ``next`` method returns a future whose result is the next tuple, or
+    None once all the images were read::
+
+        @trollius.coroutine
+        def read_all(directory):
+            images = aio.scan(directory)
+            while True:
+                item = yield trollius.From(images.next())
+                if item is None:
+                    break
+                path, result = item
+                ...
+
+    :param directory: the directory to scan
+    :type directory: string
+    :param extensions: the extensions of the files to read, with a leading
+                       dot (e.g. ``.jpg``), case insensitive, defaults to all
+                       the files
+    :type extensions: iterable of strings
+    :param metadata_only: whether to read only the metadata of the images
+    :type metadata_only: boolean
+    :param executor: the executor to run the blocking operations in
+    :type executor: :class:`concurrent.futures.Executor`
+    :param loop: the event loop, defaults to the current event loop
+    :type loop: :class:`asyncio.AbstractEventLoop`
+    :param max_pending: the maximum number of images being read at any given
+                        time, defaults to twice the number of CPUs
+    :type max_pending: int
+
+    :return: an asynchronous iterator over (path, result) tuples
+    """
+    if extensions is not None:
+        extensions = frozenset([extension.lower() for extension in extensions])
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    if max_pending is None:
+        max_pending = 2 * multiprocessing.cpu_count()
+    return _Scan(directory, extensions, metadata_only, executor, loop,
+                 max_pending)
@@ -0,0 +1,724 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+"""
+Parallel processing of the metadata of large numbers of images.
+
+libexiv2python releases the GIL while opening images and reading or writing
+their metadata, so that several threads can do that concurrently. Processes
+can be used instead to also parallelize the conversion of the values.
+"""
+
+import os
+import datetime
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import multiprocessing.queues
+import itertools
+import Queue
+import cPickle
+
+from pyexiv2.metadata import ImageMetadata, _FAMILIES
+from pyexiv2.exif import ExifTag
+from pyexiv2.iptc import IptcTag
+from pyexiv2.xmp import XmpTag, register_namespace
+
+
+# How long to wait for a result before checking whether a worker process was
+# lost, in seconds. Waiting with a timeout also keeps the iteration
+# interruptible with Ctrl-C.
+_POLL_INTERVAL = 0.5
+
+# In a worker process, the queue on which it announces the tasks it starts.
+_started = None
+
+# The tokens identifying the tasks run by the pools of processes.
+_tokens = itertools.count()
+
+
+def _warm():
+    # Instantiate and convert a tag of each family, so that the tables of
+    # libexiv2 and the python modules involved are loaded before the first
+    # image is processed.
+    ExifTag('Exif.Image.DateTime', datetime.datetime(2012, 1, 1)).raw_value
+    IptcTag('Iptc.Application2.Keywords', ['pyexiv2']).raw_value
+    XmpTag('Xmp.dc.subject', ['pyexiv2']).raw_value
+
+
+def worker_init(namespaces=None, warm=True):
+    """
+    Initialize a worker process, to be used as the initializer of a
+    :class:`multiprocessing.Pool` whose workers process images::
+
+        namespaces = {'http://example.com/ns/': 'ex'}
+        pool = multiprocessing.Pool(initializer=worker_init,
+                                    initargs=(namespaces,))
+
+    The pools of processes of this module use it already.
+
+    :param namespaces: custom XMP namespaces to register (see
+                       :func:`pyexiv2.xmp.register_namespace`), the
+                       namespaces already registered (e.g. inherited from
+                       the parent process) are skipped
+    :type namespaces: dict mapping names to prefixes, or iterable of
+                      (name, prefix) tuples
+    :param warm: whether to initialize libexiv2 beforehand, rather than when
+                 processing the first image
+    :type warm: boolean
+    """
+    if namespaces is not None:
+        if hasattr(namespaces, 'iteritems'):
+            namespaces = namespaces.iteritems()
+        for name, prefix in namespaces:
+            try:
+                register_namespace(name, prefix)
+            except KeyError:
+                # Already registered
+                pass
+    if warm:
+        _warm()
+
+
+def _init_worker(started, namespaces=None, warm=True):
+    # Initialize a worker process of a pool of this module, which announces
+    # the tasks it starts on the given queue.
+    global _started
+    _started = started
+    worker_init(namespaces, warm)
+
+
+def _read_values(path, keys):
+    # Read the metadata of an image and return a dictionary mapping keys to
+    # the values of the corresponding tags.
+    metadata = ImageMetadata(path, metadata_only=True)
+    metadata.read(keys=keys)
+    values = {}
+    for key in metadata:
+        tag = metadata[key]
+        try:
+            value = tag.value
+        except (ValueError, NotImplementedError):
+            # Fall back on the raw value when it cannot be converted.
+            value = tag.raw_value
+        if isinstance(value, list):
+            # Do not hand out notifying lists, they keep a reference to
+            # their tag.
+            value = list(value)
+        values[key] = value
+    return values
+
+
+def _read(task):
+    # Read the values for one image, never raises.
+    path, keys = task
+    try:
+        return path, _read_values(path, keys)
+    except Exception, error:
+        return path, error
+
+
+def _read_raw(task):
+    # Read the raw metadata of one image, never raises.
+    path, keys = task
+    try:
+        metadata = ImageMetadata(path, metadata_only=True)
+        metadata.read(keys=keys)
+        items = {}
+        for family in _FAMILIES:
+            items[family] = metadata.items_raw(family)
+        return path, items
+    except Exception, error:
+        return path, error
+
+
+def _fsync(path):
+    # Flush a file or a directory to disk.
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _apply(metadata, values):
+    # Set (or delete, for None values) tags, return whether this modified the
+    # metadata.
+    for key, value in values.iteritems():
+        if value is not None:
+            metadata[key] = value
+        elif key in metadata:
+            del metadata[key]
+    return metadata.modified
+
+
+def _write_values(path, values, sync, tmpdir, atomic):
+    # Apply the updates to the metadata of an image, return whether the image
+    # was modified.
+    if not atomic:
+        metadata = ImageMetadata(path)
+        metadata.read()
+        if not _apply(metadata, values):
+            return False
+        metadata.write(in_place=True)
+        if sync:
+            _fsync(path)
+        return True
+    # Only copy the image if the updates modify its metadata.
+    metadata = ImageMetadata(path, metadata_only=True)
+    metadata.read()
+    if not _apply(metadata, values):
+        return False
+    directory = os.path.dirname(os.path.abspath(path))
+    if tmpdir is None:
+        tmpdir = directory
+    fd, temp = tempfile.mkstemp(prefix='.pyexiv2-', dir=tmpdir)
+    os.close(fd)
+    try:
+        shutil.copyfile(path, temp)
+        shutil.copymode(path, temp)
+        metadata = ImageMetadata(temp)
+        metadata.read()
+        _apply(metadata, values)
+        metadata.write()
+        if sync:
+            _fsync(temp)
+        os.rename(temp, path)
+    except:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    if sync:
+        _fsync(directory)
+    return True
+
+
+def _write(task):
+    # Write the values for one image, never raises.
+    path = task[0]
+    try:
+        return path, _write_values(*task)
+    except Exception, error:
+        return path, error
+
+
+def _run_in_process(function, task, token):
+    # Run a task, and make sure that the result can be sent back to the parent
+    # process, otherwise it would be silently lost.
+    if _started is not None:
+        # Tell the parent process which worker runs the task, so that it can
+        # report it as failed if the worker dies.
+        _started.put((token, os.getpid()))
+    path, result = function(task)
+    try:
+        cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+    except Exception:
+        if isinstance(result, Exception):
+            result = RuntimeError('%s: %s' % (result.__class__.__name__,
+                                              result))
+        else:
+            result = RuntimeError('Unpicklable metadata values')
+    return path, result
+
+
+class _ThreadExecutor(object):
+
+    # Run tasks in a pool of daemon threads.
+
+    def __init__(self, function, workers):
+        self._function = function
+        self._tasks = Queue.Queue()
+        self._results = Queue.Queue()
+        # The number of tasks submitted whose results were not returned yet
+        self._pending = 0
+        self._threads = []
+        for i in xrange(workers):
+            thread = threading.Thread(target=self._work)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            self._results.put(self._function(task))
+
+    def submit(self, task):
+        self._pending += 1
+        self._tasks.put(task)
+
+    def result(self, timeout):
+        # Return the result of a completed task, or None if none completed
+        # within the timeout.
+        try:
+            result = self._results.get(True, timeout)
+        except Queue.Empty:
+            return None
+        self._pending -= 1
+        return result
+
+    def shutdown(self):
+        # Drop the tasks that were not started yet, wait for the running ones
+        # and return their results, then stop the threads.
+        while True:
+            try:
+                self._tasks.get_nowait()
+            except Queue.Empty:
+                break
+            self._pending -= 1
+        results = []
+        while self._pending:
+            result = self.result(_POLL_INTERVAL)
+            if result is not None:
+                results.append(result)
+        for thread in self._threads:
+            self._tasks.put(None)
+        return results
+
+
+class _Workers(object):
+
+    # Keep track of the worker processes of a pool running the tasks, the
+    # workers being initialized with _init_worker and the queue of the
+    # tracker.
+
+    def __init__(self):
+        self.queue = multiprocessing.queues.SimpleQueue()
+        self._lock = threading.Lock()
+        # Map the tokens of the running tasks to the pids of their workers.
+        self._running = {}
+        # The tokens of the tasks that completed before being announced.
+        self._done = set()
+        # Whether tasks were lost with their workers.
+        self.lost = False
+
+    def _collect(self):
+        while not self.queue.empty():
+            token, pid = self.queue.get()
+            if token in self._done:
+                self._done.remove(token)
+            else:
+                self._running[token] = pid
+
+    def dead(self, tokens):
+        # Return the tokens among the given ones of the tasks whose workers
+        # are dead.
+        self._lock.acquire()
+        try:
+            self._collect()
+            alive = set(p.pid for p in multiprocessing.active_children())
+            return set(token for token in tokens
+                       if token in self._running and
+                       self._running[token] not in alive)
+        finally:
+            self._lock.release()
+
+    def forget(self, token):
+        # Forget a task that completed.
+        self._lock.acquire()
+        try:
+            self._collect()
+            if token in self._running:
+                del self._running[token]
+            else:
+                self._done.add(token)
+        finally:
+            self._lock.release()
+
+
+class _ProcessExecutor(object):
+
+    # Run tasks in a pool of processes, a new one or an existing one along
+    # with the tracker of its workers.
+    #
+    # multiprocessing.Pool replaces the workers that die (e.g. killed by a
+    # signal or a crash in libexiv2), but the tasks they were running never
+    # complete. The workers announce the tasks they start, so that the tasks
+    # of the workers that disappeared can be reported as failed.
+
+    def __init__(self, function, workers, pool=None, tracker=None):
+        self._function = function
+        self._results = Queue.Queue()
+        self._owner = pool is None
+        if self._owner:
+            tracker = _Workers()
+            pool = multiprocessing.Pool(workers, _init_worker,
+                                        (tracker.queue,))
+        self._pool = pool
+        self._tracker = tracker
+        # Map the tokens of the pending tasks to their paths.
+        self._pending = {}
+        # The tokens of the tasks whose workers were found dead by the
+        # previous check.
+        self._suspects = set()
+
+    def submit(self, task):
+        token = _tokens.next()
+        self._pending[token] = task[0]
+        callback = lambda result: self._results.put((token, result))
+        self._pool.apply_async(_run_in_process,
+                               (self._function, task, token),
+                               callback=callback)
+
+    def _lost(self):
+        # Return the token of a task whose worker died, or None.
+        suspects = self._tracker.dead(self._pending)
+        # A worker could exit right after sending its last result, which is
+        # then still on its way: only give up on a task if its worker was
+        # already found dead by the previous check.
+        lost = suspects & self._suspects
+        self._suspects = suspects
+        if lost:
+            return lost.pop()
+        return None
+
+    def result(self, timeout):
+        # Return the result of a completed or lost task, or None if none
+        # completed within the timeout.
+        try:
+            token, result = self._results.get(True, timeout)
+        except Queue.Empty:
+            token = self._lost()
+            if token is None:
+                return None
+            self._suspects.discard(token)
+            self._tracker.lost = True
+            result = (self._pending[token],
+                      RuntimeError('The worker process died'))
+        del self._pending[token]
+        self._tracker.forget(token)
+        return result
+
+    def shutdown(self):
+        # Wait for the submitted tasks (or the loss of their workers) and
+        # return their results, then stop the pool if it is ours. Killing
+        # the workers could interrupt them in the middle of a write.
+        results = []
+        while self._pending:
+            result = self.result(_POLL_INTERVAL)
+            if result is not None:
+                results.append(result)
+        if self._owner:
+            if self._tracker.lost:
+                # Joining a pool that lost tasks would never return.
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool.join()
+        return results
+
+
+_EXECUTORS = {'thread': _ThreadExecutor, 'process': _ProcessExecutor}
+
+_FSYNC_POLICIES = ('none', 'file', 'batch')
+
+
+def _run(function, tasks, executor, workers, max_pending, unclaimed=None):
+    # Validate the parameters and return an iterator over the results of the
+    # tasks.
+    if executor not in _EXECUTORS:
+        raise ValueError('Invalid executor: %s' % executor)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers < 1:
+        raise ValueError('Invalid number of workers: %s' % workers)
+    if max_pending is None:
+        max_pending = 2 * workers
+    return _iterate(_EXECUTORS[executor], function, workers, iter(tasks),
+                    max_pending, unclaimed)
+
+
+def _iterate(cls, function, workers, tasks, max_pending, unclaimed=None):
+    # Feed the tasks to a pool of workers, never keeping more than max_pending
+    # of them in flight, and yield the results as they complete.
+    # If the iteration is stopped early, no more tasks are started, the
+    # running ones are waited for and their results are appended to the
+    # unclaimed list, if any.
+    pool = cls(function, workers)
+    try:
+        exhausted = False
+        pending = 0
+        while True:
+            while not exhausted and pending < max_pending:
+                try:
+                    task = tasks.next()
+                except StopIteration:
+                    exhausted = True
+                else:
+                    pool.submit(task)
+                    pending += 1
+            if pending == 0:
+                break
+            result = pool.result(_POLL_INTERVAL)
+            if result is None:
+                continue
+            pending -= 1
+            yield result
+    finally:
+        results = pool.shutdown()
+        if unclaimed is not None:
+            unclaimed.extend(results)
+
+
+def read_many(paths, keys=None, workers=None, executor='thread',
+              max_pending=None):
+    """
+    Read the metadata of many images in parallel.
+
+    The results are yielded as soon as they are available, which is not
+    necessarily in the order of the paths. At most ``max_pending`` images are
+    being processed at any given time: the paths are consumed only as the
+    results are consumed, so that ``paths`` can be an arbitrarily long
+    iterator.
+
+    The images are read in metadata-only mode.
+
+    :param paths: the paths to the image files
+    :type paths: iterable of strings
+    :param keys: the keys of the tags to read, or None to read all the tags
+                 (see :meth:`pyexiv2.metadata.ImageMetadata.read`)
+    :type keys: list of strings
+    :param workers: the number of threads or processes to use, defaults to
+                    the number of CPUs
+    :type workers: int
+    :param executor: ``thread`` to use a pool of threads, ``process`` to use a
+                     pool of processes
+    :type executor: string
+    :param max_pending: the maximum number of images being processed at any
+                        given time, defaults to twice the number of workers
+    :type max_pending: int
+
+    :return: an iterator over (path, result) tuples, where the result is
+             either a dictionary mapping the keys of the tags set in the image
+             to their values, or the exception raised when reading the image
+             (a :exc:`RuntimeError` if the process reading it died)
+    :rtype: iterator
+
+    :raise ValueError: if the executor or the number of workers is invalid
+    """
+    tasks = ((path, keys) for path in paths)
+    return _run(_read, tasks, executor, workers, max_pending)
+
+
+def _sync_written(results, unclaimed):
+    # Yield the results, then flush to disk the files that were written and
+    # their directories, including those whose results were not claimed
+    # because the iteration was stopped early.
+    written = []
+    try:
+        for path, result in results:
+            if result is True:
+                written.append(path)
+            yield path, result
+    finally:
+        # Wait for the writes still running.
+        results.close()
+        written.extend([path for path, result in unclaimed if result is True])
+        directories = set()
+        for path in written:
+            _fsync(path)
+            directories.add(os.path.dirname(os.path.abspath(path)))
+        for directory in directories:
+            _fsync(directory)
+
+
+def write_many(updates, workers=None, fsync='none', tmpdir=None, atomic=True,
+               executor='thread', max_pending=None):
+    """
+    Update the metadata of many images in parallel.
+
+    The updates of each image are a dictionary mapping keys to values, a value
+    of None deleting the corresponding tag. Images whose metadata is left
+    unchanged by the updates are not written.
+
+    In atomic mode, a copy of each image is modified in a temporary file,
+    which then replaces the original image, so that the image is never left
+    half written. Otherwise the images are written in place, overwriting the
+    modified EXIF values directly in the file whenever possible (see
+    :meth:`pyexiv2.metadata.ImageMetadata.write`).
+
+    The fsync policy defines when the images are flushed to disk: never
+    (``none``, leaving that to the operating system), as soon as each image
+    is written (``file``), or once all the images are written (``batch``), in
+    which case they are guaranteed to be on disk only once the iteration over
+    the results is complete.
+
+    As for :func:`read_many`, the results are yielded as soon as they are
+    available and ``updates`` can be an arbitrarily long iterator.
+
+    If the iteration over the results is stopped early (the iterator is closed,
+    e.g. when breaking out of a loop over it), no more images are updated, but
+    the updates in progress are completed, and flushed to disk with the
+    ``batch`` policy, before closing returns.
+
+    :param updates: the updates to apply, as a dictionary or an iterable of
+                    (path, dictionary) tuples
+    :type updates: dict or iterable of tuples
+    :param workers: the number of threads or processes to use, defaults to
+                    the number of CPUs
+    :type workers: int
+    :param fsync: the fsync policy, one of ``none``, ``file`` or ``batch``
+    :type fsync: string
+    :param tmpdir: the directory to create the temporary files in, defaults
+                   to the directory of each image (it must be on the same
+                   file system as the images)
+    :type tmpdir: string
+    :param atomic: whether to write the images through temporary files
+    :type atomic: boolean
+    :param executor: ``thread`` to use a pool of threads, ``process`` to use a
+                     pool of processes
+    :type executor: string
+    :param max_pending: the maximum number of images being processed at any
+                        given time, defaults to twice the number of workers
+    :type max_pending: int
+
+    :return: an iterator over (path, result) tuples, where the result is
+             either a boolean telling whether the image was written, or the
+             exception raised when updating the image (a
+             :exc:`RuntimeError` if the process updating it died)
+    :rtype: iterator
+
+    :raise ValueError: if the fsync policy, the executor or the number of
+                       workers is invalid
+    """
+    if fsync not in _FSYNC_POLICIES:
+        raise ValueError('Invalid fsync policy: %s' % fsync)
+    if hasattr(updates, 'iteritems'):
+        updates = updates.iteritems()
+    tasks = ((path, values, fsync == 'file', tmpdir, atomic)
+             for path, values in updates)
+    if fsync == 'batch':
+        unclaimed = []
+        results = _run(_write, tasks, executor, workers, max_pending,
+                       unclaimed)
+        return _sync_written(results, unclaimed)
+    return _run(_write, tasks, executor, workers, max_pending)
+
+
+def _from_raw(results):
+    # Instantiate the metadata of the images from their raw metadata.
+    for path, result in results:
+        if not isinstance(result, Exception):
+            metadata = ImageMetadata(path, metadata_only=True)
+            metadata._read_from_cache(result)
+            result = metadata
+        yield path, result
+
+
+class MetadataPool(object):
+
+    """
+    A pool of worker processes that read the metadata of images.
+
+    The workers send the raw values of the tags back to the parent process
+    (see :meth:`pyexiv2.metadata.ImageMetadata.items_raw`), which is a lot
+    cheaper than pickling tag objects or converted values. The tags are only
+    instantiated in the parent process when they are accessed.
+
+    The pool can be used for several batches of images, which saves starting
+    new processes for each of them.
+    """
+
+    def __init__(self, processes=None, namespaces=None, warm=True):
+        """
+        :param processes: the number of worker processes, defaults to the
+                          number of CPUs
+        :type processes: int
+        :param namespaces: custom XMP namespaces to register in the workers
+                           (see :func:`worker_init`)
+        :type namespaces: dict mapping names to prefixes, or iterable of
+                          (name, prefix) tuples
+        :param warm: whether to initialize libexiv2 in the workers as soon as
+                     they are started
+        :type warm: boolean
+
+        :raise ValueError: if the number of processes is invalid
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes < 1:
+            raise ValueError('Invalid number of processes: %s' % processes)
+        if namespaces is not None and hasattr(namespaces, 'iteritems'):
+            namespaces = namespaces.items()
+        self.processes = processes
+        self._workers = _Workers()
+        self._pool = multiprocessing.Pool(processes, _init_worker,
+                                          (self._workers.queue, namespaces,
+                                           warm))
+
+    def read(self, paths, keys=None, max_pending=None):
+        """
+        Read the metadata of many images.
+
+        As for :func:`read_many`, the results are yielded as soon as they are
+        available, and ``paths`` can be an arbitrarily long iterator.
+
+        The metadata is read-only, as if it was read from a cache (see
+        :meth:`pyexiv2.metadata.ImageMetadata.read`).
+
+        :param paths: the paths to the image files
+        :type paths: iterable of strings
+        :param keys: the keys of the tags to read, or None to read all the tags
+        :type keys: list of strings
+        :param max_pending: the maximum number of images being processed at
+                            any given time, defaults to twice the number of
+                            processes
+        :type max_pending: int
+
+        :return: an iterator over (path, result) tuples, where the result is
+                 either a :class:`pyexiv2.metadata.ImageMetadata` or the
+                 exception raised when reading the image (a
+                 :exc:`RuntimeError` if the process reading it died)
+        :rtype: iterator
+        """
+        if max_pending is None:
+            max_pending = 2 * self.processes
+        tasks = ((path, keys) for path in paths)
+        executor = lambda function, workers: \
+            _ProcessExecutor(function, workers, self._pool, self._workers)
+        return _from_raw(_iterate(executor, _read_raw, self.processes,
+                                  tasks, max_pending))
+
+    def close(self):
+        """
+        Stop the worker processes once the pending images are read.
+
+        If worker processes died, the pool is terminated instead, as it would
+        otherwise wait forever for the images they were reading.
+        """
+        if self._workers.lost:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """Stop the worker processes immediately."""
+        self._pool.terminate()
+        self._pool.join()
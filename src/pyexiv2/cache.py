@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+"""
+Caches of the metadata of images, to avoid reading unchanged images again and
+again: a persistent cache of the raw metadata, and a process-wide cache of
+parsed metadata.
+"""
+
+import os
+import threading
+import sqlite3
+import marshal
+
+from pyexiv2.metadata import ImageMetadata, _FAMILIES
+from pyexiv2.exif import ExifTag
+from pyexiv2.iptc import IptcTag
+from pyexiv2.xmp import XmpTag
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    inode INTEGER,
+    used INTEGER,
+    bytes INTEGER,
+    items BLOB
+);
+CREATE INDEX IF NOT EXISTS metadata_used ON metadata (used);
+"""
+
+
+def _fingerprint(stat):
+    # The properties of a file that change when it is modified or replaced.
+    return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+
+class MetadataCache(object):
+
+    """
+    A cache of the raw metadata of images, stored in a sqlite database.
+
+    For each image, the cache stores the (key, type, raw value) tuples of all
+    its tags, as returned by :meth:`pyexiv2.metadata.ImageMetadata.items_raw`.
+    An entry is invalidated as soon as the size, the modification time or the
+    inode of the image changes.
+
+    The cache can be bounded in number of entries and/or in size. When a bound
+    is exceeded, the least recently used entries are evicted. The bounds are
+    enforced by each instance on its own: when a database is shared by several
+    instances (e.g. in several processes), it may temporarily exceed them.
+
+    A cache can be shared by several threads.
+
+    The ``hits`` and ``misses`` attributes count the lookups that found a
+    valid entry and those that did not, and the ``evictions`` attribute
+    counts the entries evicted to enforce the bounds.
+    """
+
+    def __init__(self, filename, max_entries=None, max_bytes=None):
+        """
+        :param filename: path to the database file, created if needed
+        :type filename: string
+        :param max_entries: the maximum number of entries, defaults to no limit
+        :type max_entries: int
+        :param max_bytes: the maximum total size of the entries in bytes,
+                          defaults to no limit
+        :type max_bytes: int
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        # Accept and return paths as byte strings.
+        self._db.text_factory = str
+        # This is a cache, losing its latest updates in a crash is harmless.
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.executescript(_SCHEMA)
+        self._entries, self._bytes, self._clock = self._db.execute(
+            'SELECT COUNT(*), TOTAL(bytes), MAX(used) FROM metadata').fetchone()
+        self._bytes = int(self._bytes)
+        self._clock = self._clock or 0
+
+    def get(self, path):
+        """
+        Look up the metadata of an image.
+
+        :param path: path to an image file
+        :type path: string
+
+        :return: a dictionary mapping the families of metadata (``exif``,
+                 ``iptc`` and ``xmp``) to lists of (key, type, raw value)
+                 tuples, or None if the image is not in the cache or was
+                 modified since it was cached
+        :rtype: dict
+        """
+        try:
+            fingerprint = _fingerprint(os.stat(path))
+        except OSError:
+            fingerprint = None
+        self._lock.acquire()
+        try:
+            row = self._db.execute('SELECT size, mtime, inode, items '
+                                   'FROM metadata WHERE path = ?',
+                                   (path,)).fetchone()
+            if row is None or tuple(row[:3]) != fingerprint:
+                self.misses += 1
+                return None
+            try:
+                items = marshal.loads(str(row[3]))
+            except (ValueError, EOFError, TypeError):
+                items = None
+            if not isinstance(items, dict):
+                # Not written by this version of the cache, or corrupted.
+                self.misses += 1
+                return None
+            self._clock += 1
+            self._db.execute('UPDATE metadata SET used = ? WHERE path = ?',
+                             (self._clock, path))
+            self._db.commit()
+            self.hits += 1
+        finally:
+            self._lock.release()
+        return items
+
+    def put(self, path, items, stat=None):
+        """
+        Store the metadata of an image.
+
+        :param path: path to an image file
+        :type path: string
+        :param items: a dictionary mapping the families of metadata to lists
+                      of (key, type, raw value) tuples
+        :type items: dict
+        :param stat: the status of the file when its metadata was read,
+                     defaults to its current status
+        :type stat: :class:`os.stat_result`
+        """
+        if stat is None:
+            stat = os.stat(path)
+        # marshal is fast and, unlike pickle, cannot run code when loading.
+        data = marshal.dumps(items)
+        size, mtime, inode = _fingerprint(stat)
+        self._lock.acquire()
+        try:
+            self._delete(path)
+            self._clock += 1
+            self._db.execute('INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (path, size, mtime, inode, self._clock,
+                              len(data), buffer(data)))
+            self._entries += 1
+            self._bytes += len(data)
+            self._evict()
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+    def _delete(self, path):
+        # Delete the entry for an image, if any.
+        row = self._db.execute('SELECT bytes FROM metadata WHERE path = ?',
+                               (path,)).fetchone()
+        if row is not None:
+            self._db.execute('DELETE FROM metadata WHERE path = ?', (path,))
+            self._entries -= 1
+            self._bytes -= row[0]
+
+    def _evict(self):
+        # Evict the least recently used entries until the bounds are met.
+        while (self.max_entries is not None and
+               self._entries > self.max_entries) or \
+              (self.max_bytes is not None and self._bytes > self.max_bytes):
+            row = self._db.execute('SELECT path FROM metadata '
+                                   'ORDER BY used LIMIT 1').fetchone()
+            if row is None:
+                break
+            self._delete(row[0])
+            self.evictions += 1
+
+    def remove(self, path):
+        """
+        Remove the metadata of an image from the cache, if present.
+
+        :param path: path to an image file
+        :type path: string
+        """
+        self._lock.acquire()
+        try:
+            self._delete(path)
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Remove all the entries from the cache."""
+        self._lock.acquire()
+        try:
+            self._db.execute('DELETE FROM metadata')
+            self._db.commit()
+            self._entries = 0
+            self._bytes = 0
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """Close the database. The cache cannot be used afterwards."""
+        self._lock.acquire()
+        try:
+            self._db.close()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return self._entries
+
+
+def _footprint(metadata):
+    # Estimate the memory used by the metadata of an image, in bytes.
+    size = 0
+    for family in _FAMILIES:
+        for key, type, value in metadata.items_raw(family):
+            # The tag object, its key and its (raw and converted) value
+            size += 256 + len(key)
+            if isinstance(value, dict):
+                value = value.keys() + value.values()
+            if isinstance(value, list):
+                size += 2 * sum([len(v) for v in value]) + 64 * len(value)
+            else:
+                size += 2 * len(value)
+    return size
+
+
+def _read_only(*args):
+    raise TypeError('The metadata is shared and read-only')
+
+
+def _copy(value):
+    # Copy a mutable value, so that the shared one cannot be modified in place.
+    if isinstance(value, list):
+        return list(value)
+    elif isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def _read_only_property(prop):
+    # A read-only version of a property of a tag.
+    return property(fget=lambda tag: _copy(prop.fget(tag)), fset=_read_only,
+                    doc=prop.__doc__)
+
+
+class _ReadOnlyExifTag(ExifTag):
+
+    # An EXIF tag of a read-only view of the metadata.
+
+    __slots__ = ()
+
+    raw_value = _read_only_property(ExifTag.raw_value)
+    value = _read_only_property(ExifTag.value)
+
+
+class _ReadOnlyIptcTag(IptcTag):
+
+    # An IPTC tag of a read-only view of the metadata.
+
+    __slots__ = ()
+
+    raw_value = _read_only_property(IptcTag.raw_value)
+    value = _read_only_property(IptcTag.value)
+    raw_values = _read_only_property(IptcTag.raw_values)
+    values = _read_only_property(IptcTag.values)
+
+
+class _ReadOnlyXmpTag(XmpTag):
+
+    # An XMP tag of a read-only view of the metadata.
+
+    __slots__ = ()
+
+    raw_value = _read_only_property(XmpTag.raw_value)
+    value = _read_only_property(XmpTag.value)
+
+
+_READ_ONLY_TAGS = {ExifTag: _ReadOnlyExifTag, IptcTag: _ReadOnlyIptcTag,
+                   XmpTag: _ReadOnlyXmpTag}
+
+
+class _ReadOnlyImageMetadata(ImageMetadata):
+
+    # A read-only view of the metadata of an image, shared by the callers of
+    # open_cached: setting or deleting tags, modifying their values, the
+    # comment or the thumbnail, or reading the image again raise a TypeError.
+    # The tags hand out copies of their lists and dictionaries of values.
+
+    def _check_mutable(self):
+        _read_only()
+
+    def read(self, keys=None, families=None, cache=None):
+        _read_only()
+
+    def _read_only_tag(self, tag):
+        # Make a tag read-only, once and for all.
+        if tag.__class__ in _READ_ONLY_TAGS:
+            tag.__class__ = _READ_ONLY_TAGS[tag.__class__]
+        return tag
+
+    def _get_exif_tag(self, key):
+        return self._read_only_tag(ImageMetadata._get_exif_tag(self, key))
+
+    def _get_iptc_tag(self, key):
+        return self._read_only_tag(ImageMetadata._get_iptc_tag(self, key))
+
+    def _get_xmp_tag(self, key):
+        return self._read_only_tag(ImageMetadata._get_xmp_tag(self, key))
+
+
+class _ImageMetadataLRU(object):
+
+    # A thread-safe cache of ImageMetadata instances, with a least recently
+    # used eviction policy.
+    # The entries are stored in a circular doubly linked list, from the least
+    # to the most recently used, as [previous, next, path, fingerprint,
+    # metadata, size] lists.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._root = [None, None, None, None, None, 0]
+        self._root[0] = self._root[1] = self._root
+        self._bytes = 0
+
+    def _unlink(self, entry):
+        entry[0][1] = entry[1]
+        entry[1][0] = entry[0]
+
+    def _append(self, entry):
+        # Insert an entry as the most recently used one.
+        last = self._root[0]
+        entry[0] = last
+        entry[1] = self._root
+        last[1] = self._root[0] = entry
+
+    def _remove(self, entry):
+        self._unlink(entry)
+        del self._entries[entry[2]]
+        self._bytes -= entry[5]
+
+    def get(self, path, maxsize, max_bytes):
+        fingerprint = _fingerprint(os.stat(path))
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(path)
+            if entry is not None:
+                if entry[3] == fingerprint:
+                    self._unlink(entry)
+                    self._append(entry)
+                    return entry[4]
+                self._remove(entry)
+        finally:
+            self._lock.release()
+        # Read the image outside of the lock, not to serialize all the reads.
+        metadata = _ReadOnlyImageMetadata(path, metadata_only=True)
+        # Read through the base class, the view itself refuses to be read.
+        ImageMetadata.read(metadata)
+        entry = [None, None, path, fingerprint, metadata, _footprint(metadata)]
+        self._lock.acquire()
+        try:
+            if path in self._entries:
+                # Another thread read the same image in the meantime.
+                self._remove(self._entries[path])
+            self._entries[path] = entry
+            self._append(entry)
+            self._bytes += entry[5]
+            # Evict the least recently used entries, but never the new one.
+            while len(self._entries) > 1 and \
+                    ((maxsize is not None and len(self._entries) > maxsize) or
+                     (max_bytes is not None and self._bytes > max_bytes)):
+                self._remove(self._root[1])
+        finally:
+            self._lock.release()
+        return metadata
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._root[0] = self._root[1] = self._root
+            self._bytes = 0
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_lru = _ImageMetadataLRU()
+
+
+def open_cached(path, maxsize=128, max_bytes=None):
+    """
+    Return the metadata of an image from a process-wide cache, reading it only
+    if it is not in the cache yet or if the image was modified (i.e. its size,
+    modification time or inode changed) since it was read.
+
+    The metadata is read in metadata-only mode, and the same instance is
+    returned to all the callers, possibly in several threads: it is read-only.
+    Setting or deleting tags, modifying the values of the tags, the comment
+    or the EXIF thumbnail raise a :exc:`TypeError`, and the lists and
+    dictionaries of values handed out by the tags are copies.
+
+    The least recently used entries are evicted when the cache holds more
+    than ``maxsize`` images, or when the estimated memory used by their
+    metadata exceeds ``max_bytes``. The bounds apply to the whole cache, they
+    are those given by the latest call.
+
+    :param path: path to an image file
+    :type path: string
+    :param maxsize: the maximum number of images in the cache, or None for no
+                    limit
+    :type maxsize: int
+    :param max_bytes: the maximum estimated memory used by the cache in bytes,
+                      or None for no limit
+    :type max_bytes: int
+
+    :return: the metadata of the image
+    :rtype: :class:`pyexiv2.metadata.ImageMetadata`
+
+    :raise IOError: if the image cannot be read
+    """
+    return _lru.get(path, maxsize, max_bytes)
@@ -33,9 +33,8 @@ import libexiv2python
 from pyexiv2.utils import is_fraction, make_fraction, fraction_to_string, \
                           NotifyingList, ListenerInterface, \
                           undefined_to_string, string_to_undefined, \
-                          DateTimeFormatter
+                          DateTimeFormatter, DateTimeParser
 
-import time
 import datetime
 import sys
 
@@ -78,14 +77,9 @@ class ExifTag(ListenerInterface):
     - Undefined: string
     """
 
-    # According to the EXIF specification, the only accepted format for an Ascii
-    # value representing a datetime is '%Y:%m:%d %H:%M:%S', but it seems that
-    # others formats can be found in the wild.
-    _datetime_formats = ('%Y:%m:%d %H:%M:%S',
-                         '%Y-%m-%d %H:%M:%S',
-                         '%Y-%m-%dT%H:%M:%SZ')
-
-    _date_formats = ('%Y:%m:%d',)
+    # No per-instance dictionary, as many tags can be kept in memory at once.
+    __slots__ = ('_tag', '_type', '_raw_value', '_value', '_value_cookie',
+                 '_value_in_tag', '_owner')
 
     def __init__(self, key, value=None, _tag=None):
         """
@@ -101,22 +95,54 @@ class ExifTag(ListenerInterface):
             self._tag = _tag
         else:
             self._tag = libexiv2python._ExifTag(key)
+        # The type is looked up once, when first needed.
+        self._type = None
         self._raw_value = None
         self._value = None
         self._value_cookie = False
+        # Whether the value was read from an image or set from python values,
+        # in which case it can be read from the libexiv2 tag as numbers rather
+        # than parsed from the raw value, and the raw value is only formatted
+        # by libexiv2 when needed.
+        self._value_in_tag = False
+        # The metadata the tag belongs to, if any.
+        self._owner = None
         if value is not None:
             self._set_value(value)
 
     def _set_owner(self, metadata):
         self._tag._setParentImage(metadata._image)
+        self._owner = metadata
+
+    def _mark_dirty(self):
+        # Let the metadata the tag belongs to know that its value was set, so
+        # that only the tags marked dirty are compared to their original value.
+        owner = self._owner
+        if owner is not None:
+            owner.lock.acquire()
+            try:
+                owner._mark_dirty(self.key)
+            finally:
+                owner.lock.release()
 
     @staticmethod
     def _from_existing_tag(_tag):
         # Build a tag from an already existing libexiv2python._ExifTag.
         tag = ExifTag(_tag._getKey(), _tag=_tag)
         # Do not set the raw_value property, as it would call _tag._setRawValue
-        # (see https://bugs.launchpad.net/pyexiv2/+bug/582445).
-        tag._raw_value = _tag._getRawValue()
+        # (see https://bugs.launchpad.net/pyexiv2/+bug/582445). The raw value
+        # is fetched from the tag when first needed.
+        tag._value_cookie = True
+        tag._value_in_tag = True
+        return tag
+
+    @staticmethod
+    def _from_cache(key, type, raw_value):
+        # Build a tag from a raw value read from a metadata cache. The tag does
+        # not hold the value in libexiv2, so its human value is not available.
+        tag = ExifTag(key)
+        tag._type = type
+        tag._raw_value = raw_value
         tag._value_cookie = True
         return tag
 
@@ -130,7 +156,9 @@ class ExifTag(ListenerInterface):
     def type(self):
         """The EXIF type of the tag (one of Ascii, Byte, SByte, Comment, Short,
         SShort, Long, SLong, Rational, SRational, Undefined)."""
-        return self._tag._getType()
+        if self._type is None:
+            self._type = self._tag._getType()
+        return self._type
 
     @property
     def name(self):
@@ -158,31 +186,110 @@ class ExifTag(ListenerInterface):
         return self._tag._getSectionDescription()
 
     def _get_raw_value(self):
+        if self._raw_value is None and self._value_in_tag:
+            # Formatting long Undefined values as decimal numbers is costly,
+            # only do it when the raw value is actually needed.
+            self._raw_value = self._tag._getRawValue()
         return self._raw_value
 
     def _set_raw_value(self, value):
         self._tag._setRawValue(value)
         self._raw_value = value
         self._value_cookie = True
+        # The raw value may not be parsed by libexiv2 the way it is by the
+        # python converters, it remains the reference.
+        self._value_in_tag = False
+        self._mark_dirty()
+
+    def _set_typed_values(self, values):
+        # Set the value of the tag from a list of numbers, without going
+        # through its string representation.
+        try:
+            self._tag._setValues(values)
+        except OverflowError:
+            raise ExifValueError(values, self.type)
+        self._raw_value = None
+        self._value_cookie = True
+        self._value_in_tag = True
+        self._mark_dirty()
+
+    def _set_data(self, data):
+        # Set the value of the tag from its raw bytes, without going through
+        # their decimal representation.
+        self._tag._setData(data)
+        self._raw_value = None
+        self._value_cookie = True
+        self._value_in_tag = True
+        self._mark_dirty()
 
     raw_value = property(fget=_get_raw_value, fset=_set_raw_value,
                          doc='The raw value of the tag as a string.')
 
+    def _compared_value(self):
+        # The value compared to the original one of the tag to tell whether it
+        # was modified: the bytes of Undefined values, which are not formatted
+        # as decimal numbers, and the raw value of the other types.
+        if self.type == 'Undefined':
+            if self._value_in_tag:
+                data = self._tag._getData()
+                if data is not None:
+                    return data
+            elif self._raw_value is not None:
+                try:
+                    return ''.join([chr(int(byte))
+                                    for byte in self._raw_value.split()])
+                except ValueError:
+                    pass
+        return self.raw_value
+
     def _compute_value(self):
         # Lazy computation of the value from the raw value.
-        if self.type in \
-            ('Short', 'SShort', 'Long', 'SLong', 'Rational', 'SRational'):
+        type = self.type
+        if self._value_in_tag and type in self._typed_converters:
+            # Fast path, read the numbers directly from libexiv2
+            values = self._tag._getValues()
+            if values:
+                try:
+                    values = self._typed_converters[type](values)
+                except ZeroDivisionError:
+                    raise ExifValueError(self.raw_value, type)
+                if len(values) > 1:
+                    self._value = NotifyingList(values)
+                    self._value.register_listener(self)
+                else:
+                    self._value = values[0]
+                self._value_cookie = False
+                return
+        elif self._value_in_tag and type == 'Undefined':
+            # Fast path, read the bytes directly from libexiv2
+            data = self._tag._getData()
+            if data is not None:
+                self._value = data
+                self._value_cookie = False
+                return
+
+        if type in self._list_converters:
             # May contain multiple values
-            values = self._raw_value.split()
+            values = self.raw_value.split()
             if len(values) > 1:
+                converter = self._list_converters[type]
+                if converter is not None:
+                    try:
+                        # Fast path, convert all the values in one go
+                        values = map(converter, values)
+                    except (ValueError, ZeroDivisionError):
+                        # Let the converter of each value report the error
+                        converter = None
+                if converter is None:
+                    converter = self._python_converters[type]
+                    values = [converter(self, value) for value in values]
                 # Make values a notifying list
-                values = map(self._convert_to_python, values)
                 self._value = NotifyingList(values)
                 self._value.register_listener(self)
                 self._value_cookie = False
                 return
 
-        self._value = self._convert_to_python(self._raw_value)
+        self._value = self._convert_to_python(self.raw_value)
         self._value_cookie = False
 
     def _get_value(self):
@@ -191,8 +298,22 @@ class ExifTag(ListenerInterface):
         return self._value
 
     def _set_value(self, value):
-        if isinstance(value, (list, tuple)):
-            raw_values = map(self._convert_to_string, value)
+        converter = self._typed_setters.get(self.type)
+        if converter is not None:
+            # Fast path, pass the numbers directly to libexiv2
+            if isinstance(value, (list, tuple)):
+                values = [converter(self, item) for item in value]
+            else:
+                values = [converter(self, value)]
+            self._set_typed_values(values)
+        elif self.type == 'Undefined' and isinstance(value, basestring):
+            # Fast path, pass the bytes directly to libexiv2
+            self._set_data(self._undefined_to_bytes(value))
+        elif isinstance(value, (list, tuple)):
+            converter = self._string_converters.get(self.type)
+            if converter is None:
+                raise ExifValueError(value, self.type)
+            raw_values = [converter(self, item) for item in value]
             self.raw_value = ' '.join(raw_values)
         else:
             self.raw_value = self._convert_to_string(value)
@@ -254,6 +375,98 @@ class ExifTag(ListenerInterface):
             pass
         return encoding
 
+    # Converters from raw values to python values, one per EXIF type.
+
+    def _ascii_to_python(self, value):
+        # The value may contain a Datetime or a Date
+        # (e.g. Exif.GPSInfo.GPSDateStamp)
+        d = DateTimeParser.exif(value)
+        if d is not None:
+            return d
+        # Default to string.
+        # There is currently no charset conversion.
+        # TODO: guess the encoding and decode accordingly into unicode
+        # where relevant.
+        return value
+
+    def _byte_to_python(self, value):
+        return value
+
+    def _comment_to_python(self, value):
+        if value.startswith('charset='):
+            charset, val = value.split(' ', 1)
+            charset = charset.split('=')[1].strip('"')
+            encoding = self._match_encoding(charset)
+            return val.decode(encoding, 'replace')
+        else:
+            # No encoding defined.
+            try:
+                return value.decode('utf-8')
+            except UnicodeError:
+                return value
+
+    def _short_to_python(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise ExifValueError(value, self.type)
+
+    def _long_to_python(self, value):
+        try:
+            return long(value)
+        except ValueError:
+            raise ExifValueError(value, self.type)
+
+    def _rational_to_python(self, value):
+        try:
+            r = make_fraction(value)
+        except (ValueError, ZeroDivisionError):
+            raise ExifValueError(value, self.type)
+        else:
+            if self.type == 'Rational' and r.numerator < 0:
+                raise ExifValueError(value, self.type)
+            return r
+
+    def _undefined_to_python(self, value):
+        # There is currently no charset conversion.
+        # TODO: guess the encoding and decode accordingly into unicode
+        # where relevant.
+        return undefined_to_string(value)
+
+    _python_converters = {'Ascii': _ascii_to_python,
+                          'Byte': _byte_to_python,
+                          'SByte': _byte_to_python,
+                          'Comment': _comment_to_python,
+                          'Short': _short_to_python,
+                          'SShort': _short_to_python,
+                          'Long': _long_to_python,
+                          'SLong': _long_to_python,
+                          'Rational': _rational_to_python,
+                          'SRational': _rational_to_python,
+                          'Undefined': _undefined_to_python}
+
+    # Converters of all the raw values of the types that may contain multiple
+    # values in one go, None where each value has to be converted and checked
+    # individually.
+    _list_converters = {'Short': int,
+                        'SShort': int,
+                        'Long': long,
+                        'SLong': long,
+                        'Rational': None,
+                        'SRational': make_fraction}
+
+    # Converters of the numbers read from libexiv2 to python values, for the
+    # types which values are transferred without a string representation.
+    # Rationals are read as (numerator, denominator) tuples.
+    _typed_converters = {'Short': list,
+                         'SShort': list,
+                         'Long': lambda values: map(long, values),
+                         'SLong': lambda values: map(long, values),
+                         'Rational': lambda values: [make_fraction(*value)
+                                                     for value in values],
+                         'SRational': lambda values: [make_fraction(*value)
+                                                      for value in values]}
+
     def _convert_to_python(self, value):
         """
         Convert one raw value to its corresponding python type.
@@ -265,190 +478,178 @@ class ExifTag(ListenerInterface):
 
         :raise ExifValueError: if the conversion fails
         """
-        if self.type == 'Ascii':
-            # The value may contain a Datetime
-            for format in self._datetime_formats:
-                try:
-                    t = time.strptime(value, format)
-                except ValueError:
-                    continue
-                else:
-                    return datetime.datetime(*t[:6])
-            # Or a Date (e.g. Exif.GPSInfo.GPSDateStamp)
-            for format in self._date_formats:
-                try:
-                    t = time.strptime(value, format)
-                except ValueError:
-                    continue
-                else:
-                    return datetime.date(*t[:3])
-            # Default to string.
-            # There is currently no charset conversion.
-            # TODO: guess the encoding and decode accordingly into unicode
-            # where relevant.
-            return value
-
-        elif self.type in ('Byte', 'SByte'):
-            return value
-
-        elif self.type == 'Comment':
-            if value.startswith('charset='):
-                charset, val = value.split(' ', 1)
-                charset = charset.split('=')[1].strip('"')
-                encoding = self._match_encoding(charset)
-                return val.decode(encoding, 'replace')
+        try:
+            converter = self._python_converters[self.type]
+        except KeyError:
+            raise ExifValueError(value, self.type)
+        return converter(self, value)
+
+    # Converters from python values to raw values, one per EXIF type.
+
+    def _ascii_to_string(self, value):
+        if isinstance(value, datetime.datetime):
+            return DateTimeFormatter.exif(value)
+        elif isinstance(value, datetime.date):
+            if self.key == 'Exif.GPSInfo.GPSDateStamp':
+                # Special case
+                return DateTimeFormatter.exif(value)
             else:
-                # No encoding defined.
-                try:
-                    return value.decode('utf-8')
-                except UnicodeError:
-                    return value
-
-        elif self.type in ('Short', 'SShort'):
+                return '%s 00:00:00' % DateTimeFormatter.exif(value)
+        elif isinstance(value, unicode):
             try:
-                return int(value)
-            except ValueError:
+                return value.encode('utf-8')
+            except UnicodeEncodeError:
                 raise ExifValueError(value, self.type)
+        elif isinstance(value, str):
+            return value
+        else:
+            raise ExifValueError(value, self.type)
 
-        elif self.type in ('Long', 'SLong'):
+    def _byte_to_string(self, value):
+        if isinstance(value, unicode):
             try:
-                return long(value)
-            except ValueError:
+                return value.encode('utf-8')
+            except UnicodeEncodeError:
                 raise ExifValueError(value, self.type)
+        elif isinstance(value, str):
+            return value
+        else:
+            raise ExifValueError(value, self.type)
+
+    def _comment_to_string(self, value):
+        if value is not None and self.raw_value is not None and \
+            self.raw_value.startswith('charset='):
+            charset, val = self.raw_value.split(' ', 1)
+            charset = charset.split('=')[1].strip('"')
+            encoding = self._match_encoding(charset)
+            try:
+                val = value.encode(encoding)
+            except UnicodeError:
+                # Best effort, do not fail just because the original
+                # encoding of the tag cannot encode the new value.
+                pass
+            else:
+                return 'charset="%s" %s' % (charset, val)
 
-        elif self.type in ('Rational', 'SRational'):
+        if isinstance(value, unicode):
             try:
-                r = make_fraction(value)
-            except (ValueError, ZeroDivisionError):
+                return value.encode('utf-8')
+            except UnicodeEncodeError:
                 raise ExifValueError(value, self.type)
-            else:
-                if self.type == 'Rational' and r.numerator < 0:
-                    raise ExifValueError(value, self.type)
-                return r
+        elif isinstance(value, str):
+            return value
+        else:
+            raise ExifValueError(value, self.type)
 
-        elif self.type == 'Undefined':
-            # There is currently no charset conversion.
-            # TODO: guess the encoding and decode accordingly into unicode
-            # where relevant.
-            return undefined_to_string(value)
+    # Converters from python values to the numbers passed to libexiv2, for the
+    # types which values are transferred without a string representation.
 
-        raise ExifValueError(value, self.type)
+    def _short_to_number(self, value):
+        if isinstance(value, int) and value >= 0:
+            return value
+        else:
+            raise ExifValueError(value, self.type)
 
-    def _convert_to_string(self, value):
-        """
-        Convert one value to its corresponding string representation, suitable
-        to pass to libexiv2.
+    def _sshort_to_number(self, value):
+        if isinstance(value, int):
+            return value
+        else:
+            raise ExifValueError(value, self.type)
 
-        :param value: the value to be converted
+    def _long_to_number(self, value):
+        if isinstance(value, (int, long)) and value >= 0:
+            return value
+        else:
+            raise ExifValueError(value, self.type)
 
-        :return: the value converted to its corresponding string representation
-        :rtype: string
+    def _slong_to_number(self, value):
+        if isinstance(value, (int, long)):
+            return value
+        else:
+            raise ExifValueError(value, self.type)
 
-        :raise ExifValueError: if the conversion fails
-        """
-        if self.type == 'Ascii':
-            if isinstance(value, datetime.datetime):
-                return DateTimeFormatter.exif(value)
-            elif isinstance(value, datetime.date):
-                if self.key == 'Exif.GPSInfo.GPSDateStamp':
-                    # Special case
-                    return DateTimeFormatter.exif(value)
-                else:
-                    return '%s 00:00:00' % DateTimeFormatter.exif(value)
-            elif isinstance(value, unicode):
-                try:
-                    return value.encode('utf-8')
-                except UnicodeEncodeError:
-                    raise ExifValueError(value, self.type)
-            elif isinstance(value, str):
-                return value
-            else:
-                raise ExifValueError(value, self.type)
+    def _rational_to_number(self, value):
+        if is_fraction(value) and value.numerator >= 0:
+            return (value.numerator, value.denominator)
+        else:
+            raise ExifValueError(value, self.type)
 
-        elif self.type in ('Byte', 'SByte'):
-            if isinstance(value, unicode):
-                try:
-                    return value.encode('utf-8')
-                except UnicodeEncodeError:
-                    raise ExifValueError(value, self.type)
-            elif isinstance(value, str):
-                return value
-            else:
-                raise ExifValueError(value, self.type)
+    def _srational_to_number(self, value):
+        if is_fraction(value):
+            return (value.numerator, value.denominator)
+        else:
+            raise ExifValueError(value, self.type)
 
-        elif self.type == 'Comment':
-            if value is not None and self.raw_value is not None and \
-                self.raw_value.startswith('charset='):
-                charset, val = self.raw_value.split(' ', 1)
-                charset = charset.split('=')[1].strip('"')
-                encoding = self._match_encoding(charset)
-                try:
-                    val = value.encode(encoding)
-                except UnicodeError:
-                    # Best effort, do not fail just because the original
-                    # encoding of the tag cannot encode the new value.
-                    pass
-                else:
-                    return 'charset="%s" %s' % (charset, val)
+    _typed_setters = {'Short': _short_to_number,
+                      'SShort': _sshort_to_number,
+                      'Long': _long_to_number,
+                      'SLong': _slong_to_number,
+                      'Rational': _rational_to_number,
+                      'SRational': _srational_to_number}
 
-            if isinstance(value, unicode):
-                try:
-                    return value.encode('utf-8')
-                except UnicodeEncodeError:
-                    raise ExifValueError(value, self.type)
-            elif isinstance(value, str):
-                return value
-            else:
-                raise ExifValueError(value, self.type)
+    def _short_to_string(self, value):
+        return str(self._short_to_number(value))
 
-        elif self.type == 'Short':
-            if isinstance(value, int) and value >= 0:
-                return str(value)
-            else:
-                raise ExifValueError(value, self.type)
+    def _sshort_to_string(self, value):
+        return str(self._sshort_to_number(value))
 
-        elif self.type == 'SShort':
-            if isinstance(value, int):
-                return str(value)
-            else:
-                raise ExifValueError(value, self.type)
+    def _long_to_string(self, value):
+        return str(self._long_to_number(value))
 
-        elif self.type == 'Long':
-            if isinstance(value, (int, long)) and value >= 0:
-                return str(value)
-            else:
-                raise ExifValueError(value, self.type)
+    def _slong_to_string(self, value):
+        return str(self._slong_to_number(value))
 
-        elif self.type == 'SLong':
-            if isinstance(value, (int, long)):
-                return str(value)
-            else:
-                raise ExifValueError(value, self.type)
+    def _rational_to_string(self, value):
+        self._rational_to_number(value)
+        return fraction_to_string(value)
 
-        elif self.type == 'Rational':
-            if is_fraction(value) and value.numerator >= 0:
-                return fraction_to_string(value)
-            else:
-                raise ExifValueError(value, self.type)
+    def _srational_to_string(self, value):
+        self._srational_to_number(value)
+        return fraction_to_string(value)
 
-        elif self.type == 'SRational':
-            if is_fraction(value):
-                return fraction_to_string(value)
-            else:
+    def _undefined_to_bytes(self, value):
+        if isinstance(value, unicode):
+            try:
+                return value.encode('utf-8')
+            except UnicodeEncodeError:
                 raise ExifValueError(value, self.type)
+        elif isinstance(value, str):
+            return value
+        else:
+            raise ExifValueError(value, self.type)
+
+    def _undefined_to_string(self, value):
+        return string_to_undefined(self._undefined_to_bytes(value))
+
+    _string_converters = {'Ascii': _ascii_to_string,
+                          'Byte': _byte_to_string,
+                          'SByte': _byte_to_string,
+                          'Comment': _comment_to_string,
+                          'Short': _short_to_string,
+                          'SShort': _sshort_to_string,
+                          'Long': _long_to_string,
+                          'SLong': _slong_to_string,
+                          'Rational': _rational_to_string,
+                          'SRational': _srational_to_string,
+                          'Undefined': _undefined_to_string}
 
-        elif self.type == 'Undefined':
-            if isinstance(value, unicode):
-                try:
-                    return string_to_undefined(value.encode('utf-8'))
-                except UnicodeEncodeError:
-                    raise ExifValueError(value, self.type)
-            elif isinstance(value, str):
-                return string_to_undefined(value)
-            else:
-                raise ExifValueError(value, self.type)
+    def _convert_to_string(self, value):
+        """
+        Convert one value to its corresponding string representation, suitable
+        to pass to libexiv2.
 
-        raise ExifValueError(value, self.type)
+        :param value: the value to be converted
+
+        :return: the value converted to its corresponding string representation
+        :rtype: string
+
+        :raise ExifValueError: if the conversion fails
+        """
+        try:
+            converter = self._string_converters[self.type]
+        except KeyError:
+            raise ExifValueError(value, self.type)
+        return converter(self, value)
 
     def __str__(self):
         """
@@ -456,12 +657,13 @@ class ExifTag(ListenerInterface):
         :rtype: string
         """
         left = '%s [%s]' % (self.key, self.type)
-        if self._raw_value is None:
+        raw_value = self.raw_value
+        if raw_value is None:
             right = '(No value)'
-        elif self.type == 'Undefined' and len(self._raw_value) > 100:
+        elif self.type == 'Undefined' and len(raw_value) > 100:
             right = '(Binary value suppressed)'
         else:
-             right = self._raw_value
+             right = raw_value
         return '<%s = %s>' % (left, right)
 
     # Support for pickling.
@@ -471,6 +673,9 @@ class ExifTag(ListenerInterface):
     def __setstate__(self, state):
         key, raw_value = state
         self._tag = libexiv2python._ExifTag(key)
+        self._type = None
+        self._value = None
+        self._owner = None
         self.raw_value = raw_value
 
 
@@ -501,27 +706,43 @@ class ExifThumbnail(object):
         Write the thumbnail image to a file on disk.
         The file extension will be automatically appended to the path.
 
-        :param path: path to write the thumbnail to (without an extension)
-        :type path: string
+        An open file can be passed instead of a path, either as a file
+        descriptor or as a file object (or any object with a ``write``
+        method). The thumbnail is then written at its current position.
+
+        :param path: path to write the thumbnail to (without an extension), or
+                     an open file
+        :type path: string, int or file
         """
-        self._metadata._image._writeExifThumbnailToFile(path)
+        if isinstance(path, basestring):
+            if isinstance(path, unicode):
+                path = path.encode(sys.getfilesystemencoding())
+            self._metadata._image._writeExifThumbnailToFile(path)
+        else:
+            self._metadata._image._writeExifThumbnailToFileObject(path)
 
     def _update_exif_tags_cache(self):
         # Update the cache of EXIF tags
         keys = self._metadata._image._exifKeys()
-        self._metadata._keys['exif'] = keys
+        self._metadata._set_keys('exif', keys)
         cached = self._metadata._tags['exif'].keys()
         for key in cached:
-            if key not in keys:
+            if not self._metadata._has_key('exif', key):
                 del self._metadata._tags['exif'][key]
+        self._metadata._mark_dirty()
 
     def erase(self):
         """
         Delete the thumbnail from the EXIF data.
         Removes all Exif.Thumbnail.*, i.e. Exif IFD1 tags.
         """
-        self._metadata._image._eraseExifThumbnail()
-        self._update_exif_tags_cache()
+        self._metadata.lock.acquire()
+        try:
+            self._metadata._check_mutable()
+            self._metadata._image._eraseExifThumbnail()
+            self._update_exif_tags_cache()
+        finally:
+            self._metadata.lock.release()
 
     def set_from_file(self, path):
         """
@@ -534,15 +755,25 @@ class ExifThumbnail(object):
         :param path: path to a JPEG file to set the thumbnail to
         :type path: string
         """
-        self._metadata._image._setExifThumbnailFromFile(path)
-        self._update_exif_tags_cache()
+        self._metadata.lock.acquire()
+        try:
+            self._metadata._check_mutable()
+            self._metadata._image._setExifThumbnailFromFile(path)
+            self._update_exif_tags_cache()
+        finally:
+            self._metadata.lock.release()
 
     def _get_data(self):
         return self._metadata._image._getExifThumbnailData()
 
     def _set_data(self, data):
-        self._metadata._image._setExifThumbnailFromData(data)
-        self._update_exif_tags_cache()
+        self._metadata.lock.acquire()
+        try:
+            self._metadata._check_mutable()
+            self._metadata._image._setExifThumbnailFromData(data)
+            self._update_exif_tags_cache()
+        finally:
+            self._metadata.lock.release()
 
     data = property(fget=_get_data, fset=_set_data,
                     doc='The raw thumbnail data. Setting it is restricted to ' +
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+"""
+Low-level helpers to locate and patch the metadata in image files without
+loading the whole file in memory.
+
+This module mostly exists for internal usage only. Clients should never need
+to use it.
+"""
+
+import struct
+
+
+_SOI = '\xff\xd8'
+_EOI = '\xff\xd9'
+
+# JPEG markers that are not followed by a segment length
+_STANDALONE_MARKERS = frozenset(['\x01'] + [chr(c) for c in range(0xd0, 0xd8)])
+# Start Of Scan: the entropy-coded image data follows this marker
+_SOS = '\xda'
+
+# Signatures of the segments that hold each family of metadata
+_SIGNATURES = {
+    'exif': [('\xe1', 'Exif\x00\x00')],
+    'iptc': [('\xed', 'Photoshop 3.0\x00')],
+    'xmp': [('\xe1', 'http://ns.adobe.com/xap/1.0/\x00'),
+            ('\xe1', 'http://ns.adobe.com/xmp/extension/\x00')],
+}
+
+# TIFF headers, and the corresponding byte orders
+_TIFF_MAGICS = {'II*\x00': '<', 'MM\x00*': '>'}
+
+# TIFF types, and the size in bytes of one of their components
+_TIFF_TYPES = {1: ('Byte', 1), 2: ('Ascii', 1), 3: ('Short', 2),
+               4: ('Long', 4), 5: ('Rational', 8), 6: ('SByte', 1),
+               7: ('Undefined', 1), 8: ('SShort', 2), 9: ('SLong', 4),
+               10: ('SRational', 8), 11: ('Float', 4), 12: ('Double', 8)}
+_TYPE_SIZES = dict(_TIFF_TYPES.itervalues())
+
+# struct formats of the components of the types that can be patched in place
+_PACK_FORMATS = {'Byte': 'B', 'SByte': 'b', 'Undefined': 'B', 'Short': 'H',
+                 'SShort': 'h', 'Long': 'I', 'SLong': 'i', 'Rational': 'I',
+                 'SRational': 'i'}
+
+# Tags that point to sub-IFDs, and the EXIF groups of those IFDs
+_SUB_IFDS = {('Image', 0x8769): 'Photo', ('Image', 0x8825): 'GPSInfo',
+             ('Photo', 0xa005): 'Iop'}
+
+# The SubIFDs tag, which points to the IFDs of the images of TIFF-based raw
+# formats (EXIF groups SubImage1, SubImage2, ...)
+_SUB_IMAGES = ('Image', 0x014a)
+
+# The tags of the offset and length of the thumbnail in IFD1
+_THUMBNAIL = (('Thumbnail', 0x0201), ('Thumbnail', 0x0202))
+
+
+def _jpeg_segments(fd):
+    # Iterate over the segments of a JPEG file that precede the compressed
+    # image data, yielding (marker, length, payload) tuples. The length is None
+    # for markers that are not followed by a segment length, and the iteration
+    # stops after the Start Of Scan or End Of Image marker. A marker of None
+    # signals a truncated or corrupted file.
+    while True:
+        byte = fd.read(1)
+        if byte != '\xff':
+            yield None, None, None
+            return
+        marker = fd.read(1)
+        while marker == '\xff':
+            # Fill bytes
+            marker = fd.read(1)
+        if marker == '':
+            yield None, None, None
+            return
+        if marker in (_SOS, _EOI[1]):
+            yield marker, None, ''
+            return
+        if marker in _STANDALONE_MARKERS:
+            yield marker, None, ''
+            continue
+        length = fd.read(2)
+        if len(length) != 2:
+            yield None, None, None
+            return
+        size = struct.unpack('>H', length)[0]
+        if size < 2:
+            yield None, None, None
+            return
+        payload = fd.read(size - 2)
+        if len(payload) != size - 2:
+            yield None, None, None
+            return
+        yield marker, length, payload
+
+
+def read_jpeg_header(filename, skip=()):
+    """
+    Read the header of a JPEG file, that is all the segments preceding the
+    compressed image data, in which the EXIF, IPTC and XMP metadata, the
+    comment and the image properties are stored.
+
+    The returned buffer is terminated by an End Of Image marker, so that it can
+    be parsed as a (dataless) JPEG image.
+
+    :param filename: path to an image file
+    :type filename: string
+    :param skip: the families of metadata (``exif``, ``iptc`` or ``xmp``)
+                 whose segments should be left out of the header, so that
+                 they are not parsed at all
+    :type skip: iterable of strings
+
+    :return: the header of the image, or None if the file doesn't look like a
+             JPEG image
+    :rtype: string
+    """
+    signatures = []
+    for family in skip:
+        signatures.extend(_SIGNATURES[family])
+    fd = open(filename, 'rb')
+    try:
+        if fd.read(2) != _SOI:
+            return None
+        chunks = [_SOI]
+        for marker, length, payload in _jpeg_segments(fd):
+            if marker is None:
+                # Truncated or corrupted file, let libexiv2 deal with it.
+                return None
+            if marker == _EOI[1]:
+                break
+            if length is None:
+                chunks.append('\xff' + marker)
+                continue
+            for skipped, signature in signatures:
+                if marker == skipped and payload.startswith(signature):
+                    break
+            else:
+                chunks.append('\xff' + marker + length + payload)
+        chunks.append(_EOI)
+        return ''.join(chunks)
+    finally:
+        fd.close()
+
+
+def _find_tiff_header(fd):
+    # Return the offset in the file of the TIFF header that starts the EXIF
+    # data of a TIFF or JPEG image, or None if there is none.
+    magic = fd.read(4)
+    if magic in _TIFF_MAGICS:
+        return 0
+    if magic[:2] != _SOI:
+        return None
+    fd.seek(2)
+    app1, signature = _SIGNATURES['exif'][0]
+    for marker, length, payload in _jpeg_segments(fd):
+        if marker == app1 and payload.startswith(signature):
+            return fd.tell() - len(payload) + len(signature)
+    return None
+
+
+def _read_ifds(fd, base, sub_images=False):
+    # Read the entries of the standard IFDs of the EXIF data whose TIFF header
+    # is at offset base in the file, and those of the IFDs pointed to by the
+    # SubIFDs tag if sub_images is True.
+    # Return the byte order, a dictionary mapping (group, tag number) to
+    # (type, count, offset of the value in the file) and the offset in the
+    # file of the end of the IFDs and of their values, or None if the EXIF
+    # data cannot be parsed.
+    fd.seek(base)
+    header = fd.read(8)
+    if len(header) != 8 or header[:4] not in _TIFF_MAGICS:
+        return None
+    order = _TIFF_MAGICS[header[:4]]
+    entries = {}
+    end = base + 8
+    pending = [('Image', struct.unpack(order + 'I', header[4:])[0])]
+    visited = set()
+    while pending:
+        group, offset = pending.pop()
+        if offset == 0 or offset in visited:
+            continue
+        visited.add(offset)
+        fd.seek(base + offset)
+        data = fd.read(2)
+        if len(data) != 2:
+            return None
+        count = struct.unpack(order + 'H', data)[0]
+        data = fd.read(12 * count + 4)
+        if len(data) != 12 * count + 4:
+            return None
+        end = max(end, base + offset + 2 + 12 * count + 4)
+        for i in xrange(count):
+            tag, type, n, value = \
+                struct.unpack(order + 'HHI4s', data[12 * i:12 * i + 12])
+            if type not in _TIFF_TYPES:
+                continue
+            name, size = _TIFF_TYPES[type]
+            if size * n > 4:
+                location = base + struct.unpack(order + 'I', value)[0]
+            else:
+                # The value fits in the entry itself.
+                location = base + offset + 2 + 12 * i + 8
+            entries[(group, tag)] = (name, n, location)
+            end = max(end, location + size * n)
+            if (group, tag) in _SUB_IFDS:
+                pending.append((_SUB_IFDS[(group, tag)],
+                                struct.unpack(order + 'I', value)[0]))
+            elif sub_images and (group, tag) == _SUB_IMAGES and \
+                    name == 'Long':
+                fd.seek(location)
+                offsets = fd.read(4 * n)
+                if len(offsets) != 4 * n:
+                    return None
+                offsets = struct.unpack('%s%dI' % (order, n), offsets)
+                for j, sub_offset in enumerate(offsets):
+                    pending.append(('SubImage%d' % (j + 1), sub_offset))
+        if group == 'Image':
+            # IFD1 follows IFD0
+            pending.append(('Thumbnail',
+                            struct.unpack(order + 'I', data[-4:])[0]))
+    return order, entries, end
+
+
+def read_tiff_header(filename):
+    """
+    Read the beginning of a TIFF-based image (e.g. TIFF, DNG or most raw
+    formats) up to the end of its metadata, that is its IFDs, the values of
+    their tags (including the EXIF, IPTC and XMP metadata and the maker note)
+    and the EXIF thumbnail, leaving out the image data that follows.
+
+    The offsets in the returned buffer are those of the file, so that it can be
+    parsed as a (truncated) TIFF image.
+
+    :param filename: path to an image file
+    :type filename: string
+
+    :return: the beginning of the image, or None if the file doesn't look like
+             a TIFF image, or if its metadata is not followed by image data
+             (e.g. when it is stored at the end of the file)
+    :rtype: string
+    """
+    fd = open(filename, 'rb')
+    try:
+        if fd.read(4) not in _TIFF_MAGICS:
+            return None
+        ifds = _read_ifds(fd, 0, sub_images=True)
+        if ifds is None:
+            return None
+        order, entries, end = ifds
+        try:
+            offset, length = [entries[key] for key in _THUMBNAIL]
+        except KeyError:
+            pass
+        else:
+            if offset[:2] == length[:2] == ('Long', 1):
+                fd.seek(offset[2])
+                offset = struct.unpack(order + 'I', fd.read(4))[0]
+                fd.seek(length[2])
+                length = struct.unpack(order + 'I', fd.read(4))[0]
+                end = max(end, offset + length)
+        fd.seek(0, 2)
+        if end >= fd.tell():
+            return None
+        fd.seek(0)
+        return fd.read(end)
+    finally:
+        fd.close()
+
+
+def _pack_exif_value(type, raw_value, order):
+    # Return the bytes of a raw EXIF value as stored in a TIFF structure, or
+    # None if the type is not handled or the value is invalid.
+    if type == 'Ascii':
+        return raw_value + '\x00'
+    try:
+        format = _PACK_FORMATS[type]
+        if type in ('Rational', 'SRational'):
+            numbers = []
+            for value in raw_value.split():
+                numerator, denominator = value.split('/')
+                numbers.append(int(numerator))
+                numbers.append(int(denominator))
+        else:
+            numbers = [int(value) for value in raw_value.split()]
+        return struct.pack('%s%d%s' % (order, len(numbers), format), *numbers)
+    except (KeyError, ValueError, struct.error):
+        return None
+
+
+def patch_exif_values(filename, values):
+    """
+    Overwrite the values of EXIF tags in place in a TIFF or JPEG file, without
+    rewriting the rest of the file.
+
+    This is possible only if all the tags are already present in the standard
+    IFDs of the image (groups ``Image``, ``Photo``, ``GPSInfo``, ``Iop`` and
+    ``Thumbnail``) with the same type, and if the new values have exactly the
+    same size as the old ones (e.g. a Rational, or an Ascii string of the same
+    length). Nothing is written otherwise.
+
+    :param filename: path to an image file
+    :type filename: string
+    :param values: the values to write, as (group, tag number, type, raw value)
+                   tuples
+    :type values: list of tuples
+
+    :return: whether the values were written
+    :rtype: boolean
+    """
+    fd = open(filename, 'r+b')
+    try:
+        base = _find_tiff_header(fd)
+        if base is None:
+            return False
+        ifds = _read_ifds(fd, base)
+        if ifds is None:
+            return False
+        order, entries, end = ifds
+        patches = []
+        for group, tag, type, raw_value in values:
+            try:
+                name, count, location = entries[(group, tag)]
+            except KeyError:
+                return False
+            data = _pack_exif_value(type, raw_value, order)
+            if name != type or data is None or \
+                    len(data) != count * _TYPE_SIZES[type]:
+                return False
+            patches.append((location, data))
+        # Only write once all the values are known to fit.
+        for location, data in patches:
+            fd.seek(location)
+            fd.write(data)
+        return True
+    finally:
+        fd.close()
+
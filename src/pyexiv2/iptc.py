@@ -31,11 +31,9 @@ IPTC specific code.
 import libexiv2python
 
 from pyexiv2.utils import ListenerInterface, NotifyingList, \
-                          FixedOffset, DateTimeFormatter
+                          DateTimeFormatter, DateTimeParser
 
-import time
 import datetime
-import re
 import warnings
 
 
@@ -76,10 +74,9 @@ class IptcTag(ListenerInterface):
     - Undefined: string
     """
 
-    # strptime is not flexible enough to handle all valid Time formats, we use a
-    # custom regular expression
-    _time_zone_re = r'(?P<sign>\+|-)(?P<ohours>\d{2}):(?P<ominutes>\d{2})'
-    _time_re = re.compile(r'(?P<hours>\d{2}):(?P<minutes>\d{2}):(?P<seconds>\d{2})(?P<tzd>%s)' % _time_zone_re)
+    # No per-instance dictionary, as many tags can be kept in memory at once.
+    __slots__ = ('_tag', '_raw_values', '_values', '_values_cookie',
+                 '_owner')
 
     def __init__(self, key, values=None, _tag=None):
         """
@@ -98,11 +95,25 @@ class IptcTag(ListenerInterface):
         self._raw_values = None
         self._values = None
         self._values_cookie = False
+        # The metadata the tag belongs to, if any.
+        self._owner = None
         if values is not None:
             self._set_values(values)
 
     def _set_owner(self, metadata):
         self._tag._setParentImage(metadata._image)
+        self._owner = metadata
+
+    def _mark_dirty(self):
+        # Let the metadata the tag belongs to know that its value was set, so
+        # that only the tags marked dirty are compared to their original value.
+        owner = self._owner
+        if owner is not None:
+            owner.lock.acquire()
+            try:
+                owner._mark_dirty(self.key)
+            finally:
+                owner.lock.release()
 
     @staticmethod
     def _from_existing_tag(_tag):
@@ -115,6 +126,15 @@ class IptcTag(ListenerInterface):
         tag._values_cookie = True
         return tag
 
+    @staticmethod
+    def _from_cache(key, raw_values):
+        # Build a tag from raw values read from a metadata cache. The tag does
+        # not hold the values in libexiv2.
+        tag = IptcTag(key)
+        tag._raw_values = raw_values
+        tag._values_cookie = True
+        return tag
+
     @property
     def key(self):
         """The key of the tag in the dotted form
@@ -171,6 +191,7 @@ class IptcTag(ListenerInterface):
         self._tag._setRawValues(values)
         self._raw_values = values
         self._values_cookie = True
+        self._mark_dirty()
 
     raw_value = property(fget=_get_raw_values, fset=_set_raw_values,
                          doc='The raw values of the tag as a list of strings.')
@@ -268,35 +289,15 @@ class IptcTag(ListenerInterface):
             return value
 
         elif self.type == 'Date':
-            # According to the IPTC specification, the format for a string field
-            # representing a date is '%Y%m%d'. However, the string returned by
-            # exiv2 using method DateValue::toString() is formatted using
-            # pattern '%Y-%m-%d'.
-            format = '%Y-%m-%d'
             try:
-                t = time.strptime(value, format)
-                return datetime.date(*t[:3])
+                return DateTimeParser.iptc_date(value)
             except ValueError:
                 raise IptcValueError(value, self.type)
 
         elif self.type == 'Time':
-            # According to the IPTC specification, the format for a string field
-            # representing a time is '%H%M%S±%H%M'. However, the string returned
-            # by exiv2 using method TimeValue::toString() is formatted using
-            # pattern '%H:%M:%S±%H:%M'.
-            match = IptcTag._time_re.match(value)
-            if match is None:
-                raise IptcValueError(value, self.type)
-            gd = match.groupdict()
-            try:
-                tzinfo = FixedOffset(gd['sign'], int(gd['ohours']),
-                                     int(gd['ominutes']))
-            except TypeError:
-                raise IptcValueError(value, self.type)
             try:
-                return datetime.time(int(gd['hours']), int(gd['minutes']),
-                                     int(gd['seconds']), tzinfo=tzinfo)
-            except (TypeError, ValueError):
+                return DateTimeParser.iptc_time(value)
+            except ValueError:
                 raise IptcValueError(value, self.type)
 
         elif self.type == 'Undefined':
@@ -373,5 +374,7 @@ class IptcTag(ListenerInterface):
     def __setstate__(self, state):
         key, raw_value = state
         self._tag = libexiv2python._IptcTag(key)
+        self._values = None
+        self._owner = None
         self.raw_value = raw_value
 
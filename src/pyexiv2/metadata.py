@@ -30,9 +30,9 @@ Provide the ImageMetadata class.
 
 import os
 import sys
+import threading
 from errno import ENOENT
 from collections import MutableMapping
-from itertools import chain
 import codecs
 
 import libexiv2python
@@ -41,6 +41,33 @@ from pyexiv2.exif import ExifTag, ExifThumbnail
 from pyexiv2.iptc import IptcTag
 from pyexiv2.xmp import XmpTag
 from pyexiv2.preview import Preview
+from pyexiv2.headers import read_jpeg_header, read_tiff_header, \
+                            patch_exif_values
+
+
+_FAMILIES = ('exif', 'iptc', 'xmp')
+
+# The original raw value of the tags that were not in the image.
+_ABSENT = object()
+
+
+def _compared_value(tag):
+    # The value of a tag compared to its original one to tell whether it was
+    # modified.
+    if isinstance(tag, ExifTag):
+        return tag._compared_value()
+    return tag.raw_value
+
+
+def _match(key, patterns):
+    # Whether a key matches one of the keys or wildcard patterns of a filter.
+    for pattern in patterns:
+        if pattern.endswith('*'):
+            if key.startswith(pattern[:-1]):
+                return True
+        elif key == pattern:
+            return True
+    return False
 
 
 class ImageMetadata(MutableMapping):
@@ -52,30 +79,83 @@ class ImageMetadata(MutableMapping):
     metadata embedded in image files such as JPEG and TIFF files, using Python
     types.
     It also provides access to the previews embedded in an image.
+
+    An instance can be shared by several threads: its methods and properties
+    hold its ``lock``, a reentrant lock, while they access the metadata.
+    Sequences of operations that must not be interleaved with those of other
+    threads (e.g. iterating over the keys while other threads add or delete
+    tags, or modifying the value of a tag in place) must hold the lock
+    explicitly::
+
+        with metadata.lock:
+            for key in metadata:
+                ...
+
+    Different instances can be used concurrently without any restriction,
+    as long as they do not write the same image file at the same time. Custom
+    XMP namespaces can be registered and unregistered (see
+    :func:`pyexiv2.xmp.register_namespace`) while images are being read.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, metadata_only=False):
         """
+        In metadata-only mode, only the part of the file that contains the
+        metadata is read: the headers of JPEG images, and the beginning of
+        TIFF-based images (e.g. TIFF, DNG or most raw formats) up to the end
+        of their metadata. The memory used and the amount of data read then
+        depend on the size of the metadata, not on the size of the image.
+        Other image formats, and TIFF-based images whose metadata is stored
+        after the image data, are accessed through the file directly, without
+        loading them in memory. The metadata is then read-only: it can be
+        modified, but not written back to the image.
+
         :param filename: path to an image file
         :type filename: string
+        :param metadata_only: whether to read only the metadata of the image
+        :type metadata_only: boolean
         """
         self.filename = filename
         if filename is not None and isinstance(filename, unicode):
             self.filename = filename.encode(sys.getfilesystemencoding())
+        self.metadata_only = metadata_only
+        self.lock = threading.RLock()
         self.__image = None
+        # The keys (or wildcard patterns) to read for each family in a partial
+        # read, None for a full read.
+        self._filter = None
         self._keys = {'exif': None, 'iptc': None, 'xmp': None}
+        # The same keys as sets, for membership tests
+        self._key_sets = {'exif': None, 'iptc': None, 'xmp': None}
         self._tags = {'exif': {}, 'iptc': {}, 'xmp': {}}
         self._exif_thumbnail = None
-
-    def _instantiate_image(self, filename):
+        # The keys of the tags set or deleted since the metadata was last read
+        # or written, for each family, and whether anything else (the comment,
+        # the thumbnail, whole families) was modified.
+        self._dirty = {'exif': set(), 'iptc': set(), 'xmp': set()}
+        self._modified = False
+        # The raw values (the bytes of EXIF Undefined values) of the cached,
+        # set or deleted tags when they were last read or written
+        self._originals = {}
+        # The types and raw values of the tags, mapped by key, when the
+        # metadata was read from a MetadataCache
+        self._cached = None
+
+    def _instantiate_image(self, filename, skip=()):
         # This method is meant to be overridden in unit tests to easily replace
         # the internal image reference by a mock.
+        # skip is a list of families of metadata that need not be parsed.
         if not os.path.exists(filename) or not os.path.isfile(filename):
             raise IOError(ENOENT, os.strerror(ENOENT), filename)
         # Remember the reference timestamps before doing any access to the file
         stat = os.stat(filename)
         self._atime = stat.st_atime
         self._mtime = stat.st_mtime
+        if self.metadata_only or skip:
+            header = read_jpeg_header(filename, skip)
+            if header is None and self.metadata_only:
+                header = read_tiff_header(filename)
+            if header is not None:
+                return libexiv2python._Image(header, len(header))
         return libexiv2python._Image(filename)
 
     @classmethod
@@ -83,82 +163,418 @@ class ImageMetadata(MutableMapping):
         """
         Instantiate an image container from an image buffer.
 
+        Any object that supports the buffer interface is accepted (e.g. a
+        string, a bytearray, a memoryview or a mmap). The contents of
+        read-only buffers such as strings are used in place, without being
+        copied, and are never modified. Other buffers are copied once.
+
         :param buffer: a buffer containing image data
-        :type buffer: string
+        :type buffer: string or any object that supports the buffer interface
         """
         obj = cls(None)
-        obj.__image = libexiv2python._Image(buffer, len(buffer))
+        # The size of the buffer in bytes
+        size = len(buffer) * getattr(buffer, 'itemsize', 1)
+        obj.__image = libexiv2python._Image(buffer, size)
         return obj
 
     @property
     def _image(self):
-        if self.__image is None:
-            raise IOError('Image metadata has not been read yet')
-        return self.__image
-
-    def read(self):
+        self.lock.acquire()
+        try:
+            if self.__image is None:
+                if self._cached is None:
+                    raise IOError('Image metadata has not been read yet')
+                # The metadata was read from a cache, read the image on demand.
+                self.__image = self._instantiate_image(self.filename)
+                self.__image._readMetadata()
+            return self.__image
+        finally:
+            self.lock.release()
+
+    def read(self, keys=None, families=None, cache=None):
         """
         Read the metadata embedded in the associated image.
         It is necessary to call this method once before attempting to access
         the metadata (an exception will be raised if trying to access metadata
         before calling this method).
+
+        The metadata can be partially read, restricted to some families and/or
+        to some keys. Only the requested tags are then available, and the keys
+        of those set in the image are retrieved in one go. For JPEG images,
+        the metadata of the families that are not requested is not even
+        parsed, which saves a lot of time when e.g. no XMP tag is needed.
+        The metadata of a partially read image is read-only: it can be
+        modified, but not written back to the image.
+
+        :param keys: the keys of the tags to read, a key ending with ``*``
+                     matches all the keys that start with the preceding
+                     characters (e.g. ``Exif.GPSInfo.*``)
+        :type keys: iterable of strings
+        :param families: the families of metadata to read (``exif``, ``iptc``
+                         and/or ``xmp``), defaults to all of them
+        :type families: iterable of strings
+        :param cache: a cache to read the metadata from, if the image was not
+                      modified since it was cached, and to store it into
+                      otherwise. The image itself is then read only when
+                      needed (e.g. to access the comment or the previews),
+                      and the metadata is read-only. The cache is not used for
+                      partial reads, nor for images instantiated from a buffer.
+        :type cache: :class:`pyexiv2.cache.MetadataCache`
+
+        :raise ValueError: if a family is invalid
         """
-        if self.__image is None:
-            self.__image = self._instantiate_image(self.filename)
-        self.__image._readMetadata()
+        self.lock.acquire()
+        try:
+            if keys is None and families is None:
+                filter = None
+                skip = []
+            else:
+                filter = self._parse_filter(keys, families)
+                skip = [family for family in _FAMILIES if family not in filter]
+            if self.filename is None or filter is not None:
+                cache = None
+            if cache is not None:
+                items = cache.get(self.filename)
+                if items is not None:
+                    self._read_from_cache(items)
+                    return
+                stat = os.stat(self.filename)
+            if self.filename is None:
+                # An image instantiated from a buffer can only be filtered.
+                if self._filter is not None or filter is not None:
+                    self._reset(self.__image)
+            elif self.__image is None or self._filter is not None or \
+                    self._cached is not None or skip:
+                # (Re)instantiate the image if some metadata was left out of
+                # the current one or is to be left out of the new one.
+                self._reset(self._instantiate_image(self.filename, skip))
+            self._filter = filter
+            self.__image._readMetadata()
+            self._clean()
+            if cache is not None:
+                items = {}
+                for family in _FAMILIES:
+                    items[family] = self.items_raw(family)
+                cache.put(self.filename, items, stat)
+            if filter is None:
+                return
+            for family in _FAMILIES:
+                if family in filter:
+                    keys = getattr(self.__image, '_%sKeys' % family)
+                    self._set_keys(family, keys(filter[family]))
+                else:
+                    self._set_keys(family, [])
+        finally:
+            self.lock.release()
+
+    @staticmethod
+    def _parse_filter(keys, families):
+        # Return a dictionary mapping the requested families to the keys to
+        # read, or None to read all the keys of a family.
+        if families is None:
+            families = _FAMILIES
+        filter = {}
+        for family in families:
+            family = family.lower()
+            if family not in _FAMILIES:
+                raise ValueError('Invalid metadata family: %s' % family)
+            filter[family] = None
+        if keys is None:
+            return filter
+        patterns = {}
+        for key in keys:
+            family = key.split('.')[0].lower()
+            if family in filter:
+                patterns.setdefault(family, []).append(key)
+        return patterns
+
+    def _read_from_cache(self, items):
+        # Use the metadata read from a cache, without reading the image.
+        self._reset(None)
+        self._filter = None
+        self._cached = {}
+        for family in _FAMILIES:
+            self._set_keys(family, [key for key, type, value in items[family]])
+            for key, type, value in items[family]:
+                self._cached[key] = (type, value)
+
+    def _reset(self, image):
+        # Use a new internal image, and empty the caches.
+        self.__image = image
+        self._cached = None
+        for family in _FAMILIES:
+            self._set_keys(family, None)
+        self._tags = {'exif': {}, 'iptc': {}, 'xmp': {}}
+        self._exif_thumbnail = None
+        self._originals = {}
+        self._clean()
+
+    def _check_writable(self):
+        if self.__image is None and self._cached is None:
+            raise IOError('Image metadata has not been read yet')
+        if self.metadata_only:
+            raise IOError('Image metadata was read in metadata-only mode')
+        if self._filter is not None:
+            raise IOError('Image metadata was only partially read')
+        if self._cached is not None:
+            raise IOError('Image metadata was read from a cache')
+
+    def _check_mutable(self):
+        # Overridden by the read-only views of the metadata shared by
+        # pyexiv2.cache.open_cached.
+        pass
+
+    def _mark_dirty(self, key=None):
+        # Record the modification of the tag with the given key, or of
+        # something else than a single tag if no key is given.
+        if key is None:
+            self._modified = True
+        else:
+            self._dirty[key.split('.')[0].lower()].add(key)
+
+    def _clean(self):
+        # Forget about all the modifications, the metadata is now in sync with
+        # the image.
+        # Only the tags marked dirty may differ from their original value.
+        for family in _FAMILIES:
+            tags = self._tags[family]
+            for key in self._dirty[family]:
+                tag = tags.get(key)
+                if tag is None:
+                    self._originals.pop(key, None)
+                else:
+                    self._originals[key] = _compared_value(tag)
+            self._dirty[family].clear()
+        self._modified = False
+
+    def _remember_original(self, family, key):
+        # Remember the raw value of a tag about to be set or deleted, if it is
+        # in the image and not known yet, so that setting a tag to the value it
+        # already has is not taken for a modification.
+        if key not in self._tags[family] and key not in self._originals and \
+                self._has_key(family, key):
+            getattr(self, '_get_%s_tag' % family)(key)
+
+    def _dirty_keys(self):
+        # Return the keys of the tags modified since the metadata was last read
+        # or written, for each family: the tags set, deleted or modified in
+        # place whose raw value differs from the one in the image. Only the
+        # tags marked dirty by their setters are compared.
+        dirty = {}
+        for family in _FAMILIES:
+            tags = self._tags[family]
+            keys = set()
+            for key in self._dirty[family]:
+                original = self._originals.get(key, _ABSENT)
+                tag = tags.get(key)
+                if tag is None:
+                    value = _ABSENT
+                else:
+                    value = _compared_value(tag)
+                if value is not original and value != original:
+                    keys.add(key)
+            dirty[family] = keys
+        return dirty
 
-    def write(self, preserve_timestamps=False):
+    @property
+    def modified(self):
+        """Whether the metadata was modified since it was last read or
+        written."""
+        self.lock.acquire()
+        try:
+            return self._modified or any(self._dirty_keys().itervalues())
+        finally:
+            self.lock.release()
+
+    def _patch_exif(self, dirty):
+        # Try to overwrite the modified EXIF values in place in the image file,
+        # return whether it was possible.
+        if self.filename is None or self._modified or \
+                dirty['iptc'] or dirty['xmp']:
+            return False
+        values = []
+        for key in dirty['exif']:
+            try:
+                tag = self._tags['exif'][key]
+            except KeyError:
+                # The tag was deleted.
+                return False
+            group = key.split('.')[1]
+            values.append((group, tag._tag._getTag(), tag.type, tag.raw_value))
+        return patch_exif_values(self.filename, values)
+
+    def write(self, preserve_timestamps=False, in_place=False):
         """
         Write the metadata back to the image.
 
+        Only the modifications made since the metadata was last read or
+        written are taken into account: if nothing was modified, the image is
+        left untouched.
+
+        By default, the whole image is rewritten. In in-place mode, if only
+        EXIF tags were modified and their new values have exactly the same
+        size as the old ones (e.g. a Rational, or an Ascii string of the same
+        length), those values are overwritten directly in the image file
+        instead, which is a lot cheaper for large images. The whole image is
+        rewritten as usual otherwise.
+
         :param preserve_timestamps: whether to preserve the file's original
                                     timestamps (access time and modification
                                     time)
         :type preserve_timestamps: boolean
+        :param in_place: whether to overwrite the modified EXIF values in place
+                         when possible
+        :type in_place: boolean
+
+        :raise IOError: if the metadata was read in metadata-only mode
         """
-        self._image._writeMetadata()
-        if self.filename is None:
-            return
-        if preserve_timestamps:
-            # Revert to the original timestamps
-            os.utime(self.filename, (self._atime, self._mtime))
-        else:
-            # Reset the reference timestamps
-            stat = os.stat(self.filename)
-            self._atime = stat.st_atime
-            self._mtime = stat.st_mtime
+        self.lock.acquire()
+        try:
+            self._check_writable()
+            dirty = self._dirty_keys()
+            if not self._modified and not any(dirty.itervalues()):
+                # Nothing to write
+                return
+            if not (in_place and self._patch_exif(dirty)):
+                self._image._writeMetadata()
+            self._clean()
+            if self.filename is None:
+                return
+            if preserve_timestamps:
+                # Revert to the original timestamps
+                os.utime(self.filename, (self._atime, self._mtime))
+            else:
+                # Reset the reference timestamps
+                stat = os.stat(self.filename)
+                self._atime = stat.st_atime
+                self._mtime = stat.st_mtime
+        finally:
+            self.lock.release()
 
     @property
     def dimensions(self):
         """A tuple containing the width and height of the image, expressed in
         pixels."""
-        return (self._image._getPixelWidth(), self._image._getPixelHeight())
+        self.lock.acquire()
+        try:
+            return (self._image._getPixelWidth(),
+                    self._image._getPixelHeight())
+        finally:
+            self.lock.release()
 
     @property
     def mime_type(self):
         """The mime type of the image, as a string."""
-        return self._image._getMimeType()
+        self.lock.acquire()
+        try:
+            return self._image._getMimeType()
+        finally:
+            self.lock.release()
+
+    def _set_keys(self, family, keys):
+        # Set the list of the keys of a family, or None to read it from the
+        # image when first needed.
+        self._keys[family] = keys
+        self._key_sets[family] = None
+
+    def _family_keys(self, family):
+        # Return the list of the keys of a family.
+        keys = self._keys[family]
+        if keys is None:
+            keys = getattr(self._image, '_%sKeys' % family)()
+            self._set_keys(family, keys)
+        return keys
+
+    def _has_key(self, family, key):
+        # Whether a tag is set, without a linear search through the keys.
+        key_set = self._key_sets[family]
+        if key_set is None:
+            key_set = set(self._family_keys(family))
+            self._key_sets[family] = key_set
+        return key in key_set
+
+    def _add_key(self, family, key):
+        if not self._has_key(family, key):
+            self._keys[family].append(key)
+            self._key_sets[family].add(key)
+
+    def _remove_key(self, family, key):
+        if self._has_key(family, key):
+            self._keys[family].remove(key)
+            self._key_sets[family].discard(key)
 
     @property
     def exif_keys(self):
         """List of the keys of the available EXIF tags."""
-        if self._keys['exif'] is None:
-            self._keys['exif'] = self._image._exifKeys()
-        return self._keys['exif']
+        self.lock.acquire()
+        try:
+            return self._family_keys('exif')
+        finally:
+            self.lock.release()
 
     @property
     def iptc_keys(self):
         """List of the keys of the available IPTC tags."""
-        if self._keys['iptc'] is None:
-            self._keys['iptc'] = self._image._iptcKeys()
-        return self._keys['iptc']
+        self.lock.acquire()
+        try:
+            return self._family_keys('iptc')
+        finally:
+            self.lock.release()
 
     @property
     def xmp_keys(self):
         """List of the keys of the available XMP tags."""
-        if self._keys['xmp'] is None:
-            self._keys['xmp'] = self._image._xmpKeys()
-        return self._keys['xmp']
+        self.lock.acquire()
+        try:
+            return self._family_keys('xmp')
+        finally:
+            self.lock.release()
+
+    def items_raw(self, family, keys=None):
+        """
+        Return the raw contents of all the tags of a family in one go.
+
+        This is a lot cheaper than iterating over the keys and accessing each
+        tag individually, as no tag object is instantiated and no
+        descriptive information (label, description, …) is looked up.
+
+        The type is the EXIF or IPTC type of the tag (e.g. ``Ascii``,
+        ``Short``), or the libexiv2 type of the value for XMP tags (one of
+        ``XmpText``, ``XmpAlt``, ``XmpBag``, ``XmpSeq``, ``LangAlt``).
+        The raw value is what the ``raw_value`` property of the corresponding
+        tag would return.
+
+        :param family: one of ``exif``, ``iptc`` or ``xmp``
+        :type family: string
+
+        :param keys: the keys of the tags to return, a key ending with ``*``
+                     matches all the keys that start with the preceding
+                     characters (e.g. ``Exif.GPSInfo.*``), defaults to all
+                     the keys
+        :type keys: iterable of strings
+
+        :return: a list of (key, type, raw value) tuples
+        :rtype: list
+
+        :raise ValueError: if the family is invalid
+        """
+        self.lock.acquire()
+        try:
+            family = family.lower()
+            if family not in _FAMILIES:
+                raise ValueError('Invalid metadata family: %s' % family)
+            if keys is None and self._filter is not None:
+                keys = self._filter.get(family, [])
+            elif keys is not None:
+                keys = list(keys)
+            if self._cached is not None:
+                return [(key,) + self._cached[key]
+                        for key in getattr(self, '%s_keys' % family)
+                        if key in self._cached and (keys is None or
+                                                    _match(key, keys))]
+            return getattr(self._image, '_%sItems' % family)(keys)
+        finally:
+            self.lock.release()
 
     def _get_exif_tag(self, key):
         # Return the EXIF tag for the given key.
@@ -166,9 +582,15 @@ class ImageMetadata(MutableMapping):
         try:
             return self._tags['exif'][key]
         except KeyError:
-            _tag = self._image._getExifTag(key)
-            tag = ExifTag._from_existing_tag(_tag)
+            if self._cached is not None:
+                type, raw_value = self._cached[key]
+                tag = ExifTag._from_cache(key, type, raw_value)
+            else:
+                _tag = self._image._getExifTag(key)
+                tag = ExifTag._from_existing_tag(_tag)
+            tag._owner = self
             self._tags['exif'][key] = tag
+            self._originals[key] = _compared_value(tag)
             return tag
 
     def _get_iptc_tag(self, key):
@@ -177,9 +599,14 @@ class ImageMetadata(MutableMapping):
         try:
             return self._tags['iptc'][key]
         except KeyError:
-            _tag = self._image._getIptcTag(key)
-            tag = IptcTag._from_existing_tag(_tag)
+            if self._cached is not None:
+                tag = IptcTag._from_cache(key, self._cached[key][1])
+            else:
+                _tag = self._image._getIptcTag(key)
+                tag = IptcTag._from_existing_tag(_tag)
+            tag._owner = self
             self._tags['iptc'][key] = tag
+            self._originals[key] = _compared_value(tag)
             return tag
 
     def _get_xmp_tag(self, key):
@@ -188,9 +615,14 @@ class ImageMetadata(MutableMapping):
         try:
             return self._tags['xmp'][key]
         except KeyError:
-            _tag = self._image._getXmpTag(key)
-            tag = XmpTag._from_existing_tag(_tag)
+            if self._cached is not None:
+                tag = XmpTag._from_cache(key, self._cached[key][1])
+            else:
+                _tag = self._image._getXmpTag(key)
+                tag = XmpTag._from_existing_tag(_tag)
+            tag._owner = self
             self._tags['xmp'][key] = tag
+            self._originals[key] = _compared_value(tag)
             return tag
 
     def __getitem__(self, key):
@@ -204,11 +636,20 @@ class ImageMetadata(MutableMapping):
 
         :raise KeyError: if the tag doesn't exist
         """
-        family = key.split('.')[0].lower()
-        if family in ('exif', 'iptc', 'xmp'):
-            return getattr(self, '_get_%s_tag' % family)(key)
-        else:
-            raise KeyError(key)
+        self.lock.acquire()
+        try:
+            family = key.split('.')[0].lower()
+            if family in _FAMILIES:
+                if (self._filter is not None or self._cached is not None) and \
+                        not self._has_key(family, key):
+                    # The tag was not requested in a partial read, or was
+                    # deleted since it was read from a cache.
+                    raise KeyError(key)
+                return getattr(self, '_get_%s_tag' % family)(key)
+            else:
+                raise KeyError(key)
+        finally:
+            self.lock.release()
 
     def _set_exif_tag(self, key, tag_or_value):
         # Set an EXIF tag. If the tag already exists, its value is overwritten.
@@ -217,10 +658,11 @@ class ImageMetadata(MutableMapping):
         else:
             # As a handy shortcut, accept direct value assignment.
             tag = ExifTag(key, tag_or_value)
+        self._remember_original('exif', tag.key)
         tag._set_owner(self)
         self._tags['exif'][tag.key] = tag
-        if tag.key not in self.exif_keys:
-            self._keys['exif'].append(tag.key)
+        self._mark_dirty(tag.key)
+        self._add_key('exif', tag.key)
 
     def _set_iptc_tag(self, key, tag_or_values):
         # Set an IPTC tag. If the tag already exists, its values are
@@ -230,10 +672,11 @@ class ImageMetadata(MutableMapping):
         else:
             # As a handy shortcut, accept direct value assignment.
             tag = IptcTag(key, tag_or_values)
+        self._remember_original('iptc', tag.key)
         tag._set_owner(self)
         self._tags['iptc'][tag.key] = tag
-        if tag.key not in self.iptc_keys:
-            self._keys['iptc'].append(tag.key)
+        self._mark_dirty(tag.key)
+        self._add_key('iptc', tag.key)
 
     def _set_xmp_tag(self, key, tag_or_value):
         # Set an XMP tag. If the tag already exists, its value is overwritten.
@@ -242,10 +685,11 @@ class ImageMetadata(MutableMapping):
         else:
             # As a handy shortcut, accept direct value assignment.
             tag = XmpTag(key, tag_or_value)
+        self._remember_original('xmp', tag.key)
         tag._set_owner(self)
         self._tags['xmp'][tag.key] = tag
-        if tag.key not in self.xmp_keys:
-            self._keys['xmp'].append(tag.key)
+        self._mark_dirty(tag.key)
+        self._add_key('xmp', tag.key)
 
     def __setitem__(self, key, tag_or_value):
         """
@@ -266,53 +710,61 @@ class ImageMetadata(MutableMapping):
 
         :raise KeyError: if the key is invalid
         """
-        family = key.split('.')[0].lower()
-        if family in ('exif', 'iptc', 'xmp'):
-            return getattr(self, '_set_%s_tag' % family)(key, tag_or_value)
-        else:
-            raise KeyError(key)
+        self.lock.acquire()
+        try:
+            self._check_mutable()
+            family = key.split('.')[0].lower()
+            if family in ('exif', 'iptc', 'xmp'):
+                return getattr(self, '_set_%s_tag' % family)(key, tag_or_value)
+            else:
+                raise KeyError(key)
+        finally:
+            self.lock.release()
 
     def _delete_exif_tag(self, key):
         # Delete an EXIF tag.
         # Throw a KeyError if the tag doesn't exist.
-        if key not in self.exif_keys:
+        if not self._has_key('exif', key):
             raise KeyError('Cannot delete an inexistent tag')
+        self._remember_original('exif', key)
         self._image._deleteExifTag(key)
+        self._mark_dirty(key)
         try:
             del self._tags['exif'][key]
         except KeyError:
             # The tag was not cached.
             pass
-        if self._keys['exif'] is not None:
-            self._keys['exif'].remove(key)
+        self._remove_key('exif', key)
 
     def _delete_iptc_tag(self, key):
         # Delete an IPTC tag.
         # Throw a KeyError if the tag doesn't exist.
-        if key not in self.iptc_keys:
+        if not self._has_key('iptc', key):
             raise KeyError('Cannot delete an inexistent tag')
+        self._remember_original('iptc', key)
         self._image._deleteIptcTag(key)
+        self._mark_dirty(key)
         try:
             del self._tags['iptc'][key]
         except KeyError:
             # The tag was not cached.
             pass
-        if self._keys['iptc'] is not None:
-            self._keys['iptc'].remove(key)
+        self._remove_key('iptc', key)
 
     def _delete_xmp_tag(self, key):
         # Delete an XMP tag.
         # Throw a KeyError if the tag doesn't exist.
-        if key not in self.xmp_keys:
+        if not self._has_key('xmp', key):
             raise KeyError('Cannot delete an inexistent tag')
+        self._remember_original('xmp', key)
         self._image._deleteXmpTag(key)
+        self._mark_dirty(key)
         try:
             del self._tags['xmp'][key]
         except KeyError:
             # The tag was not cached.
             pass
-        if self._keys['xmp'] is not None:
-            self._keys['xmp'].remove(key)
+        self._remove_key('xmp', key)
 
     def __delitem__(self, key):
         """
@@ -325,29 +777,55 @@ class ImageMetadata(MutableMapping):
 
         :raise KeyError: if the tag with the given key doesn't exist
         """
-        family = key.split('.')[0].lower()
-        if family in ('exif', 'iptc', 'xmp'):
-            return getattr(self, '_delete_%s_tag' % family)(key)
-        else:
-            raise KeyError(key)
+        self.lock.acquire()
+        try:
+            self._check_mutable()
+            family = key.split('.')[0].lower()
+            if family in ('exif', 'iptc', 'xmp'):
+                return getattr(self, '_delete_%s_tag' % family)(key)
+            else:
+                raise KeyError(key)
+        finally:
+            self.lock.release()
 
     def __iter__(self):
-        return chain(self.exif_keys, self.iptc_keys, self.xmp_keys)
+        # Iterate over a snapshot of the keys, which other threads may modify.
+        self.lock.acquire()
+        try:
+            return iter(self.exif_keys + self.iptc_keys + self.xmp_keys)
+        finally:
+            self.lock.release()
 
     def __len__(self):
         return len( [ x for x in self ] )
 
     def _get_comment(self):
-        return self._image._getComment()
+        self.lock.acquire()
+        try:
+            return self._image._getComment()
+        finally:
+            self.lock.release()
 
     def _set_comment(self, comment):
-        if comment is not None:
-            self._image._setComment(comment)
-        else:
-            self._del_comment()
+        self.lock.acquire()
+        try:
+            self._check_mutable()
+            if comment is not None:
+                self._image._setComment(comment)
+                self._mark_dirty()
+            else:
+                self._del_comment()
+        finally:
+            self.lock.release()
 
     def _del_comment(self):
-        self._image._clearComment()
+        self.lock.acquire()
+        try:
+            self._check_mutable()
+            self._image._clearComment()
+            self._mark_dirty()
+        finally:
+            self.lock.release()
 
     comment = property(fget=_get_comment, fset=_set_comment, fdel=_del_comment,
                        doc='The image comment.')
@@ -355,8 +833,14 @@ class ImageMetadata(MutableMapping):
     @property
     def previews(self):
         """List of the previews available in the image, sorted by increasing
-        size."""
-        return [Preview(preview) for preview in self._image._previews()]
+        size. Their data is extracted from the image only when accessed."""
+        self.lock.acquire()
+        try:
+            image = self._image
+            return [Preview(preview, image, self.lock)
+                    for preview in image._previews()]
+        finally:
+            self.lock.release()
 
     def copy(self, other, exif=True, iptc=True, xmp=True, comment=True):
         """
@@ -377,19 +861,30 @@ class ImageMetadata(MutableMapping):
         :param comment: whether to copy the image comment
         :type comment: boolean
         """
-        self._image._copyMetadata(other._image, exif, iptc, xmp)
-        # Empty the cache where needed
-        if exif:
-            other._keys['exif'] = None
-            other._tags['exif'] = {}
-        if iptc:
-            other._keys['iptc'] = None
-            other._tags['iptc'] = {}
-        if xmp:
-            other._keys['xmp'] = None
-            other._tags['xmp'] = {}
-        if comment:
-            other.comment = self.comment
+        # Lock both images, always in the same order to avoid deadlocks.
+        locks = sorted([self.lock, other.lock], key=id)
+        for lock in locks:
+            lock.acquire()
+        try:
+            other._check_mutable()
+            self._image._copyMetadata(other._image, exif, iptc, xmp)
+            # Empty the cache where needed
+            if exif:
+                other._set_keys('exif', None)
+                other._tags['exif'] = {}
+            if iptc:
+                other._set_keys('iptc', None)
+                other._tags['iptc'] = {}
+            if xmp:
+                other._set_keys('xmp', None)
+                other._tags['xmp'] = {}
+            if exif or iptc or xmp:
+                other._mark_dirty()
+            if comment:
+                other.comment = self.comment
+        finally:
+            for lock in reversed(locks):
+                lock.release()
 
     @property
     def buffer(self):
@@ -397,15 +892,25 @@ class ImageMetadata(MutableMapping):
         The image buffer as a string.
         If metadata has been modified, the data won't be up-to-date until
         :meth:`.write` has been called.
+        Not available in metadata-only mode.
+
+        :raise IOError: if the metadata was read in metadata-only mode
         """
+        # Partial and cached reads still give access to the whole image.
+        if self.metadata_only:
+            raise IOError('Image metadata was read in metadata-only mode')
         return self._image._getDataBuffer()
 
     @property
     def exif_thumbnail(self):
         """A thumbnail image optionally embedded in the EXIF data."""
-        if self._exif_thumbnail is None:
-            self._exif_thumbnail = ExifThumbnail(self)
-        return self._exif_thumbnail
+        self.lock.acquire()
+        try:
+            if self._exif_thumbnail is None:
+                self._exif_thumbnail = ExifThumbnail(self)
+            return self._exif_thumbnail
+        finally:
+            self.lock.release()
 
     def _get_iptc_charset(self):
         value = self._image._getIptcCharset()
@@ -28,14 +28,34 @@
 Provide the Preview class.
 """
 
+import sys
+
 class Preview(object):
 
     """
     A preview image (properties and data buffer) embedded in image metadata.
+
+    The properties of the preview are known without extracting it from the
+    image, its data is extracted only when accessed.
     """
 
-    def __init__(self, preview):
+    __slots__ = ('__preview', '__image', '__lock', '__data')
+
+    def __init__(self, preview, _image, _lock=None):
         self.__preview = preview
+        self.__image = _image
+        # The lock of the metadata the preview belongs to, held while the
+        # preview is extracted so that the metadata is not modified meanwhile
+        self.__lock = _lock
+        self.__data = None
+
+    def _acquire(self):
+        if self.__lock is not None:
+            self.__lock.acquire()
+
+    def _release(self):
+        if self.__lock is not None:
+            self.__lock.release()
 
     @property
     def mime_type(self):
@@ -61,16 +81,37 @@ class Preview(object):
 
     @property
     def data(self):
-        """The preview image data buffer."""
-        return self.__preview.data
+        """The preview image data buffer, extracted from the image on first
+        access."""
+        if self.__data is None:
+            self._acquire()
+            try:
+                self.__data = self.__image._getPreviewData(self.__preview)
+            finally:
+                self._release()
+        return self.__data
 
     def write_to_file(self, path):
         """
         Write the preview image to a file on disk.
         The file extension will be automatically appended to the path.
 
-        :param path: path to write the preview to (without an extension)
-        :type path: string
+        An open file can be passed instead of a path, either as a file
+        descriptor or as a file object (or any object with a ``write``
+        method). The preview is then written at its current position.
+
+        :param path: path to write the preview to (without an extension), or
+                     an open file
+        :type path: string, int or file
         """
-        return self.__preview.write_to_file(path)
+        if isinstance(path, basestring) and isinstance(path, unicode):
+            path = path.encode(sys.getfilesystemencoding())
+        self._acquire()
+        try:
+            if isinstance(path, basestring):
+                self.__image._writePreviewToFile(self.__preview, path)
+            else:
+                self.__image._writePreviewToFileObject(self.__preview, path)
+        finally:
+            self._release()
 
@@ -33,6 +33,7 @@ from __future__ import division
 
 import datetime
 import re
+import time
 
 # pyexiv2 uses fractions.Fraction when available (Python ≥ 2.6), or falls back
 # on the custom Rational class. This should be transparent to the application
@@ -120,18 +121,54 @@ class FixedOffset(datetime.tzinfo):
         else:
             return '%s%02d:%02d' % (self.sign, self.hours, self.minutes)
 
-    def __equal__(self, other):
+    def _total_minutes(self):
+        total = self.hours * 60 + self.minutes
+        if self.sign == '-':
+            total = -total
+        return total
+
+    def __eq__(self, other):
         """
         Test equality between this offset and another offset.
 
+        Two offsets are equal if and only if they represent the same offset
+        from UTC (e.g. ``+00:00`` and ``-00:00`` are equal).
+
         :param other: another offset
         :type other: :class:`FixedOffset`
 
         :return: True if the offset are equal, False otherwise
         :rtype: boolean
         """
-        return (self.sign == other.sign) and (self.hours == other.hours) and \
-            (self.minutes == other.minutes)
+        if not isinstance(other, FixedOffset):
+            return NotImplemented
+        return self._total_minutes() == other._total_minutes()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self._total_minutes())
+
+
+# Shared FixedOffset instances, indexed by (sign, hours, minutes).
+# There are only so many offsets in use around the world, so instead of
+# instantiating a new offset for each date or time parsed, the parsers
+# return the same instance for the same offset. Those instances should
+# therefore never be modified.
+_fixed_offsets = {}
+
+def _fixed_offset(sign='+', hours=0, minutes=0):
+    # Return a shared FixedOffset instance.
+    key = (sign, hours, minutes)
+    try:
+        return _fixed_offsets[key]
+    except KeyError:
+        return _fixed_offsets.setdefault(key,
+                                         FixedOffset(sign, hours, minutes))
 
 
 def undefined_to_string(undefined):
@@ -142,6 +179,9 @@ def undefined_to_string(undefined):
     "0221").
     The Undefined type is part of the EXIF specification.
 
+    This is a compatibility helper for raw values, the values of the EXIF tags
+    read from an image are obtained from libexiv2 as bytes.
+
     :param undefined: an undefined string
     :type undefined: string
 
@@ -158,6 +198,9 @@ def string_to_undefined(sequence):
     spaces (e.g. "0221" will be converted into "48 50 50 49").
     The Undefined type is part of the EXIF specification.
 
+    This is a compatibility helper for raw values, the values of the EXIF tags
+    are passed to libexiv2 as bytes.
+
     :param sequence: a sequence of bytes
     :type sequence: string
 
@@ -345,6 +388,9 @@ class ListenerInterface(object):
     should implement.
     """
 
+    # Do not force a per-instance dictionary on implementations.
+    __slots__ = ()
+
     def contents_changed(self):
         """
         React on changes on the object observed.
@@ -470,7 +516,7 @@ class GPSCoordinate(object):
 
     _format_re = \
         re.compile(r'(?P<degrees>-?\d+),'
-                    '(?P<minutes>\d+)(,(?P<seconds>\d+)|\.(?P<fraction>\d+))'
+                    '(?P<minutes>\d+)(?:,(?P<seconds>\d+)|\.(?P<fraction>\d+))'
                     '(?P<direction>[NSEW])')
 
     def __init__(self, degrees, minutes, seconds, direction):
@@ -541,14 +587,12 @@ class GPSCoordinate(object):
         match = GPSCoordinate._format_re.match(string)
         if match is None:
             raise ValueError('Invalid format for a GPS coordinate: %s' % string)
-        gd = match.groupdict()
-        fraction = gd['fraction']
+        degrees, minutes, seconds, fraction, direction = match.groups()
         if fraction is not None:
             seconds = int(round(int(fraction[:2]) * 0.6))
         else:
-            seconds = int(gd['seconds'])
-        return GPSCoordinate(int(gd['degrees']), int(gd['minutes']), seconds,
-                             gd['direction'])
+            seconds = int(seconds)
+        return GPSCoordinate(int(degrees), int(minutes), seconds, direction)
 
     def __eq__(self, other):
         """
@@ -733,3 +777,206 @@ class DateTimeFormatter(object):
             raise TypeError('expecting an object of type '
                             'datetime.datetime or datetime.date')
 
+
+
+class DateTimeParser(object):
+
+    """
+    Convenience object that exposes static methods to parse the string
+    representations of dates and times found in the various metadata
+    standards.
+
+    The common, fixed-width representations are parsed by hand, which is a lot
+    faster than using :func:`time.strptime`.
+
+    This class mostly exists for internal usage only. Clients should never need
+    to use it.
+    """
+
+    # According to the EXIF specification, the only accepted format for an Ascii
+    # value representing a datetime is '%Y:%m:%d %H:%M:%S', but it seems that
+    # others formats can be found in the wild.
+    _exif_datetime_formats = ('%Y:%m:%d %H:%M:%S',
+                              '%Y-%m-%d %H:%M:%S',
+                              '%Y-%m-%dT%H:%M:%SZ')
+
+    _exif_date_formats = ('%Y:%m:%d',)
+
+    # strptime is not flexible enough to handle all valid XMP Date formats, nor
+    # the IPTC Time format. Only named groups capture, so that all the
+    # components are extracted in one go with match.groups().
+    _xmp_date_re = re.compile(
+        r'(?P<year>\d{4})(?:-(?P<month>\d{2})(?:-(?P<day>\d{2})'
+        r'(?:T(?P<hours>\d{2})(?::(?P<minutes>\d{2})'
+        r'(?::(?P<seconds>\d{2})(?:.(?P<decimal>\d+))?)?'
+        r'(?P<tzd>Z|(?P<sign>\+|-)(?P<ohours>\d{2}):(?P<ominutes>\d{2})))?)?)?)?')
+
+    _iptc_time_re = re.compile(
+        r'(?P<hours>\d{2}):(?P<minutes>\d{2}):(?P<seconds>\d{2})'
+        r'(?P<sign>\+|-)(?P<ohours>\d{2}):(?P<ominutes>\d{2})')
+
+    @staticmethod
+    def exif(value):
+        """
+        Parse a date or a datetime from its string representation in an EXIF
+        Ascii tag.
+
+        :param value: the string representation of the date or datetime
+        :type value: string
+
+        :return: the date or datetime, or None if the string doesn't
+                 represent a date or a datetime
+        :rtype: :class:`datetime.datetime` or :class:`datetime.date` or None
+        """
+        # All the formats start with a four-digit year followed by a ':' or a
+        # '-', strings that don't can be rejected right away (e.g. Make,
+        # Model or Software).
+        if len(value) < 8 or not value[:4].isdigit() or value[4] not in ':-':
+            return None
+
+        # Fast path for the fixed-width representations.
+        length = len(value)
+        separator = value[4]
+        if (length == 19 and value[10] == ' ') or \
+                (length == 20 and separator == '-' and value[10] == 'T' and
+                 value[19] == 'Z'):
+            if value[7] == separator and value[13] == ':' and \
+                    value[16] == ':' and (value[5:7] + value[8:10] +
+                    value[11:13] + value[14:16] + value[17:19]).isdigit():
+                try:
+                    return datetime.datetime(int(value[:4]), int(value[5:7]),
+                                             int(value[8:10]),
+                                             int(value[11:13]),
+                                             int(value[14:16]),
+                                             int(value[17:19]))
+                except ValueError:
+                    # Let strptime decide.
+                    pass
+        elif length == 10 and separator == ':' and value[7] == ':' and \
+                (value[5:7] + value[8:10]).isdigit():
+            try:
+                return datetime.date(int(value[:4]), int(value[5:7]),
+                                     int(value[8:10]))
+            except ValueError:
+                # Let strptime decide.
+                pass
+
+        # Any other representation, however unlikely, is parsed the slow way.
+        for format in DateTimeParser._exif_datetime_formats:
+            try:
+                t = time.strptime(value, format)
+            except ValueError:
+                continue
+            else:
+                return datetime.datetime(*t[:6])
+        for format in DateTimeParser._exif_date_formats:
+            try:
+                t = time.strptime(value, format)
+            except ValueError:
+                continue
+            else:
+                return datetime.date(*t[:3])
+        return None
+
+    @staticmethod
+    def xmp(value):
+        """
+        Parse a date or a datetime from its string representation in an XMP
+        Date tag (see the XMP specification, part 1, §8.2.1.1).
+
+        The time zone of a datetime is a shared :class:`FixedOffset` instance.
+
+        :param value: the string representation of the date or datetime
+        :type value: string
+
+        :return: the date or datetime
+        :rtype: :class:`datetime.date` or :class:`datetime.datetime`
+
+        :raise ValueError: if the string is not a valid representation
+        """
+        match = DateTimeParser._xmp_date_re.match(value)
+        if match is None:
+            raise ValueError('Invalid XMP date: %s' % value)
+        year, month, day, hours, minutes, seconds, decimal, tzd, \
+            sign, ohours, ominutes = match.groups()
+        if month is not None:
+            month = int(month)
+        else:
+            month = 1
+        if day is not None:
+            day = int(day)
+        else:
+            day = 1
+        if hours is None:
+            return datetime.date(int(year), month, day)
+        if minutes is None:
+            raise ValueError('Malformed time: %s' % value)
+        if seconds is not None:
+            seconds = int(seconds)
+        else:
+            seconds = 0
+        if decimal is not None:
+            microseconds = int(float('0.%s' % decimal) * 1E6)
+        else:
+            microseconds = 0
+        if tzd == 'Z':
+            tzinfo = _fixed_offset()
+        else:
+            tzinfo = _fixed_offset(sign, int(ohours), int(ominutes))
+        return datetime.datetime(int(year), month, day, int(hours),
+                                 int(minutes), seconds, microseconds, tzinfo)
+
+    @staticmethod
+    def iptc_date(value):
+        """
+        Parse a date from its string representation in an IPTC Date tag.
+
+        According to the IPTC specification, the format for a string field
+        representing a date is ``%Y%m%d``. However, the string returned by
+        libexiv2 is formatted using pattern ``%Y-%m-%d``.
+
+        :param value: the string representation of the date
+        :type value: string
+
+        :return: the date
+        :rtype: :class:`datetime.date`
+
+        :raise ValueError: if the string is not a valid representation
+        """
+        if len(value) == 10 and value[4] == '-' and value[7] == '-' and \
+                (value[:4] + value[5:7] + value[8:10]).isdigit():
+            try:
+                return datetime.date(int(value[:4]), int(value[5:7]),
+                                     int(value[8:10]))
+            except ValueError:
+                # Let strptime decide.
+                pass
+        t = time.strptime(value, '%Y-%m-%d')
+        return datetime.date(*t[:3])
+
+    @staticmethod
+    def iptc_time(value):
+        """
+        Parse a time from its string representation in an IPTC Time tag.
+
+        According to the IPTC specification, the format for a string field
+        representing a time is ``%H%M%S±%H%M``. However, the string returned
+        by libexiv2 is formatted using pattern ``%H:%M:%S±%H:%M``.
+
+        The time zone of the time is a shared :class:`FixedOffset` instance.
+
+        :param value: the string representation of the time
+        :type value: string
+
+        :return: the time
+        :rtype: :class:`datetime.time`
+
+        :raise ValueError: if the string is not a valid representation
+        """
+        match = DateTimeParser._iptc_time_re.match(value)
+        if match is None:
+            raise ValueError('Invalid IPTC time: %s' % value)
+        hours, minutes, seconds, sign, ohours, ominutes = match.groups()
+        tzinfo = _fixed_offset(sign, int(ohours), int(ominutes))
+        return datetime.time(int(hours), int(minutes), int(seconds),
+                             tzinfo=tzinfo)
@@ -30,11 +30,10 @@ XMP specific code.
 
 import libexiv2python
 
-from pyexiv2.utils import FixedOffset, is_fraction, make_fraction, \
-                          GPSCoordinate, DateTimeFormatter
+from pyexiv2.utils import is_fraction, make_fraction, \
+                          GPSCoordinate, DateTimeFormatter, DateTimeParser
 
 import datetime
-import re
 
 
 class XmpValueError(ValueError):
@@ -87,11 +86,8 @@ class XmpTag(object):
     # FIXME: should inherit from ListenerInterface and implement observation of
     # changes on list/dict values.
 
-    # strptime is not flexible enough to handle all valid Date formats, we use a
-    # custom regular expression
-    _time_zone_re = r'Z|((?P<sign>\+|-)(?P<ohours>\d{2}):(?P<ominutes>\d{2}))'
-    _time_re = r'(?P<hours>\d{2})(:(?P<minutes>\d{2})(:(?P<seconds>\d{2})(.(?P<decimal>\d+))?)?(?P<tzd>%s))?' % _time_zone_re
-    _date_re = re.compile(r'(?P<year>\d{4})(-(?P<month>\d{2})(-(?P<day>\d{2})(T(?P<time>%s))?)?)?' % _time_re)
+    # No per-instance dictionary, as many tags can be kept in memory at once.
+    __slots__ = ('_tag', '_raw_value', '_value', '_value_cookie', '_owner')
 
     def __init__(self, key, value=None, _tag=None):
         """
@@ -110,11 +106,25 @@ class XmpTag(object):
         self._raw_value = None
         self._value = None
         self._value_cookie = False
+        # The metadata the tag belongs to, if any.
+        self._owner = None
         if value is not None:
             self._set_value(value)
 
     def _set_owner(self, metadata):
         self._tag._setParentImage(metadata._image)
+        self._owner = metadata
+
+    def _mark_dirty(self):
+        # Let the metadata the tag belongs to know that its value was set, so
+        # that only the tags marked dirty are compared to their original value.
+        owner = self._owner
+        if owner is not None:
+            owner.lock.acquire()
+            try:
+                owner._mark_dirty(self.key)
+            finally:
+                owner.lock.release()
 
     @staticmethod
     def _from_existing_tag(_tag):
@@ -133,6 +143,15 @@ class XmpTag(object):
         tag._value_cookie = True
         return tag
 
+    @staticmethod
+    def _from_cache(key, raw_value):
+        # Build a tag from a raw value read from a metadata cache. The tag does
+        # not hold the value in libexiv2.
+        tag = XmpTag(key)
+        tag._raw_value = raw_value
+        tag._value_cookie = True
+        return tag
+
     @property
     def key(self):
         """The key of the tag in the dotted form
@@ -177,6 +196,7 @@ class XmpTag(object):
 
         self._raw_value = value
         self._value_cookie = True
+        self._mark_dirty()
 
     raw_value = property(fget=_get_raw_value, fset=_set_raw_value,
                          doc='The raw value of the tag as a [list of] ' \
@@ -270,46 +290,10 @@ class XmpTag(object):
             raise NotImplementedError('XMP conversion for type [%s]' % type)
 
         elif type == 'Date':
-            match = self._date_re.match(value)
-            if match is None:
+            try:
+                return DateTimeParser.xmp(value)
+            except ValueError:
                 raise XmpValueError(value, type)
-            gd = match.groupdict()
-            if gd['month'] is not None:
-                month = int(gd['month'])
-            else:
-                month = 1
-            if gd['day'] is not None:
-                day = int(gd['day'])
-            else:
-                day = 1
-            if gd['time'] is None:
-                try:
-                    return datetime.date(int(gd['year']), month, day)
-                except ValueError:
-                    raise XmpValueError(value, type)
-            else:
-                if gd['minutes'] is None:
-                    # Malformed time
-                    raise XmpValueError(value, type)
-                if gd['seconds'] is not None:
-                    seconds = int(gd['seconds'])
-                else:
-                    seconds = 0
-                if gd['decimal'] is not None:
-                    microseconds = int(float('0.%s' % gd['decimal']) * 1E6)
-                else:
-                    microseconds = 0
-                if gd['tzd'] == 'Z':
-                    tzinfo = FixedOffset()
-                else:
-                    tzinfo = FixedOffset(gd['sign'], int(gd['ohours']),
-                                         int(gd['ominutes']))
-                try:
-                    return datetime.datetime(int(gd['year']), month, day,
-                                             int(gd['hours']), int(gd['minutes']),
-                                             seconds, microseconds, tzinfo)
-                except ValueError:
-                    raise XmpValueError(value, type)
 
         elif type == 'Dimensions':
             # TODO
@@ -467,6 +451,8 @@ class XmpTag(object):
     def __setstate__(self, state):
         key, raw_value = state
         self._tag = libexiv2python._XmpTag(key)
+        self._value = None
+        self._owner = None
         self.raw_value = raw_value
 
 
@@ -477,6 +463,10 @@ def register_namespace(name, prefix):
     Overriding the prefix of a known or previously registered namespace is not
     allowed.
 
+    This is thread-safe: images can be read or written by other threads in
+    the meantime. They are only guaranteed to take the new namespace into
+    account if they are read after it was registered.
+
     :param name: the name of the custom namespace (ending with a ``/``),
                  typically a URL (e.g. http://purl.org/dc/elements/1.1/)
     :type name: string
@@ -38,10 +38,20 @@ from xmp import TestXmpTag, TestXmpNamespaces
 from metadata import TestImageMetadata
 from buffer import TestBuffer
 from encoding import TestEncodings
-from utils import TestConversions, TestFractions
+from utils import TestConversions, TestFractions, TestFixedOffset
 from usercomment import TestUserCommentReadWrite, TestUserCommentAdd
 from pickling import TestPicklingTags
 from datetimeformatter import TestDateTimeFormatter
+from datetimeparser import TestDateTimeParser
+from headers import TestJpegHeader, TestTiffHeader, TestPatchExifValues
+from batch import TestReadMany, TestWriteMany
+from cache import TestMetadataCache, TestReadFromCache, TestOpenCached
+from concurrency import TestConcurrency
+try:
+    from aio import TestAsyncImageMetadata
+except ImportError:
+    # asyncio (or its trollius backport) is not available.
+    TestAsyncImageMetadata = None
 
 
 def run_unit_tests():
@@ -60,10 +70,23 @@ def run_unit_tests():
     suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestEncodings))
     suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestConversions))
     suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestFractions))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestFixedOffset))
     suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestUserCommentReadWrite))
     suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestUserCommentAdd))
     suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestPicklingTags))
     suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestDateTimeFormatter))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestDateTimeParser))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestJpegHeader))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestTiffHeader))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestPatchExifValues))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestReadMany))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestWriteMany))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestMetadataCache))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestReadFromCache))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestOpenCached))
+    suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestConcurrency))
+    if TestAsyncImageMetadata is not None:
+        suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(TestAsyncImageMetadata))
     # Run the test suite
     return unittest.TextTestRunner(verbosity=2).run(suite)
 
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+import unittest
+import os
+import tempfile
+
+from pyexiv2.metadata import ImageMetadata
+# Raises ImportError if asyncio (or trollius) is not available.
+from pyexiv2 import aio
+
+from testutils import EMPTY_JPG_DATA
+
+
+class TestAsyncImageMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = aio.asyncio.new_event_loop()
+        self.directory = tempfile.mkdtemp()
+        self.pathnames = []
+        for i in xrange(5):
+            fd, pathname = tempfile.mkstemp(suffix='.jpg', dir=self.directory)
+            os.write(fd, EMPTY_JPG_DATA)
+            os.close(fd)
+            m = ImageMetadata(pathname)
+            m.read()
+            m['Exif.Image.Make'] = 'Camera %d' % i
+            m.write()
+            self.pathnames.append(pathname)
+        fd, self.other = tempfile.mkstemp(suffix='.txt', dir=self.directory)
+        os.close(fd)
+
+    def tearDown(self):
+        self.loop.close()
+        for filename in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, filename))
+        os.rmdir(self.directory)
+
+    def _wait(self, future):
+        return self.loop.run_until_complete(future)
+
+    def _open(self, pathname):
+        return self._wait(aio.AsyncImageMetadata.open(pathname,
+                                                      loop=self.loop))
+
+    def test_open(self):
+        metadata = self._open(self.pathnames[0])
+        self.assertEqual(metadata['Exif.Image.Make'].value, 'Camera 0')
+        self.assertEqual(metadata.exif_keys, ['Exif.Image.Make'])
+
+    def test_open_error(self):
+        self.failUnlessRaises(IOError, self._open, 'idontexist')
+
+    def test_write(self):
+        metadata = self._open(self.pathnames[0])
+        metadata['Exif.Image.Make'] = 'Kamera'
+        self._wait(metadata.write())
+        m = ImageMetadata(self.pathnames[0])
+        m.read()
+        self.assertEqual(m['Exif.Image.Make'].value, 'Kamera')
+
+    def test_previews(self):
+        metadata = self._open(self.pathnames[0])
+        metadata.exif_thumbnail.data = EMPTY_JPG_DATA
+        previews = self._wait(metadata.previews())
+        self.assertEqual(len(previews), 1)
+        data = self._wait(metadata.preview_data(previews[0]))
+        self.assertEqual(data, EMPTY_JPG_DATA)
+
+    def _scan(self, **kwargs):
+        results = {}
+        scan = aio.scan(self.directory, loop=self.loop, **kwargs)
+        iterator = scan.__aiter__()
+        while True:
+            try:
+                path, result = self._wait(iterator.__anext__())
+            except aio._StopAsyncIteration:
+                return results
+            results[path] = result
+
+    def test_scan(self):
+        results = self._scan(extensions=['.JPG'], max_pending=2)
+        self.assertEqual(sorted(results.keys()), sorted(self.pathnames))
+        for i, pathname in enumerate(self.pathnames):
+            self.assertEqual(results[pathname]['Exif.Image.Make'].value,
+                             'Camera %d' % i)
+
+    def test_scan_next(self):
+        results = {}
+        scan = aio.scan(self.directory, extensions=['.jpg'], loop=self.loop)
+        while True:
+            item = self._wait(scan.next())
+            if item is None:
+                break
+            path, result = item
+            results[path] = result
+        self.assertEqual(sorted(results.keys()), sorted(self.pathnames))
+        # Once exhausted, the scan keeps returning None.
+        self.assertEqual(self._wait(scan.next()), None)
+
+    def test_scan_errors(self):
+        results = self._scan()
+        self.assertEqual(len(results), len(self.pathnames) + 1)
+        self.assert_(isinstance(results[self.other], IOError))
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+import unittest
+import datetime
+import os
+import tempfile
+
+from pyexiv2.metadata import ImageMetadata
+from pyexiv2.xmp import XmpTag, unregister_namespace
+from pyexiv2 import batch
+
+from testutils import EMPTY_JPG_DATA
+
+
+def _crash(task):
+    # Kill the worker process that runs the task for the path 'crash'.
+    if task[0] == 'crash':
+        os._exit(1)
+    return task[0], True
+
+
+class TestReadMany(unittest.TestCase):
+
+    def setUp(self):
+        self.pathnames = []
+        for i in xrange(5):
+            fd, pathname = tempfile.mkstemp(suffix='.jpg')
+            os.write(fd, EMPTY_JPG_DATA)
+            os.close(fd)
+            m = ImageMetadata(pathname)
+            m.read()
+            m['Exif.Image.Make'] = 'Camera %d' % i
+            m['Exif.Image.DateTime'] = datetime.datetime(2012, 1, i + 1)
+            m['Xmp.dc.subject'] = ['image', str(i)]
+            m.write()
+            self.pathnames.append(pathname)
+
+    def tearDown(self):
+        for pathname in self.pathnames:
+            os.remove(pathname)
+
+    def _check_results(self, results, keys=None):
+        results = dict(results)
+        self.assertEqual(sorted(results.keys()), sorted(self.pathnames))
+        for i, pathname in enumerate(self.pathnames):
+            values = results[pathname]
+            self.assertEqual(values['Exif.Image.Make'], 'Camera %d' % i)
+            if keys is None:
+                self.assertEqual(values['Exif.Image.DateTime'],
+                                 datetime.datetime(2012, 1, i + 1))
+                self.assertEqual(values['Xmp.dc.subject'], ['image', str(i)])
+                self.assertEqual(type(values['Xmp.dc.subject']), list)
+            else:
+                self.assertEqual(sorted(values.keys()), sorted(keys))
+
+    def test_read_many_threads(self):
+        self._check_results(batch.read_many(self.pathnames, workers=2))
+
+    def test_read_many_processes(self):
+        self._check_results(batch.read_many(self.pathnames, workers=2,
+                                            executor='process'))
+
+    def test_read_many_keys(self):
+        keys = ['Exif.Image.Make', 'Exif.Photo.Flash']
+        results = batch.read_many(self.pathnames, keys=keys, workers=2)
+        self._check_results(results, keys=['Exif.Image.Make'])
+
+    def test_read_many_error(self):
+        results = dict(batch.read_many(['idontexist'] + self.pathnames))
+        self.assert_(isinstance(results['idontexist'], IOError))
+        self.assertEqual(len(results), len(self.pathnames) + 1)
+
+    def test_read_many_bounded(self):
+        consumed = []
+        def paths():
+            for pathname in self.pathnames:
+                consumed.append(pathname)
+                yield pathname
+        results = batch.read_many(paths(), workers=1, max_pending=2)
+        results.next()
+        self.assertEqual(len(consumed), 2)
+        results.close()
+
+    def test_read_many_invalid_parameters(self):
+        self.failUnlessRaises(ValueError, batch.read_many, self.pathnames,
+                              executor='foobar')
+        self.failUnlessRaises(ValueError, batch.read_many, self.pathnames,
+                              workers=0)
+
+    def test_worker_init(self):
+        name = 'http://example.com/batch/'
+        batch.worker_init({name: 'batchtest'})
+        try:
+            # Already registered namespaces are skipped.
+            batch.worker_init([(name, 'batchtest')], warm=False)
+            self.assertEqual(XmpTag('Xmp.batchtest.foo', 'bar').value, 'bar')
+        finally:
+            unregister_namespace(name)
+
+    def test_metadata_pool(self):
+        pool = batch.MetadataPool(processes=2)
+        try:
+            results = dict(pool.read(['idontexist'] + self.pathnames))
+            self.assert_(isinstance(results['idontexist'], IOError))
+            for i, pathname in enumerate(self.pathnames):
+                metadata = results[pathname]
+                self.assert_(isinstance(metadata, ImageMetadata))
+                self.assertEqual(metadata['Exif.Image.Make'].value,
+                                 'Camera %d' % i)
+                self.assertEqual(metadata['Exif.Image.DateTime'].value,
+                                 datetime.datetime(2012, 1, i + 1))
+                self.assertEqual(metadata['Xmp.dc.subject'].value,
+                                 ['image', str(i)])
+            # The pool can be used again.
+            keys = ['Exif.Image.Make', 'Exif.Photo.Flash']
+            for pathname, metadata in pool.read(self.pathnames, keys=keys):
+                self.assertEqual(metadata.keys(), ['Exif.Image.Make'])
+        finally:
+            pool.close()
+
+    def test_worker_lost(self):
+        tasks = [('crash', None)] + [(path, None) for path in self.pathnames]
+        results = dict(batch._iterate(batch._ProcessExecutor, _crash, 2,
+                                      iter(tasks), 4))
+        self.assertEqual(len(results), len(self.pathnames) + 1)
+        self.assert_(isinstance(results['crash'], RuntimeError))
+        for pathname in self.pathnames:
+            self.assertEqual(results[pathname], True)
+
+    def test_metadata_pool_invalid_parameters(self):
+        self.failUnlessRaises(ValueError, batch.MetadataPool, processes=0)
+
+
+class TestWriteMany(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pathnames = []
+        for i in xrange(5):
+            fd, pathname = tempfile.mkstemp(suffix='.jpg', dir=self.directory)
+            os.write(fd, EMPTY_JPG_DATA)
+            os.close(fd)
+            m = ImageMetadata(pathname)
+            m.read()
+            m['Exif.Image.Make'] = 'Camera %d' % i
+            m['Xmp.dc.subject'] = ['image', str(i)]
+            m.write()
+            self.pathnames.append(pathname)
+
+    def tearDown(self):
+        for filename in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, filename))
+        os.rmdir(self.directory)
+
+    def _updates(self):
+        updates = {}
+        for i, pathname in enumerate(self.pathnames):
+            updates[pathname] = {'Exif.Image.Make': 'Kamera %d' % i,
+                                 'Xmp.dc.subject': None,
+                                 'Xmp.xmp.Rating': i}
+        return updates
+
+    def _check_written(self, results):
+        results = dict(results)
+        self.assertEqual(sorted(results.keys()), sorted(self.pathnames))
+        for i, pathname in enumerate(self.pathnames):
+            self.assertEqual(results[pathname], True)
+            m = ImageMetadata(pathname)
+            m.read()
+            self.assertEqual(m['Exif.Image.Make'].value, 'Kamera %d' % i)
+            self.assertEqual(m['Xmp.xmp.Rating'].value, i)
+            self.failIf('Xmp.dc.subject' in m.xmp_keys)
+        # No temporary file was left behind.
+        self.assertEqual(len(os.listdir(self.directory)), len(self.pathnames))
+
+    def test_write_many_atomic(self):
+        self._check_written(batch.write_many(self._updates(), workers=2))
+
+    def test_write_many_in_place(self):
+        self._check_written(batch.write_many(self._updates(), workers=2,
+                                             atomic=False))
+
+    def test_write_many_processes(self):
+        self._check_written(batch.write_many(self._updates(), workers=2,
+                                             executor='process'))
+
+    def test_write_many_fsync_file(self):
+        self._check_written(batch.write_many(self._updates(), fsync='file'))
+
+    def test_write_many_fsync_batch(self):
+        self._check_written(batch.write_many(self._updates(), fsync='batch'))
+
+    def test_write_many_unmodified(self):
+        updates = [(pathname, {'Exif.Image.Make': 'Camera %d' % i})
+                   for i, pathname in enumerate(self.pathnames)]
+        results = dict(batch.write_many(updates))
+        self.assertEqual(results.values(), [False] * len(self.pathnames))
+        self.assertEqual(len(os.listdir(self.directory)), len(self.pathnames))
+
+    def test_write_many_stopped_early(self):
+        for executor in ('thread', 'process'):
+            updates = [(pathname, {'Exif.Image.Model': executor})
+                       for pathname in self.pathnames]
+            results = batch.write_many(updates, workers=1, max_pending=2,
+                                       fsync='batch', executor=executor)
+            results.next()
+            results.close()
+            written = 0
+            for pathname in self.pathnames:
+                m = ImageMetadata(pathname)
+                m.read()
+                if 'Exif.Image.Model' in m.exif_keys and \
+                        m['Exif.Image.Model'].value == executor:
+                    written += 1
+            # The second update is completed if it was already started, no
+            # other one is.
+            self.assert_(written in (1, 2))
+            self.assertEqual(len(os.listdir(self.directory)),
+                             len(self.pathnames))
+
+    def test_write_many_error(self):
+        updates = {'idontexist': {'Exif.Image.Make': 'Kamera'}}
+        updates[self.pathnames[0]] = {'Exif.Image.Make': 'Kamera'}
+        results = dict(batch.write_many(updates))
+        self.assert_(isinstance(results['idontexist'], IOError))
+        self.assertEqual(results[self.pathnames[0]], True)
+
+    def test_write_many_invalid_parameters(self):
+        self.failUnlessRaises(ValueError, batch.write_many, {},
+                              fsync='foobar')
+        self.failUnlessRaises(ValueError, batch.write_many, {},
+                              executor='foobar')
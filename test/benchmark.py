@@ -0,0 +1,260 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+"""
+Micro-benchmarks for pyexiv2.
+
+These are not unit tests, they are not run as part of the test suite.
+Usage: benchmark.py benchmark_name image_file [image_file…]
+Run without arguments to list the available benchmarks.
+"""
+
+import sys
+import os.path
+import time
+import threading
+import multiprocessing
+
+from pyexiv2.metadata import ImageMetadata
+from pyexiv2.exif import ExifTag
+from pyexiv2.xmp import register_namespace
+
+
+def _time(function, repeat=10):
+    # Return the best time out of several runs of a function, and its result.
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def _throughput(label, function):
+    elapsed, data = _time(function)
+    size = len(data) / (1024.0 * 1024.0)
+    if elapsed > 0:
+        rate = '%.1f MB/s' % (size / elapsed)
+    else:
+        rate = 'n/a'
+    print '  %-24s %10d bytes %12s' % (label, len(data), rate)
+
+
+def bench_data_extraction(filename):
+    """Throughput of the extraction of the image and thumbnail data."""
+    metadata = ImageMetadata(filename)
+    metadata.read()
+    _throughput('buffer', lambda: metadata.buffer)
+    for i, preview in enumerate(metadata.previews):
+        # Retrieve the previews every time to measure the actual extraction.
+        _throughput('previews[%d].data' % i,
+                    lambda: metadata.previews[i].data)
+    try:
+        _throughput('exif_thumbnail.data',
+                    lambda: metadata.exif_thumbnail.data)
+    except (IOError, ValueError):
+        pass
+
+
+def bench_tag_memory(filename):
+    """Memory used by the python tag objects (excluding their values)."""
+    metadata = ImageMetadata(filename)
+    metadata.read()
+    for family in ('exif', 'iptc', 'xmp'):
+        keys = getattr(metadata, '%s_keys' % family)
+        if not keys:
+            continue
+        size = 0
+        for key in keys:
+            tag = metadata[key]
+            size += sys.getsizeof(tag)
+            if hasattr(tag, '__dict__'):
+                size += sys.getsizeof(tag.__dict__)
+        print '  %-6s %5d tags %8.1f bytes/tag' % \
+            (family, len(keys), float(size) / len(keys))
+
+
+def bench_exif_values(filename):
+    """Conversion of the values of all the EXIF tags from and to python."""
+    metadata = ImageMetadata(filename)
+    metadata.read()
+    tags = [metadata[key] for key in metadata.exif_keys]
+
+    def convert():
+        for tag in tags:
+            # Force the conversion of the raw value.
+            tag._value_cookie = True
+            try:
+                tag.value
+            except (ValueError, NotImplementedError):
+                pass
+        return tags
+
+    def assign():
+        for tag in tags:
+            try:
+                tag.value = tag.value
+            except (ValueError, NotImplementedError):
+                pass
+        return tags
+
+    elapsed, tags = _time(convert)
+    set_elapsed, tags = _time(assign)
+    count = max(len(tags), 1)
+    print '  %5d tags  get %10.1f µs/tag  set %10.1f µs/tag' % \
+        (len(tags), elapsed * 1000000 / count, set_elapsed * 1000000 / count)
+
+
+def bench_threaded_previews(filename):
+    """Scaling of the extraction of the previews over several threads."""
+    metadata = ImageMetadata(filename)
+    metadata.read()
+    if not metadata.previews:
+        print '  no previews'
+        return
+    # Each thread reads its own copy of the image, as the threads would do
+    # when processing different images.
+    images = []
+    for i in xrange(multiprocessing.cpu_count()):
+        image = ImageMetadata(filename)
+        image.read()
+        images.append(image)
+
+    def extract(image, repeat):
+        for i in xrange(repeat):
+            for preview in image.previews:
+                preview.data
+
+    repeat = 20
+    single = None
+    threads = 1
+    while threads <= len(images):
+        workers = [threading.Thread(target=extract, args=(image, repeat))
+                   for image in images[:threads]]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start
+        rate = threads * repeat / elapsed
+        if single is None:
+            single = rate
+        print '  %2d threads %10.1f images/s %6.2fx' % \
+            (threads, rate, rate / single)
+        threads *= 2
+
+
+def bench_key_lookups(filename):
+    """Scaling of the lookups of tags by key with the number of tags."""
+    try:
+        register_namespace('http://pyexiv2.tilloy.net/benchmark/', 'bench')
+    except KeyError:
+        # Already registered for a previous file
+        pass
+    for count in (1000, 5000, 20000):
+        # Synthetic metadata, half EXIF and half XMP tags. It cannot be
+        # written to a JPEG file, whose metadata segments are limited to 64kB.
+        metadata = ImageMetadata(filename)
+        metadata.read()
+        image = metadata._image
+        start = time.time()
+        keys = []
+        for i in xrange(count / 2):
+            # Unknown tags of the IFD0
+            key = 'Exif.Image.0x%04x' % (0x1000 + i)
+            tag = ExifTag(key)
+            tag.raw_value = '1'
+            metadata[key] = tag
+            keys.append(key)
+            key = 'Xmp.bench.tag%d' % i
+            metadata[key] = 'value'
+            keys.append(key)
+        set_time = time.time() - start
+        # Look the tags up in libexiv2, not in the cache of ImageMetadata.
+        start = time.time()
+        for key in keys:
+            if key.startswith('Exif'):
+                image._getExifTag(key)
+            else:
+                image._getXmpTag(key)
+        get_time = time.time() - start
+        print '  %6d tags  set %8.1f µs/tag  get %8.1f µs/tag' % \
+            (count, set_time * 1000000 / count, get_time * 1000000 / count)
+
+
+def bench_iptc_keywords(filename):
+    """Scaling of the IPTC repetitions with their number."""
+    for count in (100, 1000, 10000):
+        metadata = ImageMetadata(filename)
+        metadata.read()
+        image = metadata._image
+        keywords = ['keyword %d' % i for i in xrange(count)]
+        start = time.time()
+        metadata['Iptc.Application2.Keywords'] = keywords
+        set_time = time.time() - start
+        # Rewrite each of the first values, the way a cataloguing application
+        # edits the keywords one at a time.
+        start = time.time()
+        for i in xrange(100):
+            keywords[i] = 'new keyword %d' % i
+            tag = image._getIptcTag('Iptc.Application2.Keywords')
+            tag._setRawValues(keywords)
+        edit_time = (time.time() - start) / 100
+        start = time.time()
+        for i in xrange(100):
+            image._iptcKeys()
+            image._getIptcTag('Iptc.Application2.Keywords')._getRawValues()
+        get_time = (time.time() - start) / 100
+        print '  %6d keywords  set %8.2f ms  edit %8.2f ms  get %8.2f ms' % \
+            (count, set_time * 1000, edit_time * 1000, get_time * 1000)
+
+
+BENCHMARKS = {
+    'data': bench_data_extraction,
+    'exif_values': bench_exif_values,
+    'iptc_keywords': bench_iptc_keywords,
+    'key_lookups': bench_key_lookups,
+    'memory': bench_tag_memory,
+    'threaded_previews': bench_threaded_previews,
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in BENCHMARKS:
+        print 'Usage: %s benchmark_name image_file [image_file…]' % sys.argv[0]
+        print 'Available benchmarks:'
+        for name in sorted(BENCHMARKS):
+            print '  %-18s %s' % (name, BENCHMARKS[name].__doc__)
+        sys.exit(1)
+    benchmark = BENCHMARKS[sys.argv[1]]
+    for filename in sys.argv[2:]:
+        print os.path.basename(filename)
+        benchmark(filename)
+
@@ -27,6 +27,7 @@
 import unittest
 import os.path
 import hashlib
+import mmap
 from datetime import datetime
 
 from pyexiv2.metadata import ImageMetadata
@@ -89,3 +90,45 @@ class TestBuffer(unittest.TestCase):
         m2.read()
         self.assertEqual(m2[key].value, value)
 
+    def test_from_bytearray(self):
+        fd = open(self.filepath, 'rb')
+        data = bytearray(fd.read())
+        fd.close()
+        m = ImageMetadata.from_buffer(data)
+        m.read()
+        self.assertEqual(hashlib.md5(m.buffer).hexdigest(), self.md5sum)
+        # The contents of a mutable buffer are copied
+        data[:] = ''
+        self.assertEqual(hashlib.md5(m.buffer).hexdigest(), self.md5sum)
+
+    def test_from_memoryview(self):
+        fd = open(self.filepath, 'rb')
+        data = fd.read()
+        fd.close()
+        m = ImageMetadata.from_buffer(memoryview(data))
+        m.read()
+        self.assertEqual(hashlib.md5(m.buffer).hexdigest(), self.md5sum)
+
+    def test_from_mmap(self):
+        fd = open(self.filepath, 'rb')
+        data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        m = ImageMetadata.from_buffer(data)
+        data.close()
+        fd.close()
+        m.read()
+        self.assertEqual(hashlib.md5(m.buffer).hexdigest(), self.md5sum)
+
+    def test_write_does_not_modify_read_only_buffer(self):
+        fd = open(self.filepath, 'rb')
+        data = fd.read()
+        fd.close()
+        m = ImageMetadata.from_buffer(data)
+        m.read()
+        m['Exif.Image.ImageDescription'] = 'my kingdom for a semiquaver'
+        m.write()
+        self.failIfEqual(hashlib.md5(m.buffer).hexdigest(), self.md5sum)
+        self.assertEqual(hashlib.md5(data).hexdigest(), self.md5sum)
+
+    def test_from_invalid_buffer(self):
+        self.failUnlessRaises(TypeError, ImageMetadata.from_buffer, [1, 2, 3])
+
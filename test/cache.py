@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+import unittest
+import datetime
+import os
+import tempfile
+import threading
+import cPickle
+
+import pyexiv2
+from pyexiv2.metadata import ImageMetadata
+from pyexiv2.cache import MetadataCache, open_cached, _lru
+
+from testutils import EMPTY_JPG_DATA
+
+
+ITEMS = {'exif': [('Exif.Image.Make', 'Ascii', 'Canon')],
+         'iptc': [('Iptc.Application2.Keywords', 'String', ['a', 'b'])],
+         'xmp': [('Xmp.dc.subject', 'XmpBag', ['image', 'test'])]}
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.pathnames = []
+        for i in xrange(3):
+            fd, pathname = tempfile.mkstemp(suffix='.jpg')
+            os.write(fd, EMPTY_JPG_DATA)
+            os.close(fd)
+            self.pathnames.append(pathname)
+        self.cache = MetadataCache(self.database)
+
+    def tearDown(self):
+        self.cache.close()
+        os.remove(self.database)
+        for pathname in self.pathnames:
+            os.remove(pathname)
+
+    def test_get_missing(self):
+        self.assertEqual(self.cache.get(self.pathnames[0]), None)
+        self.assertEqual(self.cache.get('idontexist'), None)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_put_get(self):
+        self.cache.put(self.pathnames[0], ITEMS)
+        self.assertEqual(self.cache.get(self.pathnames[0]), ITEMS)
+        self.assertEqual(self.cache.get(self.pathnames[1]), None)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_invalidated(self):
+        self.cache.put(self.pathnames[0], ITEMS)
+        fd = open(self.pathnames[0], 'ab')
+        fd.write('\x00')
+        fd.close()
+        self.assertEqual(self.cache.get(self.pathnames[0]), None)
+
+    def test_invalid_data(self):
+        self.cache.put(self.pathnames[0], ITEMS)
+        # An entry written by an older version, as a pickle.
+        self.cache._db.execute('UPDATE metadata SET items = ?',
+                               (buffer(cPickle.dumps(ITEMS, 2)),))
+        self.assertEqual(self.cache.get(self.pathnames[0]), None)
+        self.assertEqual(self.cache.misses, 1)
+        self.cache.put(self.pathnames[0], ITEMS)
+        self.assertEqual(self.cache.get(self.pathnames[0]), ITEMS)
+
+    def test_persistent(self):
+        self.cache.put(self.pathnames[0], ITEMS)
+        self.cache.close()
+        self.cache = MetadataCache(self.database)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get(self.pathnames[0]), ITEMS)
+
+    def test_replace(self):
+        self.cache.put(self.pathnames[0], {'exif': [], 'iptc': [], 'xmp': []})
+        self.cache.put(self.pathnames[0], ITEMS)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get(self.pathnames[0]), ITEMS)
+
+    def test_evict_least_recently_used(self):
+        self.cache.max_entries = 2
+        self.cache.put(self.pathnames[0], ITEMS)
+        self.cache.put(self.pathnames[1], ITEMS)
+        self.cache.get(self.pathnames[0])
+        self.cache.put(self.pathnames[2], ITEMS)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(self.cache.get(self.pathnames[1]), None)
+        self.assertEqual(self.cache.get(self.pathnames[0]), ITEMS)
+        self.assertEqual(self.cache.get(self.pathnames[2]), ITEMS)
+
+    def test_evict_bytes(self):
+        self.cache.put(self.pathnames[0], ITEMS)
+        self.cache.max_bytes = self.cache._bytes * 2
+        self.cache.put(self.pathnames[1], ITEMS)
+        self.cache.put(self.pathnames[2], ITEMS)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get(self.pathnames[0]), None)
+
+    def test_remove_and_clear(self):
+        for pathname in self.pathnames:
+            self.cache.put(pathname, ITEMS)
+        self.cache.remove(self.pathnames[0])
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get(self.pathnames[0]), None)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.get(self.pathnames[1]), None)
+
+
+class TestReadFromCache(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        fd, self.pathname = tempfile.mkstemp(suffix='.jpg')
+        os.write(fd, EMPTY_JPG_DATA)
+        os.close(fd)
+        m = ImageMetadata(self.pathname)
+        m.read()
+        m['Exif.Image.Make'] = 'EASTMAN KODAK COMPANY'
+        m['Exif.Image.DateTime'] = datetime.datetime(2009, 2, 9, 13, 33, 20)
+        m['Iptc.Application2.Keywords'] = ['little', 'big', 'man']
+        m['Xmp.dc.subject'] = ['image', 'test', 'pyexiv2']
+        m.comment = 'Hello World!'
+        m.write()
+        self.cache = MetadataCache(self.database)
+
+    def tearDown(self):
+        self.cache.close()
+        os.remove(self.database)
+        os.remove(self.pathname)
+
+    def _check_values(self, metadata):
+        self.assertEqual(metadata.exif_keys,
+                         ['Exif.Image.Make', 'Exif.Image.DateTime'])
+        self.assertEqual(metadata['Exif.Image.Make'].value,
+                         'EASTMAN KODAK COMPANY')
+        self.assertEqual(metadata['Exif.Image.DateTime'].value,
+                         datetime.datetime(2009, 2, 9, 13, 33, 20))
+        self.assertEqual(metadata['Iptc.Application2.Keywords'].value,
+                         ['little', 'big', 'man'])
+        self.assertEqual(metadata['Xmp.dc.subject'].value,
+                         ['image', 'test', 'pyexiv2'])
+
+    def test_read_from_cache(self):
+        metadata = ImageMetadata(self.pathname)
+        metadata.read(cache=self.cache)
+        self.assertEqual(self.cache.misses, 1)
+        self._check_values(metadata)
+        metadata = ImageMetadata(self.pathname)
+        metadata.read(cache=self.cache)
+        self.assertEqual(self.cache.hits, 1)
+        self._check_values(metadata)
+        self.assertEqual(metadata.items_raw('exif', keys=['Exif.Image.Make']),
+                         [('Exif.Image.Make', 'Ascii',
+                           'EASTMAN KODAK COMPANY')])
+        # The image itself was not read.
+        self.assertEqual(metadata._ImageMetadata__image, None)
+        self.assertEqual(metadata.comment, 'Hello World!')
+        self.failIfEqual(metadata._ImageMetadata__image, None)
+
+    def test_read_from_cache_read_only(self):
+        metadata = ImageMetadata(self.pathname)
+        metadata.read(cache=self.cache)
+        metadata = ImageMetadata(self.pathname)
+        metadata.read(cache=self.cache)
+        self.failUnlessRaises(IOError, metadata.write)
+        del metadata['Exif.Image.Make']
+        self.failUnlessRaises(KeyError, metadata.__getitem__,
+                              'Exif.Image.Make')
+        # Reading without the cache makes the metadata writable again.
+        metadata.read()
+        metadata['Exif.Image.Make'] = 'Canon'
+        metadata.write()
+
+    def test_read_from_cache_modified(self):
+        metadata = ImageMetadata(self.pathname)
+        metadata.read(cache=self.cache)
+        metadata['Exif.Image.Make'] = 'Canon'
+        metadata.write()
+        metadata = ImageMetadata(self.pathname)
+        metadata.read(cache=self.cache)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(metadata['Exif.Image.Make'].value, 'Canon')
+
+
+class TestOpenCached(unittest.TestCase):
+
+    def setUp(self):
+        _lru.clear()
+        self.pathnames = []
+        for i in xrange(3):
+            fd, pathname = tempfile.mkstemp(suffix='.jpg')
+            os.write(fd, EMPTY_JPG_DATA)
+            os.close(fd)
+            m = ImageMetadata(pathname)
+            m.read()
+            m['Exif.Image.Make'] = 'Camera %d' % i
+            m.write()
+            self.pathnames.append(pathname)
+
+    def tearDown(self):
+        _lru.clear()
+        for pathname in self.pathnames:
+            os.remove(pathname)
+
+    def test_shared(self):
+        metadata = open_cached(self.pathnames[0])
+        self.assertEqual(metadata['Exif.Image.Make'].value, 'Camera 0')
+        self.assert_(open_cached(self.pathnames[0]) is metadata)
+        self.failIf(open_cached(self.pathnames[1]) is metadata)
+        self.failUnlessRaises(IOError, metadata.write)
+
+    def test_package_shortcut(self):
+        metadata = pyexiv2.open_cached(self.pathnames[0], maxsize=2)
+        self.assert_(open_cached(self.pathnames[0]) is metadata)
+        self.assertEqual(metadata['Exif.Image.Make'].value, 'Camera 0')
+
+    def test_read_only(self):
+        metadata = open_cached(self.pathnames[0])
+        self.failUnlessRaises(TypeError, metadata.__setitem__,
+                              'Exif.Image.Make', 'Another camera')
+        self.failUnlessRaises(TypeError, metadata.__delitem__,
+                              'Exif.Image.Make')
+        self.failUnlessRaises(TypeError, setattr, metadata, 'comment', 'Hi')
+        self.failUnlessRaises(TypeError, delattr, metadata, 'comment')
+        self.failUnlessRaises(TypeError, metadata.exif_thumbnail.erase)
+        self.failUnlessRaises(TypeError, setattr, metadata.exif_thumbnail,
+                              'data', EMPTY_JPG_DATA)
+        self.failUnlessRaises(TypeError, metadata.read)
+        other = ImageMetadata(self.pathnames[1])
+        other.read()
+        self.failUnlessRaises(TypeError, other.copy, metadata)
+        tag = metadata['Exif.Image.Make']
+        self.failUnlessRaises(TypeError, setattr, tag, 'value', 'Foo')
+        self.failUnlessRaises(TypeError, setattr, tag, 'raw_value', 'Foo')
+        metadata = open_cached(self.pathnames[0])
+        self.assertEqual(metadata['Exif.Image.Make'].value, 'Camera 0')
+
+    def test_invalidated(self):
+        metadata = open_cached(self.pathnames[0])
+        m = ImageMetadata(self.pathnames[0])
+        m.read()
+        m['Exif.Image.Make'] = 'Another camera'
+        m.write()
+        metadata2 = open_cached(self.pathnames[0])
+        self.failIf(metadata2 is metadata)
+        self.assertEqual(metadata2['Exif.Image.Make'].value, 'Another camera')
+        self.assertEqual(len(_lru), 1)
+
+    def test_evict_least_recently_used(self):
+        metadata = open_cached(self.pathnames[0], maxsize=2)
+        open_cached(self.pathnames[1], maxsize=2)
+        open_cached(self.pathnames[0], maxsize=2)
+        open_cached(self.pathnames[2], maxsize=2)
+        self.assertEqual(len(_lru), 2)
+        self.assert_(open_cached(self.pathnames[0], maxsize=2) is metadata)
+
+    def test_evict_bytes(self):
+        for pathname in self.pathnames:
+            open_cached(pathname, max_bytes=1)
+            # The latest image is always kept.
+            self.assertEqual(len(_lru), 1)
+
+    def test_threads(self):
+        results = []
+        def read():
+            for pathname in self.pathnames * 10:
+                results.append(open_cached(pathname)['Exif.Image.Make'].value)
+        threads = [threading.Thread(target=read) for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 4 * 10 * len(self.pathnames))
+        self.assertEqual(sorted(set(results)),
+                         ['Camera %d' % i for i in xrange(3)])
+        self.assertEqual(len(_lru), len(self.pathnames))
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+import unittest
+import os
+import sys
+import tempfile
+import threading
+
+from pyexiv2.metadata import ImageMetadata
+from pyexiv2.xmp import register_namespace, unregister_namespace
+
+from testutils import EMPTY_JPG_DATA
+
+
+THREADS = 8
+ITERATIONS = 50
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.pathname = tempfile.mkstemp(suffix='.jpg')
+        os.write(fd, EMPTY_JPG_DATA)
+        os.close(fd)
+        m = ImageMetadata(self.pathname)
+        m.read()
+        m['Exif.Image.Make'] = 'Camera'
+        m['Iptc.Application2.Keywords'] = ['foo', 'bar']
+        m['Xmp.dc.subject'] = ['foo', 'bar']
+        m.write()
+        self.errors = []
+        # Make the threads switch often.
+        self.interval = sys.getcheckinterval()
+        sys.setcheckinterval(10)
+
+    def tearDown(self):
+        sys.setcheckinterval(self.interval)
+        os.remove(self.pathname)
+
+    def _run(self, *functions):
+        # Run each function in THREADS threads, ITERATIONS times, and collect
+        # the exceptions they raise.
+        def run(function, i):
+            try:
+                for j in xrange(ITERATIONS):
+                    function(i, j)
+            except Exception, error:
+                self.errors.append(error)
+        threads = []
+        for function in functions:
+            for i in xrange(THREADS):
+                threads.append(threading.Thread(target=run,
+                                                args=(function, i)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.errors, [])
+
+    def _check(self, metadata):
+        self.assertEqual(metadata['Exif.Image.Make'].value, 'Camera')
+        self.assertEqual(metadata['Iptc.Application2.Keywords'].value,
+                         ['foo', 'bar'])
+        self.assertEqual(metadata['Xmp.dc.subject'].value, ['foo', 'bar'])
+
+    def test_read_separate_instances(self):
+        def read(i, j):
+            metadata = ImageMetadata(self.pathname)
+            metadata.read()
+            self._check(metadata)
+        self._run(read)
+
+    def test_read_shared_instance(self):
+        metadata = ImageMetadata(self.pathname)
+        metadata.read()
+        def read(i, j):
+            self._check(metadata)
+            self.assertEqual(len(metadata.exif_keys),
+                             len(set(metadata.exif_keys)))
+        self._run(read)
+
+    def test_set_and_delete_shared_instance(self):
+        metadata = ImageMetadata(self.pathname)
+        metadata.read()
+        def modify(i, j):
+            key = 'Xmp.dc.title'
+            if j % 2:
+                metadata[key] = 'Title %d' % i
+            else:
+                try:
+                    del metadata[key]
+                except KeyError:
+                    # Deleted by another thread in the meantime.
+                    pass
+        def read(i, j):
+            metadata.lock.acquire()
+            try:
+                keys = list(metadata)
+                self.assertEqual(len(keys), len(set(keys)))
+                for key in keys:
+                    metadata[key]
+            finally:
+                metadata.lock.release()
+        self._run(modify, read)
+        self.assert_(metadata.modified)
+
+    def test_copy_crossed(self):
+        one = ImageMetadata(self.pathname)
+        one.read()
+        two = ImageMetadata(self.pathname)
+        two.read()
+        def copy(i, j):
+            if i % 2:
+                one.copy(two)
+            else:
+                two.copy(one)
+        self._run(copy)
+        self._check(one)
+        self._check(two)
+
+    def test_register_namespaces_while_reading(self):
+        def register(i, j):
+            name = 'http://example.com/concurrency/%d/' % i
+            register_namespace(name, 'concurrency%d' % i)
+            metadata = ImageMetadata.from_buffer(EMPTY_JPG_DATA)
+            metadata.read()
+            metadata['Xmp.concurrency%d.foo' % i] = 'bar'
+            unregister_namespace(name)
+        def read(i, j):
+            metadata = ImageMetadata(self.pathname)
+            metadata.read()
+            self._check(metadata)
+        self._run(register, read)
+
+    def test_register_namespaces_while_writing(self):
+        def register(i, j):
+            name = 'http://example.com/concurrency/%d/' % i
+            register_namespace(name, 'concurrency%d' % i)
+            unregister_namespace(name)
+        def write(i, j):
+            metadata = ImageMetadata.from_buffer(EMPTY_JPG_DATA)
+            metadata.read()
+            metadata['Xmp.dc.subject'] = ['foo', str(j)]
+            metadata.write()
+            copy = ImageMetadata.from_buffer(metadata.buffer)
+            copy.read()
+            self.assertEqual(copy['Xmp.dc.subject'].value, ['foo', str(j)])
+        self._run(register, write)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2011 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+import unittest
+
+from pyexiv2.utils import DateTimeParser, FixedOffset
+
+import datetime
+
+
+class TestDateTimeParser(unittest.TestCase):
+
+    def test_exif_datetime(self):
+        self.assertEqual(DateTimeParser.exif('2009:03:01 12:46:51'),
+                         datetime.datetime(2009, 3, 1, 12, 46, 51))
+        self.assertEqual(DateTimeParser.exif('2009-03-01 12:46:51'),
+                         datetime.datetime(2009, 3, 1, 12, 46, 51))
+        self.assertEqual(DateTimeParser.exif('2009-03-01T12:46:51Z'),
+                         datetime.datetime(2009, 3, 1, 12, 46, 51))
+        self.assertEqual(DateTimeParser.exif('1899:12:31 23:59:59'),
+                         datetime.datetime(1899, 12, 31, 23, 59, 59))
+        # Less common representations
+        self.assertEqual(DateTimeParser.exif('2009-03-01t12:46:51z'),
+                         datetime.datetime(2009, 3, 1, 12, 46, 51))
+        self.assertEqual(DateTimeParser.exif('2009:3:1 1:2:3'),
+                         datetime.datetime(2009, 3, 1, 1, 2, 3))
+
+    def test_exif_date(self):
+        self.assertEqual(DateTimeParser.exif('2009:08:04'),
+                         datetime.date(2009, 8, 4))
+        self.assertEqual(DateTimeParser.exif('2009:8:4'),
+                         datetime.date(2009, 8, 4))
+
+    def test_exif_not_a_date(self):
+        self.assertEqual(DateTimeParser.exif(''), None)
+        self.assertEqual(DateTimeParser.exif('EASTMAN KODAK COMPANY'), None)
+        self.assertEqual(DateTimeParser.exif('2009'), None)
+        self.assertEqual(DateTimeParser.exif('2009:08:04 '), None)
+        self.assertEqual(DateTimeParser.exif('2009:02:30'), None)
+        self.assertEqual(DateTimeParser.exif('2009:13:01 00:00:00'), None)
+        self.assertEqual(DateTimeParser.exif('0000:00:00 00:00:00'), None)
+        self.assertEqual(DateTimeParser.exif('    :  :     :  :  '), None)
+        self.assertEqual(DateTimeParser.exif('2009:03:01T12:46:51Z'), None)
+
+    def test_exif_invalid_seconds(self):
+        # strptime accepts leap seconds, datetime doesn't.
+        self.failUnlessRaises(ValueError, DateTimeParser.exif,
+                              '2009:03:01 12:46:60')
+
+    def test_xmp(self):
+        self.assertEqual(DateTimeParser.xmp('1999'), datetime.date(1999, 1, 1))
+        self.assertEqual(DateTimeParser.xmp('1999-10'),
+                         datetime.date(1999, 10, 1))
+        self.assertEqual(DateTimeParser.xmp('1999-10-13'),
+                         datetime.date(1999, 10, 13))
+        d = DateTimeParser.xmp('1999-10-13T05:03Z')
+        self.assertEqual(d, datetime.datetime(1999, 10, 13, 5, 3,
+                                              tzinfo=FixedOffset()))
+        self.assertEqual(d.tzinfo, FixedOffset())
+        d = DateTimeParser.xmp('1999-10-13T05:03:54.721-06:00')
+        self.assertEqual(d, datetime.datetime(1999, 10, 13, 5, 3, 54, 721000,
+                                              tzinfo=FixedOffset('-', 6, 0)))
+        self.failUnlessRaises(ValueError, DateTimeParser.xmp, 'foo')
+        self.failUnlessRaises(ValueError, DateTimeParser.xmp, '1999-10-13T05')
+        self.failUnlessRaises(ValueError, DateTimeParser.xmp, '1999-13-13')
+
+    def test_iptc_date(self):
+        self.assertEqual(DateTimeParser.iptc_date('2004-07-13'),
+                         datetime.date(2004, 7, 13))
+        self.assertEqual(DateTimeParser.iptc_date('2004-7-13'),
+                         datetime.date(2004, 7, 13))
+        self.failUnlessRaises(ValueError, DateTimeParser.iptc_date, '2004-02-30')
+        self.failUnlessRaises(ValueError, DateTimeParser.iptc_date, 'foo')
+
+    def test_iptc_time(self):
+        t = DateTimeParser.iptc_time('23:37:04+06:00')
+        self.assertEqual(t, datetime.time(23, 37, 4,
+                                          tzinfo=FixedOffset('+', 6, 0)))
+        self.failUnlessRaises(ValueError, DateTimeParser.iptc_time, '23:37:04')
+        self.failUnlessRaises(ValueError, DateTimeParser.iptc_time,
+                              '25:37:04+06:00')
+
+    def test_shared_offsets(self):
+        d1 = DateTimeParser.xmp('1999-10-13T05:03+02:00')
+        d2 = DateTimeParser.xmp('2011-08-08T19:03:37+02:00')
+        t = DateTimeParser.iptc_time('23:37:04+02:00')
+        self.assert_(d1.tzinfo is d2.tzinfo)
+        self.assert_(t.tzinfo is d1.tzinfo)
@@ -363,3 +363,89 @@ class TestExifTag(unittest.TestCase):
         self.assertEqual(tag2.type, 'Long')
         self.assertEqual(tag2.value, [76830L, 20070527L, 2L, 1L, 4228109L])
 
+
+    def test_static_information(self):
+        # The static information about a tag only depends on its key, it is
+        # shared by all the tags with that key.
+        tag1 = ExifTag('Exif.Image.Make')
+        self.assertEqual(tag1.name, 'Make')
+        tag2 = ExifTag('Exif.Image.Make', 'EASTMAN KODAK COMPANY')
+        for attribute in ('type', 'name', 'label', 'description',
+                          'section_name', 'section_description'):
+            self.assertEqual(getattr(tag1, attribute),
+                             getattr(tag2, attribute))
+
+    def test_compute_value_multiple_values(self):
+        tag = ExifTag('Exif.Image.BitsPerSample')
+        self.assertEqual(tag.type, 'Short')
+        tag.raw_value = '8 8 8'
+        self.assertEqual(tag.value, [8, 8, 8])
+        tag.raw_value = '8 foo 8'
+        self.failUnlessRaises(ExifValueError, getattr, tag, 'value')
+
+        tag = ExifTag('Exif.Image.XResolution')
+        self.assertEqual(tag.type, 'Rational')
+        tag.raw_value = '72/1 0/0'
+        self.assertEqual(tag.value, [make_fraction(72, 1), make_fraction(0, 1)])
+        tag.raw_value = '72/1 -72/1'
+        self.failUnlessRaises(ExifValueError, getattr, tag, 'value')
+
+        tag = ExifTag('Exif.Image.BaselineExposure')
+        self.assertEqual(tag.type, 'SRational')
+        tag.raw_value = '-1/3 1/3'
+        self.assertEqual(tag.value,
+                         [make_fraction(-1, 3), make_fraction(1, 3)])
+        tag.raw_value = '1/0 1/3'
+        self.failUnlessRaises(ExifValueError, getattr, tag, 'value')
+
+    def test_typed_values(self):
+        # Numbers are transferred to and from libexiv2 without going through
+        # their string representation.
+        tag = ExifTag('Exif.Image.BitsPerSample', [8, 8, 8])
+        self.assertEqual(tag.raw_value, '8 8 8')
+        tag._value_cookie = True
+        self.assertEqual(tag.value, [8, 8, 8])
+        self.failUnlessRaises(ExifValueError, setattr, tag, 'value', 65536)
+
+        tag = ExifTag('Exif.Image.ImageWidth', 678024)
+        self.assertEqual(tag.raw_value, '678024')
+        tag._value_cookie = True
+        self.assertEqual(tag.value, 678024L)
+        self.assertEqual(type(tag.value), long)
+
+        tag = ExifTag('Exif.Image.XResolution',
+                      [make_fraction(72, 1), make_fraction(0, 1)])
+        self.assertEqual(tag.raw_value, '72/1 0/1')
+        tag._value_cookie = True
+        self.assertEqual(tag.value, [make_fraction(72, 1), make_fraction(0, 1)])
+
+        tag = ExifTag('Exif.Image.BaselineExposure', make_fraction(-1, 3))
+        self.assertEqual(tag.raw_value, '-1/3')
+        tag._value_cookie = True
+        self.assertEqual(tag.value, make_fraction(-1, 3))
+
+        filepath = testutils.get_absolute_file_path(os.path.join('data', 'pentax-makernote.jpg'))
+        metadata = ImageMetadata(filepath)
+        metadata.read()
+        tag = metadata['Exif.Pentax.PreviewResolution']
+        self.assertEqual(tag._tag._getValues(), [640, 480])
+        tag.value = [320, 240]
+        self.assertEqual(tag.raw_value, '320 240')
+        self.assertEqual(metadata._image._getExifTag(tag.key)._getValues(),
+                         [320, 240])
+
+    def test_undefined_bytes(self):
+        # Undefined values are transferred to and from libexiv2 as bytes.
+        tag = ExifTag('Exif.Photo.ExifVersion', '0221')
+        self.assertEqual(tag.raw_value, '48 50 50 49')
+        tag._value_cookie = True
+        self.assertEqual(tag._tag._getData(), '0221')
+        self.assertEqual(tag.value, '0221')
+        data = ''.join(map(chr, range(256)))
+        tag.value = data
+        self.assertEqual(tag._tag._getData(), data)
+        tag.value = u'0220'
+        self.assertEqual(tag.raw_value, '48 50 50 48')
+        self.failUnlessRaises(ExifValueError, setattr, tag, 'value', 3)
+        tag = ExifTag('Exif.Image.Make', 'Kodak')
+        self.assertEqual(tag._tag._getData(), None)
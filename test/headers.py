@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+# ******************************************************************************
+#
+# Copyright (C) 2012 Olivier Tilloy <olivier@tilloy.net>
+#
+# This file is part of the pyexiv2 distribution.
+#
+# pyexiv2 is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# pyexiv2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyexiv2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, 5th Floor, Boston, MA 02110-1301 USA.
+#
+# Author: Olivier Tilloy <olivier@tilloy.net>
+#
+# ******************************************************************************
+
+import unittest
+import os
+import struct
+import tempfile
+
+from pyexiv2.headers import read_jpeg_header, read_tiff_header, \
+                            patch_exif_values
+
+from testutils import EMPTY_JPG_DATA
+
+
+class TestJpegHeader(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.pathname = tempfile.mkstemp(suffix='.jpg')
+        os.write(fd, EMPTY_JPG_DATA)
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.pathname)
+
+    def _write(self, data):
+        fd = open(self.pathname, 'wb')
+        fd.write(data)
+        fd.close()
+
+    def test_read_header(self):
+        sos = EMPTY_JPG_DATA.rindex('\xff\xda')
+        header = read_jpeg_header(self.pathname)
+        self.assertEqual(header, EMPTY_JPG_DATA[:sos + 2] + '\xff\xd9')
+
+    def test_read_header_with_fill_bytes(self):
+        self._write(EMPTY_JPG_DATA[:2] + '\xff\xff' + EMPTY_JPG_DATA[2:])
+        sos = EMPTY_JPG_DATA.rindex('\xff\xda')
+        header = read_jpeg_header(self.pathname)
+        self.assertEqual(header, EMPTY_JPG_DATA[:sos + 2] + '\xff\xd9')
+
+    def test_not_a_jpeg(self):
+        self._write('II*\x00\x08\x00\x00\x00')
+        self.assertEqual(read_jpeg_header(self.pathname), None)
+
+    def test_truncated(self):
+        self._write(EMPTY_JPG_DATA[:30])
+        self.assertEqual(read_jpeg_header(self.pathname), None)
+
+    def test_skip_segments(self):
+        def segment(marker, payload):
+            return '\xff' + marker + struct.pack('>H', len(payload) + 2) + \
+                   payload
+        exif = segment('\xe1', 'Exif\x00\x00II*\x00')
+        xmp = segment('\xe1', 'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta/>')
+        iptc = segment('\xed', 'Photoshop 3.0\x008BIM')
+        self._write(EMPTY_JPG_DATA[:2] + exif + xmp + iptc + EMPTY_JPG_DATA[2:])
+        sos = EMPTY_JPG_DATA.rindex('\xff\xda')
+        tail = EMPTY_JPG_DATA[2:sos + 2] + '\xff\xd9'
+        header = read_jpeg_header(self.pathname)
+        self.assertEqual(header, '\xff\xd8' + exif + xmp + iptc + tail)
+        header = read_jpeg_header(self.pathname, skip=('xmp',))
+        self.assertEqual(header, '\xff\xd8' + exif + iptc + tail)
+        header = read_jpeg_header(self.pathname, skip=('iptc', 'xmp'))
+        self.assertEqual(header, '\xff\xd8' + exif + tail)
+        header = read_jpeg_header(self.pathname, skip=('exif',))
+        self.assertEqual(header, '\xff\xd8' + xmp + iptc + tail)
+
+
+def _tiff(order='<'):
+    # Build minimal EXIF data: IFD0 holds Make (Ascii), Orientation (Short,
+    # stored in the entry itself), XResolution (Rational) and a pointer to the
+    # Exif IFD, which holds ExposureTime (Rational).
+    def entry(tag, type, count, value):
+        return struct.pack(order + 'HHI', tag, type, count) + value
+    def long(value):
+        return struct.pack(order + 'I', value)
+    # IFD0 at 8 (4 entries: 2 + 48 + 4 bytes), then its values at 62,
+    # then the Exif IFD at 76 (1 entry: 2 + 12 + 4 bytes), then its value at 94
+    ifd0 = struct.pack(order + 'H', 4) + \
+           entry(0x010f, 2, 6, long(62)) + \
+           entry(0x0112, 3, 1, struct.pack(order + 'HH', 1, 0)) + \
+           entry(0x011a, 5, 1, long(68)) + \
+           entry(0x8769, 4, 1, long(76)) + long(0)
+    values0 = 'Canon\x00' + struct.pack(order + 'II', 72, 1)
+    exif = struct.pack(order + 'H', 1) + \
+           entry(0x829a, 5, 1, long(94)) + long(0)
+    values1 = struct.pack(order + 'II', 1, 60)
+    magic = {'<': 'II*\x00', '>': 'MM\x00*'}[order]
+    return magic + long(8) + ifd0 + values0 + exif + values1
+
+
+class TestTiffHeader(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.pathname = tempfile.mkstemp(suffix='.tif')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.pathname)
+
+    def _write(self, data):
+        fd = open(self.pathname, 'wb')
+        fd.write(data)
+        fd.close()
+
+    def test_read_header(self):
+        self._write(_tiff() + '\x00' * 1000)
+        self.assertEqual(read_tiff_header(self.pathname), _tiff())
+        self._write(_tiff('>') + '\x00' * 1000)
+        self.assertEqual(read_tiff_header(self.pathname), _tiff('>'))
+
+    def test_read_header_with_thumbnail(self):
+        # IFD1 at 102 (2 entries: 2 + 24 + 4 bytes), then the thumbnail at 132
+        entries = [struct.pack('<HHII', 0x0201, 4, 1, 132),
+                   struct.pack('<HHII', 0x0202, 4, 1, 4)]
+        ifd1 = struct.pack('<H', 2) + ''.join(entries) + struct.pack('<I', 0)
+        data = _tiff()
+        data = data[:58] + struct.pack('<I', 102) + data[62:] + ifd1 + 'JPEG'
+        self._write(data + '\x00' * 1000)
+        self.assertEqual(read_tiff_header(self.pathname), data)
+
+    def test_metadata_at_the_end(self):
+        self._write(_tiff())
+        self.assertEqual(read_tiff_header(self.pathname), None)
+
+    def test_not_a_tiff(self):
+        self._write(EMPTY_JPG_DATA)
+        self.assertEqual(read_tiff_header(self.pathname), None)
+
+    def test_truncated(self):
+        self._write(_tiff()[:40])
+        self.assertEqual(read_tiff_header(self.pathname), None)
+
+
+class TestPatchExifValues(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.pathname = tempfile.mkstemp(suffix='.tif')
+        os.write(fd, _tiff())
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.pathname)
+
+    def _write(self, data):
+        fd = open(self.pathname, 'wb')
+        fd.write(data)
+        fd.close()
+
+    def _read(self):
+        fd = open(self.pathname, 'rb')
+        data = fd.read()
+        fd.close()
+        return data
+
+    def test_patch_tiff(self):
+        values = [('Image', 0x010f, 'Ascii', 'Nikon'),
+                  ('Image', 0x0112, 'Short', '6'),
+                  ('Image', 0x011a, 'Rational', '300/1'),
+                  ('Photo', 0x829a, 'Rational', '1/250')]
+        self.assert_(patch_exif_values(self.pathname, values))
+        data = self._read()
+        self.assertEqual(data[62:68], 'Nikon\x00')
+        self.assertEqual(data[30:32], struct.pack('<H', 6))
+        self.assertEqual(data[68:76], struct.pack('<II', 300, 1))
+        self.assertEqual(data[94:102], struct.pack('<II', 1, 250))
+        self.assertEqual(len(data), len(_tiff()))
+
+    def test_patch_big_endian(self):
+        self._write(_tiff('>'))
+        values = [('Image', 0x011a, 'Rational', '300/1')]
+        self.assert_(patch_exif_values(self.pathname, values))
+        self.assertEqual(self._read()[68:76], struct.pack('>II', 300, 1))
+
+    def test_patch_jpeg(self):
+        payload = 'Exif\x00\x00' + _tiff()
+        segment = '\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+        self._write(EMPTY_JPG_DATA[:2] + segment + EMPTY_JPG_DATA[2:])
+        values = [('Photo', 0x829a, 'Rational', '1/250')]
+        self.assert_(patch_exif_values(self.pathname, values))
+        data = self._read()
+        self.assertEqual(data[2 + 4 + 6 + 94:2 + 4 + 6 + 102],
+                         struct.pack('<II', 1, 250))
+
+    def test_size_mismatch(self):
+        values = [('Image', 0x011a, 'Rational', '300/1'),
+                  ('Image', 0x010f, 'Ascii', 'Olympus')]
+        self.failIf(patch_exif_values(self.pathname, values))
+        # Nothing was written.
+        self.assertEqual(self._read(), _tiff())
+
+    def test_type_mismatch(self):
+        values = [('Image', 0x0112, 'Long', '6')]
+        self.failIf(patch_exif_values(self.pathname, values))
+        self.assertEqual(self._read(), _tiff())
+
+    def test_missing_tag(self):
+        values = [('GPSInfo', 0x0001, 'Ascii', 'N')]
+        self.failIf(patch_exif_values(self.pathname, values))
+        self.assertEqual(self._read(), _tiff())
+
+    def test_no_exif_data(self):
+        self._write(EMPTY_JPG_DATA)
+        values = [('Image', 0x0112, 'Short', '6')]
+        self.failIf(patch_exif_values(self.pathname, values))
+        self.assertEqual(self._read(), EMPTY_JPG_DATA)
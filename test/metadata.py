@@ -35,6 +35,7 @@ import os
 import tempfile
 import time
 import unittest
+from StringIO import StringIO
 from testutils import EMPTY_JPG_DATA
 
 
@@ -108,6 +109,73 @@ class TestImageMetadata(unittest.TestCase):
         metadata = ImageMetadata('idontexist')
         self.failUnlessRaises(IOError, metadata.read)
 
+    def test_read_metadata_only(self):
+        self.metadata.read()
+        metadata = ImageMetadata(self.pathname, metadata_only=True)
+        metadata.read()
+        self.assertEqual(metadata.exif_keys, self.metadata.exif_keys)
+        self.assertEqual(metadata.iptc_keys, self.metadata.iptc_keys)
+        self.assertEqual(metadata.xmp_keys, self.metadata.xmp_keys)
+        self.assertEqual(metadata['Exif.Image.Make'].value,
+                         'EASTMAN KODAK COMPANY')
+        self.assertEqual(metadata.comment, 'Hello World!')
+        self.assertEqual(metadata.dimensions, self.metadata.dimensions)
+        self.assertEqual(metadata.mime_type, 'image/jpeg')
+
+    def test_write_metadata_only_raises(self):
+        metadata = ImageMetadata(self.pathname, metadata_only=True)
+        metadata.read()
+        metadata['Exif.Image.Make'] = 'foobar'
+        self.assertRaises(IOError, metadata.write)
+        self.assertRaises(IOError, getattr, metadata, 'buffer')
+
+    def test_read_keys(self):
+        self.metadata.read(keys=['Exif.Image.Make', 'Xmp.dc.*',
+                                 'Exif.Photo.Flash'])
+        self.assertEqual(self.metadata.exif_keys, ['Exif.Image.Make'])
+        self.assertEqual(self.metadata.iptc_keys, [])
+        self.assertEqual(sorted(self.metadata.xmp_keys),
+                         ['Xmp.dc.format', 'Xmp.dc.subject'])
+        self.assertEqual(self.metadata['Exif.Image.Make'].value,
+                         'EASTMAN KODAK COMPANY')
+        self.failUnlessRaises(KeyError, self.metadata.__getitem__,
+                              'Exif.Image.DateTime')
+        self.failUnlessRaises(KeyError, self.metadata.__getitem__,
+                              'Iptc.Application2.Caption')
+        self.assertEqual(self.metadata.items_raw('exif'),
+                         [('Exif.Image.Make', 'Ascii', 'EASTMAN KODAK COMPANY')])
+        self.assertEqual(self.metadata.items_raw('iptc'), [])
+
+    def test_read_families(self):
+        self.metadata.read(families=('exif',))
+        self.assertEqual(len(self.metadata.exif_keys), 2)
+        self.assertEqual(self.metadata.iptc_keys, [])
+        self.assertEqual(self.metadata.xmp_keys, [])
+        self.assertEqual(self.metadata._image._xmpKeys(), [])
+        self.failUnlessRaises(ValueError, self.metadata.read,
+                              families=('exif', 'foo'))
+
+    def test_read_partial_then_full(self):
+        self.metadata.read(families=('iptc',))
+        self.assertEqual(self.metadata.exif_keys, [])
+        self.metadata.read()
+        self.assertEqual(len(self.metadata.exif_keys), 2)
+        self.assertEqual(len(self.metadata.iptc_keys), 2)
+        self.assertEqual(len(self.metadata.xmp_keys), 2)
+
+    def test_write_partial_read_raises(self):
+        self.metadata.read(keys=['Exif.Image.Make'])
+        self.metadata['Exif.Image.Make'] = 'foobar'
+        self.assertRaises(IOError, self.metadata.write)
+        # The whole image is still available.
+        self.assertEqual(self.metadata.buffer, open(self.pathname).read())
+
+    def test_items_raw_keys(self):
+        self.metadata.read()
+        self.assertEqual(self.metadata.items_raw('xmp', keys=['Xmp.dc.format']),
+                         [('Xmp.dc.format', 'XmpText', 'image/jpeg')])
+        self.assertEqual(len(self.metadata.items_raw('exif', keys=['Exif.*'])), 2)
+
     def test_write_preserve_timestamps(self):
         stat = os.stat(self.pathname)
         atime = round(stat.st_atime)
@@ -150,6 +218,136 @@ class TestImageMetadata(unittest.TestCase):
         self.failUnlessEqual(atime3, atime2)
         self.failUnlessEqual(mtime3, mtime2)
 
+    def test_modified(self):
+        self.metadata.read()
+        self.failIf(self.metadata.modified)
+        tag = self.metadata['Exif.Image.Make']
+        self.failIf(self.metadata.modified)
+        tag.value = 'WESTMAN KODAK COMPANY'
+        self.assert_(self.metadata.modified)
+        self.metadata.write()
+        self.failIf(self.metadata.modified)
+        del self.metadata['Iptc.Application2.Caption']
+        self.assert_(self.metadata.modified)
+        self.metadata.read()
+        self.failIf(self.metadata.modified)
+        self.metadata.comment = 'Yellow Submarine'
+        self.assert_(self.metadata.modified)
+
+    def test_modified_same_value(self):
+        self.metadata.read()
+        self.metadata['Exif.Image.Make'] = 'EASTMAN KODAK COMPANY'
+        self.metadata['Iptc.Application2.Caption'] = ['blabla']
+        self.metadata['Xmp.dc.format'] = ('image', 'jpeg')
+        self.failIf(self.metadata.modified)
+        self.metadata['Xmp.dc.creator'] = ['me']
+        self.assert_(self.metadata.modified)
+        del self.metadata['Xmp.dc.creator']
+        self.failIf(self.metadata.modified)
+        del self.metadata['Exif.Image.DateTime']
+        self.assert_(self.metadata.modified)
+
+    def test_modified_undefined(self):
+        self.metadata.read()
+        self.metadata['Exif.Photo.ExifVersion'] = '0221'
+        self.metadata.write()
+        metadata = ImageMetadata(self.pathname)
+        metadata.read()
+        tag = metadata['Exif.Photo.ExifVersion']
+        # The raw value is only formatted when needed, the modifications are
+        # detected on the bytes.
+        self.assertEqual(tag._raw_value, None)
+        metadata['Exif.Photo.ExifVersion'] = '0221'
+        self.failIf(metadata.modified)
+        metadata['Exif.Photo.ExifVersion'].raw_value = '48 50 50 49'
+        self.failIf(metadata.modified)
+        metadata['Exif.Photo.ExifVersion'] = '0220'
+        self.assert_(metadata.modified)
+        self.assertEqual(metadata['Exif.Photo.ExifVersion'].raw_value,
+                         '48 50 50 48')
+
+    def test_modified_marked(self):
+        self.metadata.read()
+        self.metadata['Exif.Image.Make']
+        self.metadata['Exif.Image.DateTime']
+        self.failIf(self.metadata._dirty['exif'])
+        # Only the tags whose setters ran are compared.
+        self.metadata['Exif.Image.Make'].value = 'WESTMAN KODAK COMPANY'
+        self.assertEqual(self.metadata._dirty['exif'],
+                         set(['Exif.Image.Make']))
+        self.assert_(self.metadata.modified)
+        self.metadata.write()
+        self.failIf(self.metadata._dirty['exif'])
+        tag = self.metadata['Iptc.Application2.Caption']
+        tag.value[0] = 'Modified in place'
+        self.assertEqual(self.metadata._dirty['iptc'],
+                         set(['Iptc.Application2.Caption']))
+        self.assert_(self.metadata.modified)
+
+    def test_write_unmodified(self):
+        mtime = round(os.stat(self.pathname).st_mtime)
+        metadata = ImageMetadata(self.pathname)
+        metadata.read()
+        metadata['Exif.Image.Make'].value = 'EASTMAN KODAK COMPANY'
+        time.sleep(1.1)
+        metadata.write()
+        self.failUnlessEqual(round(os.stat(self.pathname).st_mtime), mtime)
+
+    def test_write_in_place(self):
+        fd = open(self.pathname, 'rb')
+        data = fd.read()
+        fd.close()
+        metadata = ImageMetadata(self.pathname)
+        metadata.read()
+        metadata['Exif.Image.Make'].value = 'WESTMAN KODAK COMPANY'
+        metadata.write(in_place=True)
+        fd = open(self.pathname, 'rb')
+        patched = fd.read()
+        fd.close()
+        # Only the modified characters were overwritten.
+        self.assertEqual(len(patched), len(data))
+        differences = [i for i in xrange(len(data)) if data[i] != patched[i]]
+        self.assertEqual(len(differences), 2)
+        self.metadata.read()
+        self.assertEqual(self.metadata['Exif.Image.Make'].value,
+                         'WESTMAN KODAK COMPANY')
+
+    def test_write_in_place_different_size(self):
+        metadata = ImageMetadata(self.pathname)
+        metadata.read()
+        metadata['Exif.Image.Make'] = 'KODAK'
+        metadata['Xmp.dc.subject'] = ['image']
+        metadata.write(in_place=True)
+        self.metadata.read()
+        self.assertEqual(self.metadata['Exif.Image.Make'].value, 'KODAK')
+        self.assertEqual(self.metadata['Xmp.dc.subject'].value, ['image'])
+
+    def test_items_raw(self):
+        self.metadata.read()
+        exif = self.metadata.items_raw('exif')
+        self.assertEqual(len(exif), 2)
+        self.assert_(('Exif.Image.Make', 'Ascii', 'EASTMAN KODAK COMPANY') in exif)
+        self.assert_(('Exif.Image.DateTime', 'Ascii', '2009:02:09 13:33:20') in exif)
+        iptc = self.metadata.items_raw('iptc')
+        self.assertEqual(len(iptc), 2)
+        self.assert_(('Iptc.Application2.Caption', 'String', ['blabla']) in iptc)
+        self.assert_(('Iptc.Application2.DateCreated', 'Date', ['2004-07-13']) in iptc)
+        xmp = self.metadata.items_raw('XMP')
+        self.assertEqual(len(xmp), 2)
+        self.assert_(('Xmp.dc.format', 'XmpText', 'image/jpeg') in xmp)
+        self.assert_(('Xmp.dc.subject', 'XmpBag', ['image', 'test', 'pyexiv2']) in xmp)
+        self.failUnlessRaises(ValueError, self.metadata.items_raw, 'foo')
+
+    def test_items_raw_match_tags(self):
+        self.metadata.read()
+        for family in ('exif', 'iptc', 'xmp'):
+            for key, type, raw_value in self.metadata.items_raw(family):
+                self.assertEqual(self.metadata[key].raw_value, raw_value)
+
+    def test_items_raw_not_read_raises(self):
+        for family in ('exif', 'iptc', 'xmp'):
+            self.assertRaises(IOError, self.metadata.items_raw, family)
+
     ###########################
     # Test EXIF-related methods
     ###########################
@@ -475,6 +673,70 @@ class TestImageMetadata(unittest.TestCase):
         self.assertEqual(self.metadata._tags['xmp'], {})
         self.failIf(key in self.metadata.xmp_keys)
 
+    def test_lookups_after_deletions(self):
+        # The tags following a deleted tag are still found at their new
+        # positions, and a deleted tag can be added again.
+        self.metadata.read()
+        image = self.metadata._image
+        image._deleteExifTag('Exif.Image.Make')
+        self.assertEqual(image._getExifTag('Exif.Image.DateTime')._getRawValue(),
+                         '2009:02:09 13:33:20')
+        image._deleteIptcTag('Iptc.Application2.Caption')
+        self.assertEqual(
+            image._getIptcTag('Iptc.Application2.DateCreated')._getRawValues(),
+            ['2004-07-13'])
+        image._deleteXmpTag('Xmp.dc.format')
+        self.assertEqual(image._getXmpTag('Xmp.dc.subject')._getArrayValue(),
+                         ['image', 'test', 'pyexiv2'])
+        self.metadata['Exif.Image.Make'] = 'Kodak'
+        self.metadata['Xmp.dc.format'] = ('image', 'png')
+        self.assertEqual(image._getExifTag('Exif.Image.Make')._getRawValue(),
+                         'Kodak')
+        self.assertEqual(self.metadata.exif_keys.count('Exif.Image.Make'), 1)
+        self.assertEqual(self.metadata.xmp_keys.count('Xmp.dc.format'), 1)
+
+    def test_keys_after_modifications(self):
+        self.metadata.read()
+        keys = list(self.metadata.xmp_keys)
+        self.metadata['Xmp.dc.creator'] = ['me']
+        self.metadata['Xmp.dc.creator'] = ['you']
+        self.assertEqual(self.metadata.xmp_keys, keys + ['Xmp.dc.creator'])
+        del self.metadata['Xmp.dc.format']
+        self.failUnlessRaises(KeyError, self.metadata.__delitem__,
+                              'Xmp.dc.format')
+        self.metadata['Xmp.dc.format'] = ('image', 'png')
+        keys.remove('Xmp.dc.format')
+        self.assertEqual(self.metadata.xmp_keys,
+                         keys + ['Xmp.dc.creator', 'Xmp.dc.format'])
+
+    def test_iptc_repetitions(self):
+        self.metadata.read()
+        image = self.metadata._image
+        key = 'Iptc.Application2.Keywords'
+        self.metadata[key] = ['a', 'b', 'c']
+        self.metadata['Iptc.Application2.City'] = ['Paris']
+        # The new repetitions are appended after the other tag.
+        image._getIptcTag(key)._setRawValues(['a', 'b', 'c', 'd'])
+        keys = image._iptcKeys()
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assert_(keys.index(key) < keys.index('Iptc.Application2.City'))
+        self.assertEqual(image._getIptcTag(key)._getRawValues(),
+                         ['a', 'b', 'c', 'd'])
+        # The repetitions in excess are erased, wherever they are.
+        image._getIptcTag(key)._setRawValues(['x', 'y'])
+        self.assertEqual(image._getIptcTag(key)._getRawValues(), ['x', 'y'])
+        self.assertEqual(
+            image._getIptcTag('Iptc.Application2.City')._getRawValues(),
+            ['Paris'])
+        items = dict((k, v) for k, t, v in image._iptcItems())
+        self.assertEqual(items[key], ['x', 'y'])
+        self.assertEqual(items['Iptc.Application2.City'], ['Paris'])
+        image._deleteIptcTag(key)
+        self.failIf(key in image._iptcKeys())
+        self.assertEqual(
+            image._getIptcTag('Iptc.Application2.City')._getRawValues(),
+            ['Paris'])
+
     ###########################
     # Test dictionary interface
     ###########################
@@ -781,6 +1043,56 @@ class TestImageMetadata(unittest.TestCase):
         self.assertEqual(thumb.extension, preview.extension)
         self.assertEqual(thumb.data, preview.data)
 
+    def test_preview_data_on_demand(self):
+        self.metadata.read()
+        self.metadata.exif_thumbnail.data = EMPTY_JPG_DATA
+        preview = self.metadata.previews[0]
+        self.assertEqual(preview.size, len(EMPTY_JPG_DATA))
+        self.assertEqual(preview.data, EMPTY_JPG_DATA)
+        # The data is extracted once.
+        self.assert_(preview.data is preview.data)
+        fd, pathname = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(pathname)
+        preview.write_to_file(pathname)
+        pathname = pathname + preview.extension
+        fd = open(pathname, 'rb')
+        self.assertEqual(fd.read(), EMPTY_JPG_DATA)
+        fd.close()
+        os.remove(pathname)
+
+    def test_write_preview_to_file_object(self):
+        self.metadata.read()
+        self.metadata.exif_thumbnail.data = EMPTY_JPG_DATA
+        preview = self.metadata.previews[0]
+        self._test_write_to_file_object(preview)
+
+    def test_write_exif_thumbnail_to_file_object(self):
+        self.metadata.read()
+        thumb = self.metadata.exif_thumbnail
+        thumb.data = EMPTY_JPG_DATA
+        self._test_write_to_file_object(thumb)
+
+    def _test_write_to_file_object(self, image):
+        fd, pathname = tempfile.mkstemp()
+        # A file descriptor
+        image.write_to_file(fd)
+        # A file descriptor as a long
+        image.write_to_file(long(fd))
+        os.close(fd)
+        # A file object
+        fd = open(pathname, 'ab')
+        image.write_to_file(fd)
+        fd.close()
+        # Any object with a write method
+        buffer = StringIO()
+        image.write_to_file(buffer)
+        fd = open(pathname, 'rb')
+        self.assertEqual(fd.read(), EMPTY_JPG_DATA * 3)
+        fd.close()
+        os.remove(pathname)
+        self.assertEqual(buffer.getvalue(), EMPTY_JPG_DATA)
+
     #########################
     # Test the IPTC charset #
     #########################
@@ -115,3 +115,18 @@ class TestPicklingTags(unittest.TestCase):
             self.assertEqual(t.raw_value, tag.raw_value)
             self.assertEqual(t.value, tag.value)
 
+
+    def test_pickle_highest_protocol(self):
+        tags = []
+        tags.append(ExifTag('Exif.Image.BitsPerSample', [8, 8, 8]))
+        tags.append(IptcTag('Iptc.Application2.Subject', ['foo', 'bar']))
+        tags.append(XmpTag('Xmp.dc.subject', ['foo', 'bar']))
+        for tag in tags:
+            # Tags have no per-instance dictionary.
+            self.failIf(hasattr(tag, '__dict__'))
+            s = pickle.dumps(tag, pickle.HIGHEST_PROTOCOL)
+            t = pickle.loads(s)
+            self.assert_(isinstance(t, tag.__class__))
+            self.assertEqual(t.key, tag.key)
+            self.assertEqual(t.raw_value, tag.raw_value)
+            self.assertEqual(t.value, tag.value)
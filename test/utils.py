@@ -28,7 +28,8 @@ import unittest
 
 from pyexiv2.utils import undefined_to_string, string_to_undefined, \
                           Rational, Fraction, \
-                          is_fraction, make_fraction, fraction_to_string
+                          is_fraction, make_fraction, fraction_to_string, \
+                          FixedOffset
 
 
 class TestConversions(unittest.TestCase):
@@ -98,3 +99,18 @@ class TestFractions(unittest.TestCase):
         self.assertRaises(TypeError, fraction_to_string, None)
         self.assertRaises(TypeError, fraction_to_string, 'invalid')
 
+
+class TestFixedOffset(unittest.TestCase):
+
+    def test_equality(self):
+        self.assertEqual(FixedOffset('+', 5, 30), FixedOffset('+', 5, 30))
+        self.assertEqual(FixedOffset('+', 0, 0), FixedOffset('-', 0, 0))
+        self.assertNotEqual(FixedOffset('+', 5, 30), FixedOffset('-', 5, 30))
+        self.assertNotEqual(FixedOffset('+', 5, 30), FixedOffset('+', 5, 0))
+        self.failIf(FixedOffset() == None)
+        self.assert_(FixedOffset() != 'Z')
+
+    def test_hash(self):
+        offsets = set([FixedOffset('+', 2, 0), FixedOffset('+', 2, 0),
+                       FixedOffset('+', 0, 0), FixedOffset('-', 0, 0)])
+        self.assertEqual(len(offsets), 2)